@@ -0,0 +1,37 @@
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, Query, Request
+
+from .services.container import ServiceContainer
+from .services.preference_store import DEFAULT_USER_ID
+
+
+def get_container(request: Request) -> ServiceContainer:
+    """Returns the worker's service container, or 503 while it is not ready"""
+    container = getattr(request.app.state, "container", None)
+    if container is None or not container.ready:
+        raise HTTPException(status_code=503, detail="Service is not ready")
+    return container
+
+
+def get_vector_store_service(container: ServiceContainer = Depends(get_container)):
+    return container.vector_store_service
+
+
+def get_user_id(
+    x_user_id: Optional[str] = Header(None),
+    user_id: Optional[str] = Query(None),
+) -> str:
+    """User/session ID from the X-User-Id header or the user_id query parameter"""
+    return (x_user_id or user_id or DEFAULT_USER_ID).strip()[:128] or DEFAULT_USER_ID
+
+
+def get_preference_store(container: ServiceContainer = Depends(get_container)):
+    return container.preference_store
+
+
+def get_rag_service(
+    container: ServiceContainer = Depends(get_container),
+    user_id: str = Depends(get_user_id),
+):
+    return container.create_rag_service(user_id=user_id)
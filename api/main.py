@@ -1,15 +1,141 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
-from decouple import config
+from decouple import Csv, config
 
-from .routers import chat, user_preferences  # Remova cocktails daqui
-from .services.vector_store_service import VectorStoreService
+from .dependencies import get_preference_store, get_user_id
+from .routers import chat, cocktails, user_preferences
+from .services.concurrency import ServiceBusyError, UpstreamUnavailableError
+from .services.container import DEFAULT_WARMUP_QUERIES, ServiceContainer
+from .services.telemetry import ServerTimingMiddleware, Telemetry, setup_tracing
+
+logger = logging.getLogger(__name__)
 
 # Configure environment variables
 os.environ['OPENAI_API_KEY'] = config('OPENAI_API_KEY')
 
-app = FastAPI(title="Cocktail Advisor API")
+# Per-stage metrics and the Server-Timing header; spans are exported only when an OTLP endpoint is set
+TELEMETRY_ENABLED = config('TELEMETRY_ENABLED', default=True, cast=bool)
+OTLP_ENDPOINT = config('OTEL_EXPORTER_OTLP_ENDPOINT', default='')
+
+# Warmup before /readyz passes; answer priming spends one LLM call per query
+WARMUP_ENABLED = config('WARMUP_ENABLED', default=True, cast=bool)
+WARMUP_QUERIES = config('WARMUP_QUERIES', default=';'.join(DEFAULT_WARMUP_QUERIES), cast=Csv(delimiter=';'))
+WARMUP_PRIME_ANSWERS = config('WARMUP_PRIME_ANSWERS', default=False, cast=bool)
+
+# "snapshot" serves the collection read-only from the current snapshot version, without opening Chroma
+VECTOR_STORE_MODE = config('VECTOR_STORE_MODE', default='chroma')
+# Seconds between checks for a newly activated snapshot version (0 never swaps)
+SNAPSHOT_POLL_INTERVAL = config('SNAPSHOT_POLL_INTERVAL', default=5.0, cast=float)
+
+# Calls slower than LLM_LATENCY_BUDGET seconds to first token go to LLM_FALLBACK_MODEL (0 never falls back for latency)
+LLM_FALLBACK_MODEL = config('LLM_FALLBACK_MODEL', default='')
+LLM_LATENCY_BUDGET = config('LLM_LATENCY_BUDGET', default=0.0, cast=float)
+
+# Threads for blocking calls: the loop's default executor, shared by asyncio.to_thread and the services
+BLOCKING_IO_WORKERS = config('BLOCKING_IO_WORKERS', default=32, cast=int)
+
+def create_container(tracer, executor=None):
+    """Build and start the worker's services; blocking, and where the heavy imports happen"""
+    from .services.answer_cache import AnswerCache
+
+    container = ServiceContainer(
+        persist_directory=config('VECTOR_DB_DIR', default='db'),
+        vector_snapshot_max_docs=config('VECTOR_SNAPSHOT_MAX_DOCS', default=10000, cast=int),
+        vector_store_read_only=VECTOR_STORE_MODE == 'snapshot',
+        max_llm_concurrency=config('LLM_MAX_CONCURRENCY', default=16, cast=int),
+        llm_queue_timeout=config('LLM_QUEUE_TIMEOUT', default=10.0, cast=float),
+        llm_timeout=config('LLM_TIMEOUT', default=30.0, cast=float),
+        llm_max_retries=config('LLM_MAX_RETRIES', default=2, cast=int),
+        llm_fallback_model=LLM_FALLBACK_MODEL or None,
+        llm_latency_budget=LLM_LATENCY_BUDGET or None,
+        llm_breaker_reset=config('LLM_BREAKER_RESET', default=30.0, cast=float),
+        blocking_io_workers=BLOCKING_IO_WORKERS,
+        embedding_cache_path=config('EMBEDDING_CACHE_PATH', default='.cache/embeddings.sqlite'),
+        catalog_path=config('CATALOG_PATH', default='data/cocktails.csv'),
+        answer_cache=AnswerCache(
+            max_bytes=config('ANSWER_CACHE_MAX_BYTES', default=16 * 1024 * 1024, cast=int),
+            ttl_seconds=config('ANSWER_CACHE_TTL', default=3600, cast=float),
+            semantic_threshold=config('ANSWER_CACHE_SEMANTIC_THRESHOLD', default=0.95, cast=float),
+        ),
+        preference_db_path=config('PREFERENCE_DB_PATH', default='state/preferences.sqlite'),
+        session_db_path=config('SESSION_DB_PATH', default='state/sessions.sqlite'),
+        max_history_tokens=config('SESSION_HISTORY_TOKENS', default=1000, cast=int),
+        telemetry=Telemetry(enabled=TELEMETRY_ENABLED, tracer=tracer),
+        executor=executor,
+    )
+    container.startup()
+    return container
+
+async def start_services(app: FastAPI):
+    """Start and warm the services while the server already answers /healthz"""
+    # The bounded pool becomes the loop's default before anything is offloaded, so
+    # asyncio.to_thread and library code using run_in_executor(None, ...) share it
+    # and no other default pool is ever created
+    executor = ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="blocking-io")
+    asyncio.get_running_loop().set_default_executor(executor)
+    creating = asyncio.ensure_future(asyncio.to_thread(create_container, app.state.tracer, executor))
+    try:
+        container = await asyncio.shield(creating)
+    except asyncio.CancelledError:
+        # Shut down mid-startup: the thread cannot be interrupted, so wait for it and release what it built
+        result, = await asyncio.gather(creating, return_exceptions=True)
+        if isinstance(result, ServiceContainer):
+            result.shutdown()
+        raise
+    except Exception as error:
+        # The worker stays up but unhealthy, so the orchestrator restarts it
+        logger.exception("Service startup failed")
+        app.state.startup_error = error
+        return
+    app.state.container = container
+    # Polls until shutdown cancels it
+    if SNAPSHOT_POLL_INTERVAL > 0:
+        app.state.snapshot_watcher = asyncio.create_task(container.awatch_snapshot(SNAPSHOT_POLL_INTERVAL))
+
+    if not WARMUP_ENABLED:
+        container.warm = True
+    else:
+        try:
+            timings = await container.awarmup(
+                WARMUP_QUERIES,
+                retrievals=(chat.CHAT_RETRIEVAL, chat.RECOMMEND_RETRIEVAL),
+                prime_answers=WARMUP_PRIME_ANSWERS,
+            )
+            logger.info("Warmup done: %s", ", ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items()))
+        except Exception:
+            # A cold worker still serves; report ready rather than hold traffic back
+            logger.exception("Warmup failed, serving cold")
+            container.warm = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One warm set of services per worker, shared by every request. The
+    # server starts listening right away; requests get 503 until the
+    # services are up and /readyz turns 200 once they are warm.
+    app.state.container = None
+    app.state.startup_error = None
+    app.state.snapshot_watcher = None
+    startup = asyncio.create_task(start_services(app))
+    try:
+        yield
+    finally:
+        # Stops startup wherever it is (a startup thread is waited for and its services
+        # released), the warmup and the snapshot polling
+        tasks = [task for task in (startup, app.state.snapshot_watcher) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if app.state.container is not None:
+            app.state.container.shutdown()
+
+app = FastAPI(title="Cocktail Advisor API", lifespan=lifespan)
+app.state.tracer = setup_tracing(app, endpoint=OTLP_ENDPOINT) if TELEMETRY_ENABLED and OTLP_ENDPOINT else None
 
 # Configure CORS to allow requests from Streamlit
 app.add_middleware(
@@ -18,23 +144,75 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the Streamlit frontend and browser dev tools read per-stage timings
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(ServerTimingMiddleware)
+
+@app.exception_handler(ServiceBusyError)
+async def service_busy_handler(request: Request, exc: ServiceBusyError):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(UpstreamUnavailableError)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailableError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 # Include routers
 app.include_router(chat.router, prefix="/api", tags=["chat"])
-# Remova esta linha:
-# app.include_router(cocktails.router, prefix="/api", tags=["cocktails"])
+app.include_router(cocktails.router, prefix="/api", tags=["cocktails"])
 app.include_router(user_preferences.router, prefix="/api", tags=["preferences"])
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to Cocktail Advisor API"}
 
+@app.get("/healthz")
+def healthz(request: Request):
+    """Liveness: the worker is up and its services have not failed to start"""
+    error = getattr(request.app.state, "startup_error", None)
+    if error is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "detail": str(error)})
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz(request: Request):
+    """Readiness: services started and warmed up, so requests get warm latency"""
+    container = getattr(request.app.state, "container", None)
+    if container is None or not container.ready:
+        status = "failed" if getattr(request.app.state, "startup_error", None) is not None else "starting"
+        return JSONResponse(status_code=503, content={"status": status})
+    if not container.warm:
+        return JSONResponse(status_code=503, content={"status": "warming"})
+    vector_store = container.vector_store_service
+    if vector_store.read_only and vector_store.snapshot is None:
+        return JSONResponse(status_code=503, content={"status": "no_snapshot"})
+    return {
+        "status": "ready",
+        "snapshot_version": vector_store.snapshot.version if vector_store.snapshot is not None else None,
+        "warmup_seconds": {step: round(seconds, 3) for step, seconds in container.warmup_timings.items()},
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    """Prometheus metrics: per-stage latency histograms, LLM tokens and cache hit rates"""
+    container = getattr(request.app.state, "container", None)
+    if container is None:
+        return PlainTextResponse("service is starting\n", status_code=503)
+    if not container.telemetry.enabled:
+        return PlainTextResponse("metrics are disabled\n", status_code=404)
+    return PlainTextResponse(container.telemetry.render(), media_type="text/plain; version=0.0.4")
+
 # Test endpoint for preferences
 @app.get("/test-preferences")
-async def test_preferences():
-    vector_store_service = VectorStoreService()
+def test_preferences(user_id=Depends(get_user_id), preference_store=Depends(get_preference_store)):
     # Store test preferences (vodka and lemon)
-    success = vector_store_service.store_user_preference("ingredients", ["vodka", "lemon"])
-    prefs = vector_store_service.get_user_preferences("ingredients")
-    return {"success": success, "preferences": prefs}
\ No newline at end of file
+    prefs = preference_store.add(user_id, "ingredients", ["vodka", "lemon"])
+    return {"success": True, "preferences": prefs}
\ No newline at end of file
@@ -1,56 +1,205 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
+import json
 
-from ..services.rag_service import RAGService
-from ..services.llm_service import LLMService
-from ..services.vector_store_service import VectorStoreService
+from decouple import Csv, config
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Literal, Optional
+
+from ..dependencies import get_container, get_preference_store, get_rag_service, get_user_id
+from ..services.preference_store import PreferenceStore
+from ..services.retrieval_config import RetrievalConfig
 
 router = APIRouter()
 
+# Per-endpoint retrieval defaults, overridable per request
+CHAT_RETRIEVAL = RetrievalConfig(mode="hybrid", k=4, vector_weight=1.0, lexical_weight=1.0)
+RECOMMEND_RETRIEVAL = RetrievalConfig(mode="hybrid", k=5, vector_weight=1.0, lexical_weight=0.5)
+
+# Chat models a request may pick; each one keeps pooled clients and a circuit breaker per worker
+ALLOWED_MODELS = config('LLM_MODELS', default='gpt-3.5-turbo,gpt-4o-mini,gpt-4o', cast=Csv())
+
+class RetrievalOptions(BaseModel):
+    mode: Optional[Literal["vector", "lexical", "hybrid"]] = None
+    k: Optional[int] = None
+    vector_weight: Optional[float] = None
+    lexical_weight: Optional[float] = None
+
+def resolve_retrieval(options, defaults):
+    """Overlay the options set on a request onto the endpoint defaults"""
+    if options is None:
+        return defaults
+    overrides = options.model_dump(exclude_none=True)
+    if "k" in overrides:
+        overrides["k"] = max(1, min(overrides["k"], 50))
+    return defaults._replace(**overrides)
+
+class FacetFilters(BaseModel):
+    # Values of one facet are alternatives; all facets given must match
+    alcoholic: Optional[List[str]] = None
+    category: Optional[List[str]] = None
+    glassType: Optional[List[str]] = None
+
+def facet_kwargs(request):
+    return {
+        "facets": request.facets.model_dump(exclude_none=True) if request.facets else None,
+        "facets_from_query": request.facets_from_query,
+    }
+
 class Message(BaseModel):
     role: str
     content: str
 
 class ChatRequest(BaseModel):
     query: str
+    # Either a server-side session ID, or the full history resent by the client
+    session_id: Optional[str] = Field(None, max_length=128)
     chat_history: Optional[List[Message]] = None
-    model: Optional[str] = "gpt-3.5-turbo"
+    model: str = "gpt-3.5-turbo"
+    retrieval: Optional[RetrievalOptions] = None
+    use_cache: Optional[bool] = True
+    facets: Optional[FacetFilters] = None
+    facets_from_query: Optional[bool] = True  # also filter on facets the query names, e.g. "non-alcoholic"
+
+    @field_validator("model")
+    @classmethod
+    def known_model(cls, model):
+        if model not in ALLOWED_MODELS:
+            raise ValueError(f"model must be one of {', '.join(ALLOWED_MODELS)}")
+        return model
 
 class ChatResponse(BaseModel):
     answer: str
+    session_id: Optional[str] = None
+    history_tokens: Optional[int] = None  # history tokens that went into the prompt
+    tokens_saved: Optional[int] = None  # vs. resending the whole conversation
+    facets: Optional[dict] = None  # the facet filter applied to retrieval
+
+async def load_history(request, rag_service):
+    """(chat history for this turn, session token accounting or None)"""
+    if request.session_id:
+        history = await rag_service.asession_history(request.session_id)
+        return history.messages, {
+            "session_id": request.session_id,
+            "history_tokens": history.prompt_tokens,
+            "tokens_saved": max(0, history.full_tokens - history.prompt_tokens),
+        }
+    return request.chat_history or [], None
+
+MAX_RECOMMEND_COUNT = 50
+MAX_RECOMMEND_BATCH = 500
 
 class RecommendationRequest(BaseModel):
     criteria: str
-    count: Optional[int] = 5
+    count: Optional[int] = Field(5, ge=1, le=MAX_RECOMMEND_COUNT)
+    retrieval: Optional[RetrievalOptions] = None
+    exclude: Optional[List[str]] = None  # cocktail names already shown to the user
+    exclude_seen: Optional[bool] = False  # also skip cocktails recommended to this user before
+    diversity: Optional[float] = Field(0.5, ge=0.0, le=1.0)  # 0 ranks purely by relevance
+    facets: Optional[FacetFilters] = None
+    facets_from_query: Optional[bool] = True
+
+class BatchRecommendationRequest(BaseModel):
+    requests: List[RecommendationRequest] = Field(..., max_length=MAX_RECOMMEND_BATCH)
 
-def get_rag_service():
-    llm_service = LLMService()
-    vector_store_service = VectorStoreService()
-    return RAGService(llm_service, vector_store_service)
+def recommendation_kwargs(request):
+    return {
+        "criteria": request.criteria,
+        "count": request.count,
+        "retrieval": resolve_retrieval(request.retrieval, RECOMMEND_RETRIEVAL),
+        "exclude": request.exclude or (),
+        "exclude_seen": request.exclude_seen,
+        "diversity": request.diversity,
+        **facet_kwargs(request),
+    }
 
-def get_vector_store_service():
-    return VectorStoreService()
+def record_seen(rag_service, results):
+    """Remember recommended cocktails so exclude_seen can skip them later"""
+    rag_service.record_seen([rec["name"] for result in results for rec in result.get("recommendations", [])])
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, rag_service: RAGService = Depends(get_rag_service)):
+async def chat(
+    request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    rag_service=Depends(get_rag_service)
+):
     # Configure model if specified
     rag_service.llm_service.set_model(request.model)
 
     # Process chat history
-    chat_history = request.chat_history if request.chat_history else []
+    chat_history, session = await load_history(request, rag_service)
 
     # Get response
-    response = rag_service.ask_question(request.query, chat_history)
+    response = await rag_service.aask_question(
+        request.query,
+        chat_history,
+        retrieval=resolve_retrieval(request.retrieval, CHAT_RETRIEVAL),
+        use_cache=request.use_cache,
+        **facet_kwargs(request),
+    )
+    answer = response.get("answer", "No answer found")
+
+    # Preference detection and session bookkeeping run after the response is sent
+    background_tasks.add_task(rag_service.detect_user_preferences, request.query)
+    if session:
+        background_tasks.add_task(rag_service.arecord_turn, request.session_id, request.query, answer)
+
+    return {"answer": answer, "facets": response.get("facets"), **(session or {})}
+
+@router.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    rag_service=Depends(get_rag_service)
+):
+    """Streams the answer as NDJSON events: context, token..., done, then session for session chats"""
+    rag_service.llm_service.set_model(request.model)
+    chat_history, session = await load_history(request, rag_service)
 
-    return {"answer": response.get("answer", "No answer found")}
+    events = rag_service.astream_question(
+        request.query,
+        chat_history,
+        retrieval=resolve_retrieval(request.retrieval, CHAT_RETRIEVAL),
+        use_cache=request.use_cache,
+        **facet_kwargs(request),
+    )
+
+    # Pull the first event before responding so a busy LLM pool still maps to 429
+    first_event = await events.__anext__()
+
+    answer_chunks = []
+
+    def encode(event):
+        if event["type"] == "token":
+            answer_chunks.append(event["content"])
+        return json.dumps(event) + "\n"
+
+    async def ndjson():
+        yield encode(first_event)
+        async for event in events:
+            yield encode(event)
+        if session:
+            yield json.dumps({"type": "session", **session}) + "\n"
+
+    async def record_turn():
+        await rag_service.arecord_turn(request.session_id, request.query, "".join(answer_chunks))
+
+    # Runs once the stream has finished
+    background_tasks.add_task(rag_service.detect_user_preferences, request.query)
+    if session:
+        background_tasks.add_task(record_turn)
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson", background=background_tasks)
 
 @router.get("/preferences")
-async def get_preferences(vector_store_service: VectorStoreService = Depends(get_vector_store_service)):
+def get_preferences(
+    user_id: str = Depends(get_user_id),
+    preference_store: PreferenceStore = Depends(get_preference_store)
+):
     """Returns the user's saved preferences"""
     try:
         # Fetch ingredient preferences
-        preferences = vector_store_service.get_user_preferences("ingredients")
+        preferences = preference_store.get(user_id, "ingredients")
         return {"preferences": preferences}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching preferences: {str(e)}")
@@ -58,11 +207,73 @@ async def get_preferences(vector_store_service: VectorStoreService = Depends(get
 @router.post("/recommend", response_model=dict)
 async def recommend_cocktails(
     request: RecommendationRequest,
-    rag_service: RAGService = Depends(get_rag_service)
+    background_tasks: BackgroundTasks,
+    rag_service=Depends(get_rag_service)
 ):
     """Recommends cocktails based on criteria or saved preferences"""
     try:
-        recommendations = rag_service.recommend_cocktails(request.criteria, request.count)
+        recommendations = await rag_service.arecommend_cocktails(**recommendation_kwargs(request))
+        background_tasks.add_task(record_seen, rag_service, [recommendations])
         return recommendations
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error recommending cocktails: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error recommending cocktails: {str(e)}")
+
+@router.post("/recommend/batch", response_model=dict)
+async def recommend_batch(
+    request: BatchRecommendationRequest,
+    background_tasks: BackgroundTasks,
+    rag_service=Depends(get_rag_service)
+):
+    """Answers many recommendation requests with one batched embedding call"""
+    try:
+        results = await rag_service.arecommend_batch(
+            [recommendation_kwargs(item) for item in request.requests]
+        )
+        background_tasks.add_task(record_seen, rag_service, results)
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error recommending cocktails: {str(e)}")
+
+@router.get("/facets", response_model=dict)
+def facet_counts(
+    alcoholic: Optional[List[str]] = Query(None),
+    category: Optional[List[str]] = Query(None),
+    glassType: Optional[List[str]] = Query(None),
+    container=Depends(get_container)
+):
+    """Cocktail counts per facet value under the given filter, for building filter menus"""
+    facet_index = container.facet_index
+    if facet_index is None:
+        raise HTTPException(status_code=503, detail="No cocktail data available.")
+    filters = facet_index.resolve({"alcoholic": alcoholic, "category": category, "glassType": glassType})
+    return {
+        "total": facet_index.bits(filters).bit_count(),
+        "selected": dict(filters),
+        "facets": facet_index.counts(filters),
+    }
+
+@router.get("/debug/sessions", response_model=dict)
+def debug_sessions(container=Depends(get_container)):
+    """History tokens sent to the LLM and saved by server-side sessions in this worker"""
+    return container.session_store.stats()
+
+@router.get("/debug/cache", response_model=dict)
+def debug_cache(container=Depends(get_container)):
+    """Hit rates and sizes of the answer, embedding and compiled-chain caches"""
+    return {
+        "answers": container.answer_cache.stats() if container.answer_cache else None,
+        "embeddings": container.embedding_function.stats(),
+        "chains": {
+            "hits": container.chain_cache.hits,
+            "misses": container.chain_cache.misses,
+            "entries": len(container.chain_cache),
+        },
+    }
+
+@router.get("/debug/llm", response_model=dict)
+def debug_llm(container=Depends(get_container)):
+    """Circuit breakers, retries and fallbacks per model, and questions answered by a shared call"""
+    return {
+        "models": container.llm_pool.stats(),
+        "coalescing": container.single_flight.stats(),
+    }
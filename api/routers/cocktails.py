@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
+
+from ..dependencies import get_rag_service
+
+router = APIRouter()
+
+MAX_SIMILAR_COUNT = 20
+
+@router.get("/cocktails/{name}/similar", response_model=dict)
+def similar_cocktails(
+    name: str,
+    count: int = Query(10, ge=1, le=MAX_SIMILAR_COUNT),
+    alcoholic: Optional[List[str]] = Query(None),
+    category: Optional[List[str]] = Query(None),
+    glassType: Optional[List[str]] = Query(None),
+    rag_service=Depends(get_rag_service)
+):
+    """Cocktails most like the named one, read from the precomputed similarity graph"""
+    if rag_service.vector_store_service.similarity_graph is None:
+        raise HTTPException(status_code=503, detail="Similarity graph not built; run utils.initialize_db")
+    result = rag_service.similar_cocktails(
+        name, count, facets={"alcoholic": alcoholic, "category": category, "glassType": glassType}
+    )
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Unknown cocktail: {name}")
+    return result
@@ -2,7 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 
-from ..services.vector_store_service import VectorStoreService
+from ..dependencies import get_preference_store, get_user_id
+from ..services.preference_store import PreferenceStore
 
 router = APIRouter()
 
@@ -14,18 +15,14 @@ class PreferenceResponse(BaseModel):
     status: str
     stored_preferences: List[str]
 
-def get_vector_store():
-    return VectorStoreService()
-
 @router.post("/preferences", response_model=PreferenceResponse)
-async def store_preferences(
+def store_preferences(
     request: PreferenceRequest,
-    vector_store_service: VectorStoreService = Depends(get_vector_store)
+    user_id: str = Depends(get_user_id),
+    preference_store: PreferenceStore = Depends(get_preference_store)
 ):
-    vector_store_service.store_user_preference(request.preference_type, request.content)
-
-    # Retrieve stored preferences to confirm
-    stored = vector_store_service.get_user_preferences(request.preference_type)
+    # The merged list is returned by the atomic write, no second read needed
+    stored = preference_store.add(user_id, request.preference_type, request.content)
 
     return {
         "status": "success",
@@ -33,19 +30,21 @@ async def store_preferences(
     }
 
 @router.get("/preferences/{preference_type}", response_model=List[str])
-async def get_preferences(
+def get_preferences(
     preference_type: str,
-    vector_store_service: VectorStoreService = Depends(get_vector_store)
+    user_id: str = Depends(get_user_id),
+    preference_store: PreferenceStore = Depends(get_preference_store)
 ):
-    preferences = vector_store_service.get_user_preferences(preference_type)
+    preferences = preference_store.get(user_id, preference_type)
     return preferences
 
 @router.get("/debug/preferences", response_model=dict)
-async def debug_preferences(
-    vector_store_service: VectorStoreService = Depends(get_vector_store)
+def debug_preferences(
+    user_id: str = Depends(get_user_id),
+    preference_store: PreferenceStore = Depends(get_preference_store)
 ):
     all_preferences = {
-        "ingredients": vector_store_service.get_user_preferences("ingredients"),
-        "cocktails": vector_store_service.get_user_preferences("cocktails")
+        "ingredients": preference_store.get(user_id, "ingredients"),
+        "cocktails": preference_store.get(user_id, "cocktails")
     }
-    return all_preferences
\ No newline at end of file
+    return all_preferences
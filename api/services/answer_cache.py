@@ -0,0 +1,155 @@
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .hybrid_retriever import document_key
+
+PUNCTUATION = re.compile(r"[^\w\s']")
+
+
+def normalize_query(query):
+    """Case- and punctuation-insensitive form of a question"""
+    return " ".join(PUNCTUATION.sub(" ", query.casefold()).split())
+
+
+class _Entry:
+    __slots__ = ("answer", "expires_at", "size", "bucket", "embedding")
+
+    def __init__(self, answer, expires_at, size, bucket, embedding):
+        self.answer = answer
+        self.expires_at = expires_at
+        self.size = size
+        self.bucket = bucket
+        self.embedding = embedding
+
+
+class AnswerCache:
+    """TTL + LRU cache of chat answers bounded by total size in bytes
+
+    Exact entries are keyed by (normalized query, model, retrieved document
+    IDs), so the same question over the same context reuses one completion.
+    The optional semantic tier reuses an answer for a differently worded
+    question when its embedding is within `semantic_threshold` cosine
+    similarity of a cached one, but only among entries generated by the same
+    model from the same documents. Turns with chat history must not be cached:
+    their answer depends on more than this key.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl_seconds=3600, semantic_threshold=None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @property
+    def semantic_enabled(self):
+        return bool(self.semantic_threshold)
+
+    def make_key(self, query, model_name, documents):
+        doc_ids = tuple(sorted(document_key(doc) for doc in documents))
+        return (normalize_query(query), model_name, doc_ids)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        bucket = self._buckets.get(entry.bucket)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[entry.bucket]
+
+    def _find_similar(self, key, embedding, now):
+        bucket = self._buckets.get(key[1:])
+        if not bucket or embedding is None:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        best_key, best_score = None, self.semantic_threshold
+        for candidate in bucket:
+            entry = self._entries[candidate]
+            if entry.embedding is None or entry.expires_at < now:
+                continue
+            score = float(entry.embedding @ query)
+            if score >= best_score:
+                best_key, best_score = candidate, score
+        return best_key
+
+    def get(self, key, embedding=None):
+        """Cached answer for the key (or a semantically close query), else None"""
+        now = time.monotonic()
+        with self._lock:
+            hit = key if key in self._entries else None
+            if hit is not None and self._entries[hit].expires_at < now:
+                self._remove(hit)
+                hit = None
+
+            if hit is not None:
+                self.exact_hits += 1
+            elif self.semantic_enabled:
+                hit = self._find_similar(key, embedding, now)
+                if hit is not None:
+                    self.semantic_hits += 1
+
+            if hit is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(hit)
+            return self._entries[hit].answer
+
+    def put(self, key, answer, embedding=None):
+        vector = None
+        if self.semantic_enabled and embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+
+        size = (
+            sys.getsizeof(answer)
+            + sum(sys.getsizeof(part) for part in key[:2])
+            + sum(sys.getsizeof(doc_id) for doc_id in key[2])
+            + (vector.nbytes if vector is not None else 0)
+        )
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(answer, time.monotonic() + self.ttl_seconds, size, key[1:], vector)
+            self._buckets.setdefault(key[1:], set()).add(key)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+        }
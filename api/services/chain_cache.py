@@ -0,0 +1,49 @@
+import threading
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+
+class CompiledChain(NamedTuple):
+    """A retriever and the answer chain fed by it, compiled once and reused"""
+    retriever: Any
+    qa_chain: Any
+
+
+class ChainCache:
+    """Bounded LRU cache of compiled chains keyed by (model, retriever config)
+
+    Entries hold a reference to the retriever of the vector store they were
+    built from, so the cache must be cleared whenever the store is reloaded.
+    """
+
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self._chains = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_create(self, key, factory):
+        with self._lock:
+            chain = self._chains.get(key)
+            if chain is not None:
+                self._chains.move_to_end(key)
+                self.hits += 1
+                return chain
+            self.misses += 1
+
+        # Compile outside the lock; a concurrent duplicate build is harmless
+        chain = factory()
+        with self._lock:
+            self._chains[key] = chain
+            self._chains.move_to_end(key)
+            while len(self._chains) > self.max_size:
+                self._chains.popitem(last=False)
+        return chain
+
+    def clear(self):
+        with self._lock:
+            self._chains.clear()
+
+    def __len__(self):
+        return len(self._chains)
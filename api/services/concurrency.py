@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from .telemetry import DISABLED
+
+
+class ServiceBusyError(Exception):
+    """Raised when a call could not get a concurrency slot in time"""
+
+    def __init__(self, retry_after=1):
+        super().__init__("Too many concurrent requests, please retry later")
+        self.retry_after = retry_after
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised when an upstream's circuit breaker is open and there is nothing to fall back to"""
+
+    def __init__(self, retry_after=1):
+        super().__init__("The language model is unavailable, please retry later")
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """Caps concurrent upstream calls and queues the excess for a bounded time
+
+    Callers wait up to `queue_timeout` seconds for a free slot; after that a
+    ServiceBusyError is raised so the API can answer 429 instead of piling up
+    work. A `queue_timeout` of 0 rejects immediately when all slots are busy.
+    """
+
+    def __init__(self, max_concurrency, queue_timeout=10.0, telemetry=None):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.telemetry = telemetry or DISABLED
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.rejected = 0
+
+    @property
+    def in_flight(self):
+        return self.max_concurrency - self._semaphore._value
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.queue_timeout <= 0 and self._semaphore.locked():
+            self.rejected += 1
+            raise ServiceBusyError()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ServiceBusyError(retry_after=max(1, int(self.queue_timeout)))
+        if self.telemetry.enabled:
+            self.telemetry.observe("llm_queue", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing, and probes it again after a cooldown
+
+    Keeps the outcomes of the last `window` calls. Once at least
+    `min_calls` are recorded and `failure_ratio` of them failed, the
+    breaker opens and allow() answers False for `reset_timeout` seconds.
+    Then a single trial call is let through (half-open): its success closes
+    the breaker, its failure opens it again. Thread-safe, since sync chains
+    call the model from executor threads.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window=20, min_calls=5, failure_ratio=0.5, reset_timeout=30.0):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.opened = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go to the upstream now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_started = None
+            # A trial that never reported back (e.g. cancelled) is replaced after a cooldown
+            if self.state == self.HALF_OPEN and (
+                self._trial_started is None or now - self._trial_started >= self.reset_timeout
+            ):
+                self._trial_started = now
+                return True
+            return False
+
+    def record(self, success):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if success:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            if self.state == self.OPEN:
+                return
+            self._outcomes.append(success)
+            failures = len(self._outcomes) - sum(self._outcomes)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_ratio * len(self._outcomes):
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened += 1
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    @property
+    def retry_after(self):
+        """Whole seconds until the next trial call"""
+        return max(1, int(self.reset_timeout - (time.monotonic() - self._opened_at) + 0.999))
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving while it runs await the same result
+
+    The call runs as a task of its own, so a caller going away (e.g. a
+    disconnected client) does not cancel it for the others. Its exception,
+    if any, is raised to every caller. Meant for one event loop.
+    """
+
+    def __init__(self, telemetry=None):
+        self.telemetry = telemetry or DISABLED
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def run(self, key, factory):
+        """Result of factory() (a coroutine function), shared with concurrent callers of the same key"""
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.shared += 1
+            self.telemetry.count("requests_coalesced_total")
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Marks the exception retrieved when every caller has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
@@ -0,0 +1,342 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import os
+
+from .chain_cache import ChainCache
+from .concurrency import ConcurrencyLimiter, SingleFlight
+from .preference_store import DEFAULT_USER_ID, PreferenceStore
+from .telemetry import DISABLED
+
+logger = logging.getLogger(__name__)
+
+# Typical opening questions, embedded and searched before the worker reports ready
+DEFAULT_WARMUP_QUERIES = (
+    "What cocktails can I make with gin?",
+    "Suggest a refreshing summer cocktail",
+    "How do I make a Margarita?",
+    "Recommend something sweet with rum",
+    "What are some non-alcoholic drinks?",
+)
+
+
+class ServiceContainer:
+    """Process-wide services shared by every request handled by this worker
+
+    The container is created once per uvicorn worker by the FastAPI lifespan
+    and keeps the embedding client, the Chroma handle and the chat-model
+    clients warm, so request handlers only build thin per-request wrappers.
+    Blocking calls (Chroma, sync embedding clients) are offloaded to a bounded
+    executor and concurrent LLM calls are capped by a shared limiter.
+
+    Creating a container is cheap: langchain, Chroma and pandas are imported
+    by startup(), which the API runs after it has begun answering health
+    probes, and awarmup() then loads what would otherwise load on the first
+    request.
+    """
+
+    def __init__(self, persist_directory='db', default_model="gpt-3.5-turbo",
+                 embedding_function=None, llm_client_factory=None,
+                 max_llm_concurrency=16, llm_queue_timeout=10.0, blocking_io_workers=32,
+                 chain_cache_size=32, embedding_cache_path=None, catalog_path='data/cocktails.csv',
+                 answer_cache=None, preference_db_path='state/preferences.sqlite',
+                 session_db_path='state/sessions.sqlite', max_history_tokens=1000, telemetry=None,
+                 vector_snapshot_max_docs=0, vector_store_read_only=False, llm_timeout=30.0,
+                 llm_max_retries=2, llm_fallback_model=None, llm_latency_budget=None, llm_breaker_reset=30.0,
+                 executor=None):
+        self.persist_directory = persist_directory
+        self.vector_snapshot_max_docs = vector_snapshot_max_docs
+        self.vector_store_read_only = vector_store_read_only
+        self.default_model = default_model
+        self._embedding_function = embedding_function
+        self._llm_client_factory = llm_client_factory
+        self.max_llm_concurrency = max_llm_concurrency
+        self.llm_queue_timeout = llm_queue_timeout
+        self.llm_timeout = llm_timeout
+        self.llm_max_retries = llm_max_retries
+        self.llm_fallback_model = llm_fallback_model
+        self.llm_latency_budget = llm_latency_budget
+        self.llm_breaker_reset = llm_breaker_reset
+        self.blocking_io_workers = blocking_io_workers
+        # An executor passed in (e.g. already the loop's default) is used and shut down like our own
+        self._executor = executor
+        self.chain_cache = ChainCache(max_size=chain_cache_size)
+        self.answer_cache = answer_cache
+        self.preference_db_path = preference_db_path
+        self.session_db_path = session_db_path
+        self.max_history_tokens = max_history_tokens
+        self.embedding_cache_path = embedding_cache_path
+        self.catalog_path = catalog_path
+        self.telemetry = telemetry or DISABLED
+        # Identical questions in flight at the same time share one answer
+        self.single_flight = SingleFlight(telemetry=self.telemetry)
+
+        self.embedding_function = None
+        self.vector_store_service = None
+        self.llm_pool = None
+        self.llm_limiter = None
+        self.ingredient_index = None
+        self.lexical_index = None
+        self.facet_index = None
+        # Snapshot version the catalog indexes were built from, None for the CSV
+        self.catalog_version = None
+        self.preference_store = None
+        self.preference_extractor = None
+        self.session_store = None
+        self.executor = None
+        self.ready = False
+        self.warm = False
+        self.warmup_timings = {}
+
+    def startup(self):
+        """Create the shared clients and open the persisted vector store"""
+        from .embedding_cache import CachedEmbeddings
+        from .embedding_providers import create_embeddings_from_config
+        from .llm_service import LLMClientPool
+        from .session_store import SessionStore, TokenCounter
+        from .vector_store_service import VectorStoreService
+
+        self.executor = self._executor or ThreadPoolExecutor(
+            max_workers=self.blocking_io_workers, thread_name_prefix="blocking-io"
+        )
+        self.llm_limiter = ConcurrencyLimiter(
+            self.max_llm_concurrency, self.llm_queue_timeout, telemetry=self.telemetry
+        )
+        self.embedding_function = CachedEmbeddings(
+            self._embedding_function or create_embeddings_from_config(),
+            cache_path=self.embedding_cache_path,
+            telemetry=self.telemetry,
+        )
+        self.vector_store_service = VectorStoreService(
+            persist_directory=self.persist_directory,
+            embedding_function=self.embedding_function,
+            telemetry=self.telemetry,
+            snapshot_max_docs=self.vector_snapshot_max_docs,
+            read_only=self.vector_store_read_only,
+        )
+        # The catalog indexes follow a swapped snapshot version first; compiled
+        # chains hold the old retrievers and cached answers describe the old
+        # documents, so both are dropped after
+        self.vector_store_service.on_reload(self._refresh_catalog_indexes)
+        self.vector_store_service.on_reload(self.chain_cache.clear)
+        if self.answer_cache is not None:
+            self.vector_store_service.on_reload(self.answer_cache.clear)
+        self.preference_store = PreferenceStore(self.preference_db_path)
+        self.session_store = SessionStore(
+            self.session_db_path,
+            max_history_tokens=self.max_history_tokens,
+            token_counter=TokenCounter(self.default_model),
+        )
+        self.llm_pool = LLMClientPool(
+            client_factory=self._llm_client_factory,
+            timeout=self.llm_timeout,
+            max_retries=self.llm_max_retries,
+            fallback_model=self.llm_fallback_model,
+            latency_budget=self.llm_latency_budget,
+            breaker_reset=self.llm_breaker_reset,
+            # Every concurrency slot can hold a connection, plus the fallback's
+            max_connections=2 * self.max_llm_concurrency,
+            telemetry=self.telemetry,
+        )
+        self.llm_pool.get(self.default_model)
+        self._build_catalog_indexes()
+        if self.telemetry.enabled:
+            self.telemetry.add_collector(self._collect_metrics)
+        self.ready = True
+
+    def _build_catalog_indexes(self):
+        """In-memory ingredient, facet and BM25 indexes over the same documents as vector search
+
+        Built from the snapshot version being served when there is one, so
+        their positions and contents match its rows, else from the catalog
+        CSV. All three number the documents alike, so their bitsets combine
+        directly. Preferences are matched against every catalog ingredient.
+        """
+        from .facet_index import FacetIndex
+        from .ingredient_index import IngredientIndex
+        from .lexical_index import BM25Index
+        from .preference_extractor import DEFAULT_VOCABULARY, PreferenceExtractor
+
+        snapshot = self.vector_store_service.snapshot if self.vector_store_service else None
+        if snapshot is not None:
+            documents = [snapshot.document(row) for row in range(len(snapshot))]
+            ingredient_lists = [
+                [item for item in doc.metadata.get("ingredients", "").split(",") if item.strip()]
+                for doc in documents
+            ]
+        elif self.catalog_path and os.path.exists(self.catalog_path):
+            from utils.data_processor import CocktailDataProcessor
+
+            processor = CocktailDataProcessor()
+            # Workers only read; initialize_db writes the Parquet snapshot
+            df = processor.load_cocktails_data(self.catalog_path, write_snapshot=False)
+            documents = processor.convert_to_documents(df)
+            ingredient_lists = df['ingredients'].tolist()
+        else:
+            documents = None
+
+        if documents is not None:
+            # Built first and swapped in together, so requests never mix two versions
+            indexes = (
+                IngredientIndex(documents, ingredient_lists),
+                BM25Index(documents),
+                FacetIndex.from_documents(documents),
+            )
+            self.ingredient_index, self.lexical_index, self.facet_index = indexes
+        self.catalog_version = snapshot.version if snapshot is not None else None
+        self.preference_extractor = PreferenceExtractor(
+            self.ingredient_index.postings if self.ingredient_index else DEFAULT_VOCABULARY
+        )
+
+    def _refresh_catalog_indexes(self):
+        """Rebuild the catalog indexes when the store swapped to another snapshot version
+
+        Keeps the current ones while no snapshot is served, e.g. between a
+        write and the next export, or on shutdown.
+        """
+        snapshot = self.vector_store_service.snapshot
+        if self.ready and snapshot is not None and snapshot.version != self.catalog_version:
+            self._build_catalog_indexes()
+
+    async def awarmup(self, queries=DEFAULT_WARMUP_QUERIES, retrievals=(), prime_answers=False):
+        """Load everything the first requests would otherwise pay for, then mark the worker warm
+
+        Embeds the warmup queries in one batch (priming the embedding cache
+        and loading local models), compiles the chain for each retrieval
+        config and searches with it (loading the HNSW index from disk), and
+        with prime_answers also answers each query once through the LLM to
+        fill the answer cache. Returns seconds per step.
+        """
+        queries = list(queries)
+        rag_service = self.create_rag_service()
+        timings = {}
+
+        start = time.perf_counter()
+        if queries:
+            await self.embedding_function.aembed_documents(queries)
+        timings["embed"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        chains = [chain for chain in (rag_service._get_chain(retrieval) for retrieval in retrievals) if chain]
+        timings["compile_chains"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*(chain.retriever.ainvoke(query) for chain in chains for query in queries))
+        timings["search"] = time.perf_counter() - start
+
+        if prime_answers and self.answer_cache is not None and retrievals:
+            start = time.perf_counter()
+            for query in queries:
+                await rag_service.aask_question(query, retrieval=retrievals[0])
+            timings["answers"] = time.perf_counter() - start
+
+        self.warmup_timings = timings
+        self.warm = True
+        return timings
+
+    async def awatch_snapshot(self, interval):
+        """Poll for a newly activated vector snapshot every interval seconds and swap to it
+
+        Runs until cancelled. A swap clears the chain and answer caches
+        through the store's reload callbacks.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            service = self.vector_store_service
+            if service is None:
+                continue
+            try:
+                # Loading a version's manifest reads a file; keep it off the event loop
+                await asyncio.get_running_loop().run_in_executor(self.executor, service.refresh_snapshot)
+            except Exception:
+                # A half-deployed or bad version must not stop the polling; the old one keeps serving
+                logger.exception("Vector snapshot refresh failed")
+
+    def _collect_metrics(self):
+        """Cache, session, LLM limiter and circuit breaker figures for /metrics, read at scrape time"""
+        if not self.ready:
+            return []
+        cache_requests = []
+        hit_ratios = []
+        embeddings = self.embedding_function.stats()
+        cache_requests += [
+            ({"cache": "embedding", "result": "memory_hit"}, embeddings["memory_hits"]),
+            ({"cache": "embedding", "result": "disk_hit"}, embeddings["disk_hits"]),
+            ({"cache": "embedding", "result": "miss"}, embeddings["misses"]),
+        ]
+        hit_ratios.append(({"cache": "embedding"}, embeddings["hit_rate"]))
+        if self.answer_cache is not None:
+            answers = self.answer_cache.stats()
+            cache_requests += [
+                ({"cache": "answer", "result": "exact_hit"}, answers["exact_hits"]),
+                ({"cache": "answer", "result": "semantic_hit"}, answers["semantic_hits"]),
+                ({"cache": "answer", "result": "miss"}, answers["misses"]),
+                ({"cache": "answer", "result": "bypass"}, answers["bypassed"]),
+            ]
+            hit_ratios.append(({"cache": "answer"}, answers["hit_rate"]))
+        chain_lookups = self.chain_cache.hits + self.chain_cache.misses
+        cache_requests += [
+            ({"cache": "chain", "result": "hit"}, self.chain_cache.hits),
+            ({"cache": "chain", "result": "miss"}, self.chain_cache.misses),
+        ]
+        hit_ratios.append(({"cache": "chain"}, self.chain_cache.hits / chain_lookups if chain_lookups else 0.0))
+
+        sessions = self.session_store.stats()
+        return [
+            ("cache_requests_total", "counter", "Cache lookups by cache and result", cache_requests),
+            ("cache_hit_ratio", "gauge", "Share of lookups served from the cache", hit_ratios),
+            ("session_history_tokens_total", "counter", "History tokens sent to the LLM by sessions",
+             [({}, sessions["prompt_tokens"])]),
+            ("session_tokens_saved_total", "counter", "History tokens saved by sessions vs resending it all",
+             [({}, sessions["tokens_saved"])]),
+            ("llm_in_flight", "gauge", "LLM calls holding a concurrency slot", [({}, self.llm_limiter.in_flight)]),
+            ("llm_rejected_total", "counter", "LLM calls rejected with 429 after queueing",
+             [({}, self.llm_limiter.rejected)]),
+            ("llm_circuit_open", "gauge", "1 while a model's circuit breaker keeps calls away from it",
+             [({"model": model_name}, int(client["breaker"] != "closed"))
+              for model_name, client in self.llm_pool.stats().items()]),
+        ]
+
+    def shutdown(self):
+        """Mark the worker as not ready and release the shared clients"""
+        self.ready = False
+        self.warm = False
+        if self.llm_pool is not None:
+            self.llm_pool.close()
+        if self.vector_store_service is not None:
+            self.vector_store_service.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.embedding_function is not None:
+            self.embedding_function.close()
+        if self.preference_store is not None:
+            self.preference_store.close()
+        if self.session_store is not None:
+            self.session_store.close()
+
+    def create_llm_service(self, model_name=None):
+        from .llm_service import LLMService
+
+        return LLMService(model_name or self.default_model, client_pool=self.llm_pool, telemetry=self.telemetry)
+
+    def create_rag_service(self, model_name=None, user_id=DEFAULT_USER_ID):
+        from .rag_service import RAGService
+
+        return RAGService(
+            self.create_llm_service(model_name),
+            self.vector_store_service,
+            llm_limiter=self.llm_limiter,
+            chain_cache=self.chain_cache,
+            ingredient_index=self.ingredient_index,
+            lexical_index=self.lexical_index,
+            facet_index=self.facet_index,
+            answer_cache=self.answer_cache,
+            preference_store=self.preference_store,
+            user_id=user_id,
+            preference_extractor=self.preference_extractor,
+            session_store=self.session_store,
+            telemetry=self.telemetry,
+            single_flight=self.single_flight,
+        )
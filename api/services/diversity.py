@@ -0,0 +1,38 @@
+import numpy as np
+
+
+def cosine_similarity_matrix(vectors):
+    """Pairwise cosine similarity of the rows of a 2-D array"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+    return matrix @ matrix.T
+
+
+def mmr_select(relevance, similarity, count, lambda_mult=0.7, pinned=0):
+    """Indices of count items picked by maximal marginal relevance
+
+    Each step takes the item maximising
+    lambda * relevance - (1 - lambda) * (highest similarity to an item already picked),
+    so a near-duplicate of an earlier pick loses to a slightly less relevant
+    but different item. lambda_mult=1 keeps the relevance order unchanged.
+    The first `pinned` items are always picked.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    count = min(count, len(relevance))
+    if count == 0:
+        return []
+
+    selected = list(range(min(pinned, count))) or [int(np.argmax(relevance))]
+    redundancy = np.max(np.asarray(similarity, dtype=np.float32)[selected], axis=0)
+    available = np.ones(len(relevance), dtype=bool)
+    available[selected] = False
+
+    while len(selected) < count:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+from .telemetry import DISABLED
+
+
+def normalize_text(text):
+    """Normalize text so trivially different spellings share a cache entry"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def embedding_model_id(embeddings):
+    """Stable identifier of the model behind an embeddings object"""
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None)
+    if model is None and hasattr(embeddings, "size"):
+        model = f"size={embeddings.size}"
+    return f"{type(embeddings).__name__}:{model}"
+
+
+def as_float32(vector):
+    """The vector rounded to float32, as the disk tier stores it"""
+    return array("f", vector).tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed cache in front of an embeddings client
+
+    Vectors are keyed by (model, hash of the normalized text) and looked up in
+    an in-memory LRU tier first, then in an optional SQLite tier on disk, so a
+    repeated query or an unchanged catalog row never pays for the API twice.
+    Queries and documents share entries; the wrapped OpenAI models embed both
+    the same way. Vectors are rounded to float32 as soon as they arrive, so
+    a text embeds to the same values whether or not it was cached.
+    """
+
+    def __init__(self, embeddings, cache_path=None, memory_size=10000, model_id=None, telemetry=None):
+        self.embeddings = embeddings
+        self.telemetry = telemetry or DISABLED
+        self.model_id = model_id or embedding_model_id(embeddings)
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if cache_path:
+            directory = os.path.dirname(cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def _key(self, text):
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self.model_id}:{digest}"
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys):
+        """Return {key: vector} for every key found in memory or on disk"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            self.memory_hits += len(found)
+
+            missing = [key for key in keys if key not in found]
+            if self._db is not None and missing:
+                # Stay well below SQLite's bound-parameter limit
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = array("f", blob).tolist()
+                        found[key] = vector
+                        self._remember(key, vector)
+                        self.disk_hits += 1
+        return found
+
+    def _store(self, items):
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, vector)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, array("f", vector).tobytes()) for key, vector in items],
+                )
+                self._db.commit()
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(set(keys))
+
+        # Embed each distinct missing text once, in a single upstream call
+        pending = OrderedDict()
+        for key, text in zip(keys, texts):
+            if key not in found and key not in pending:
+                pending[key] = text
+        if pending:
+            with self._lock:
+                self.misses += len(pending)
+            with self.telemetry.stage("embed"):
+                vectors = self.embeddings.embed_documents(list(pending.values()))
+            new_items = [(key, as_float32(vector)) for key, vector in zip(pending.keys(), vectors)]
+            self._store(new_items)
+            found.update(new_items)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        key = self._key(text)
+        found = self._lookup([key])
+        if key in found:
+            return found[key]
+
+        with self._lock:
+            self.misses += 1
+        with self.telemetry.stage("embed"):
+            vector = as_float32(self.embeddings.embed_query(text))
+        self._store([(key, vector)])
+        return vector
+
+    async def aembed_documents(self, texts):
+        # to_thread runs in the same default executor but keeps the request's telemetry context
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text):
+        key = self._key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+        return await asyncio.to_thread(self.embed_query, text)
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+        # Local backends may hold an inference thread pool
+        close = getattr(self.embeddings, "close", None)
+        if callable(close):
+            close()
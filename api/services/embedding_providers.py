@@ -0,0 +1,134 @@
+import hashlib
+import math
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from decouple import config
+from langchain_core.embeddings import Embeddings
+
+WORD = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic feature-hashing embedding for tests and offline runs
+
+    Each word is hashed into one of `size` buckets and the counts are
+    L2-normalized, so texts that share words get similar vectors. No model,
+    no network and identical output on every machine.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.model = f"feature-hashing-{size}"
+
+    def _vector(self, text):
+        vector = [0.0] * self.size
+        for word in WORD.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            vector[int.from_bytes(digest, "little") % self.size] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+class OnnxEmbeddings(Embeddings):
+    """all-MiniLM-L6-v2 run locally on CPU with onnxruntime
+
+    Uses chromadb's bundled ONNX embedder, which downloads the model once
+    into ~/.cache/chroma and then works offline. Documents are embedded in
+    batches of `batch_size`; with `max_workers` > 1 the batches run in
+    parallel threads (onnxruntime releases the GIL during inference).
+    """
+
+    model = "all-MiniLM-L6-v2"
+
+    def __init__(self, batch_size=32, max_workers=None):
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self._embedder = None
+        self._lock = threading.Lock()
+        self._executor = None
+        if max_workers and max_workers > 1:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="onnx-embed")
+
+    def _get_embedder(self):
+        # Loading the session is slow, do it once and only when first needed
+        with self._lock:
+            if self._embedder is None:
+                from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+                self._embedder = ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+            return self._embedder
+
+    def _embed_batch(self, texts):
+        return [vector.tolist() for vector in self._get_embedder()(texts)]
+
+    def embed_documents(self, texts):
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if self._executor is not None and len(batches) > 1:
+            results = self._executor.map(self._embed_batch, batches)
+        else:
+            results = map(self._embed_batch, batches)
+        return [vector for batch in results for vector in batch]
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def _openai_embeddings(model=None, batch_size=None, max_workers=None):
+    from langchain_openai import OpenAIEmbeddings
+
+    options = {"model": model} if model else {}
+    if batch_size:
+        options["chunk_size"] = batch_size
+    return OpenAIEmbeddings(**options)
+
+
+def _onnx_embeddings(model=None, batch_size=None, max_workers=None):
+    if model and model != OnnxEmbeddings.model:
+        raise ValueError(f"The onnx provider only ships {OnnxEmbeddings.model}, not {model}")
+    return OnnxEmbeddings(batch_size=batch_size or 32, max_workers=max_workers)
+
+
+def _hashing_embeddings(model=None, batch_size=None, max_workers=None):
+    return HashingEmbeddings(size=int(model) if model else 256)
+
+
+EMBEDDING_PROVIDERS = {
+    "openai": _openai_embeddings,
+    "onnx": _onnx_embeddings,
+    "hashing": _hashing_embeddings,
+}
+
+
+def create_embeddings(provider="openai", model=None, batch_size=None, max_workers=None):
+    """Build the embeddings client for a provider name
+
+    `model` picks the OpenAI model, or the vector size for the hashing
+    provider. `batch_size` and `max_workers` tune batched inference where the
+    provider supports it.
+    """
+    factory = EMBEDDING_PROVIDERS.get(provider)
+    if factory is None:
+        raise ValueError(f"Unknown embedding provider {provider!r}, expected one of {sorted(EMBEDDING_PROVIDERS)}")
+    return factory(model=model, batch_size=batch_size, max_workers=max_workers)
+
+
+def create_embeddings_from_config():
+    """Embeddings client selected by the EMBEDDING_* settings"""
+    return create_embeddings(
+        config('EMBEDDING_PROVIDER', default='openai'),
+        model=config('EMBEDDING_MODEL', default=None),
+        batch_size=config('EMBEDDING_BATCH_SIZE', default=None, cast=lambda value: int(value) if value else None),
+        max_workers=config('EMBEDDING_THREADS', default=None, cast=lambda value: int(value) if value else None),
+    )
@@ -0,0 +1,165 @@
+from .ingredient_index import iter_bits, tokenize
+
+# Catalog columns kept as document metadata and offered as filters
+FACETS = ("alcoholic", "category", "glassType")
+
+# Phrases in a question that select an alcoholic value. Drinks with optional
+# alcohol can be made either way, so they satisfy both.
+ALCOHOLIC_PHRASES = {
+    ("non", "alcoholic"): ("Non alcoholic", "Optional alcohol"),
+    ("nonalcoholic",): ("Non alcoholic", "Optional alcohol"),
+    ("alcohol", "free"): ("Non alcoholic", "Optional alcohol"),
+    ("no", "alcohol"): ("Non alcoholic", "Optional alcohol"),
+    ("without", "alcohol"): ("Non alcoholic", "Optional alcohol"),
+    ("virgin",): ("Non alcoholic", "Optional alcohol"),
+    ("mocktail",): ("Non alcoholic", "Optional alcohol"),
+    ("mocktails",): ("Non alcoholic", "Optional alcohol"),
+    ("alcoholic",): ("Alcoholic", "Optional alcohol"),
+}
+
+# Categories are only read from a question when named unambiguously; words
+# like "cocktail", "coffee" or "shake" appear in too many other questions
+CATEGORY_PHRASES = {
+    ("shots",): ("Shot",),
+    ("party", "drink"): ("Punch / Party Drink",),
+    ("party", "drinks"): ("Punch / Party Drink",),
+    ("soft", "drink"): ("Soft Drink",),
+    ("soft", "drinks"): ("Soft Drink",),
+    ("homemade", "liqueur"): ("Homemade Liqueur",),
+    ("homemade", "liqueurs"): ("Homemade Liqueur",),
+}
+
+
+def normalize_facets(facets):
+    """Hashable filter from {facet: value or values}: ((facet, (value, ...)), ...) in FACETS order
+
+    Values of one facet are alternatives; different facets must all match.
+    """
+    facets = dict(facets or {})
+    unknown = set(facets) - set(FACETS)
+    if unknown:
+        raise ValueError(f"Unknown facets: {sorted(unknown)}")
+    normalized = []
+    for facet in FACETS:
+        values = facets.get(facet)
+        if isinstance(values, str):
+            values = [values]
+        values = tuple(sorted({value for value in values or () if value}))
+        if values:
+            normalized.append((facet, values))
+    return tuple(normalized)
+
+
+def facet_where(filters):
+    """Chroma `where` clause for a normalized filter, or None for no filter"""
+    clauses = [{facet: {"$in": list(values)}} for facet, values in filters]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _find_phrases(words, phrases):
+    """Values of the phrases found in words, leftmost-longest, with no overlapping matches"""
+    longest = max((len(phrase) for phrase in phrases), default=0)
+    found = []
+    i = 0
+    while i < len(words):
+        for length in range(min(longest, len(words) - i), 0, -1):
+            values = phrases.get(tuple(words[i:i + length]))
+            if values:
+                found += values
+                i += length
+                break
+        else:
+            i += 1
+    return found
+
+
+class FacetIndex:
+    """Bitsets of catalog positions per facet value, for filtering before any scoring
+
+    Positions follow the order of the documents given, the same order as the
+    ingredient and BM25 indexes built from the catalog, so a facet filter
+    combines with their results in a single AND.
+    """
+
+    def __init__(self, metadatas):
+        self.size = len(metadatas)
+        self.universe = (1 << self.size) - 1
+        self.postings = {facet: {} for facet in FACETS}
+        for position, metadata in enumerate(metadatas):
+            for facet in FACETS:
+                value = (metadata or {}).get(facet)
+                if value:
+                    postings = self.postings[facet]
+                    postings[value] = postings.get(value, 0) | (1 << position)
+
+        # Case-insensitive lookup of the stored spelling of a value
+        self._canonical = {
+            facet: {value.casefold(): value for value in postings} for facet, postings in self.postings.items()
+        }
+        # Glass types are matched by their full name, e.g. "highball glass"
+        self._phrases = {
+            "alcoholic": self._known("alcoholic", ALCOHOLIC_PHRASES),
+            "category": self._known("category", CATEGORY_PHRASES),
+            "glassType": {tuple(tokenize(value)): (value,) for value in self.postings["glassType"]},
+        }
+
+    @classmethod
+    def from_documents(cls, documents):
+        return cls([doc.metadata for doc in documents])
+
+    def _known(self, facet, phrases):
+        """The phrases whose values exist in the catalog, restricted to those values"""
+        known = {}
+        for phrase, values in phrases.items():
+            present = tuple(value for value in values if value in self.postings[facet])
+            if present:
+                known[phrase] = present
+        return known
+
+    def resolve(self, facets):
+        """Normalized filter with each value in its stored spelling; unknown values are kept and match nothing"""
+        return normalize_facets({
+            facet: [self._canonical[facet].get(value.casefold(), value) for value in values]
+            for facet, values in normalize_facets(facets)
+        })
+
+    def bits(self, filters):
+        """Positions matching every facet of a normalized filter"""
+        bits = self.universe
+        for facet, values in filters:
+            matched = 0
+            for value in values:
+                matched |= self.postings[facet].get(value, 0)
+            bits &= matched
+        return bits
+
+    def positions(self, filters):
+        return list(iter_bits(self.bits(filters)))
+
+    def counts(self, filters=()):
+        """{facet: {value: count}} of the documents matching the filter
+
+        Each facet is counted under the other facets' filters only, so the
+        counts say how many results picking that value instead would give.
+        """
+        counts = {}
+        for facet in FACETS:
+            within = self.bits(tuple((other, values) for other, values in filters if other != facet))
+            counts[facet] = {
+                value: (bits & within).bit_count()
+                for value, bits in sorted(self.postings[facet].items())
+                if bits & within
+            }
+        return counts
+
+    def parse_query(self, text):
+        """Normalized filter for the facets a question names, e.g. "non-alcoholic" or "highball glass" """
+        words = ["glass" if word == "glasses" else word for word in tokenize(text)]
+        facets = {}
+        for facet in FACETS:
+            values = _find_phrases(words, self._phrases[facet])
+            if values:
+                facets[facet] = values
+        return normalize_facets(facets)
@@ -0,0 +1,78 @@
+import asyncio
+from typing import Any
+
+from langchain_core.retrievers import BaseRetriever
+
+# Kept importable from here; it lives apart so the routers can use it without loading langchain
+from .retrieval_config import RetrievalConfig  # noqa: F401
+
+
+def document_key(doc):
+    return doc.id or doc.metadata.get("name") or doc.page_content
+
+
+def reciprocal_rank_fusion(ranked_lists, weights, k, rrf_k=60):
+    """Fuse ranked document lists: score = sum(weight / (rrf_k + rank))"""
+    scores = {}
+    documents = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, doc in enumerate(ranked, start=1):
+            key = document_key(doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    best = sorted(scores, key=lambda key: -scores[key])[:k]
+    return [documents[key] for key in best]
+
+
+class HybridRetriever(BaseRetriever):
+    """Runs vector and BM25 retrieval and fuses them with RRF
+
+    Each side fetches `fetch_k` candidates so documents ranked moderately by
+    both can still make the fused top `k`. BM25 runs inline: it takes well
+    under a millisecond, less than handing it to a thread would cost.
+    """
+
+    vector_retriever: BaseRetriever
+    lexical_index: Any
+    k: int = 4
+    fetch_k: int = 20
+    vector_weight: float = 1.0
+    lexical_weight: float = 1.0
+    rrf_k: int = 60
+    # Bitset of the catalog positions BM25 may return, None for all
+    allowed: Any = None
+
+    def _lexical(self, query):
+        return [doc for doc, _ in self.lexical_index.search(query, k=self.fetch_k, allowed=self.allowed)]
+
+    def _fuse(self, vector_docs, lexical_docs):
+        return reciprocal_rank_fusion(
+            [vector_docs, lexical_docs],
+            [self.vector_weight, self.lexical_weight],
+            k=self.k,
+            rrf_k=self.rrf_k,
+        )
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return self._fuse(self.vector_retriever.invoke(query), self._lexical(query))
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        # Start the vector search first, so BM25 overlaps its executor or network round trip
+        vector_task = asyncio.ensure_future(self.vector_retriever.ainvoke(query))
+        try:
+            lexical_docs = self._lexical(query)
+        except BaseException:
+            vector_task.cancel()
+            raise
+        return self._fuse(await vector_task, lexical_docs)
+
+
+class LexicalRetriever(BaseRetriever):
+    """BM25-only retriever over the in-memory lexical index"""
+
+    lexical_index: Any
+    k: int = 4
+    allowed: Any = None
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return [doc for doc, _ in self.lexical_index.search(query, k=self.k, allowed=self.allowed)]
@@ -0,0 +1,139 @@
+import re
+
+from .ingredient_matcher import IngredientMatcher
+
+TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Words that turn the next ingredient mention into an exclusion
+NEGATIONS = {"no", "not", "without", "except", "excluding", "minus"}
+
+
+def tokenize(text):
+    return TOKEN.findall(text.casefold())
+
+
+def normalize_ingredient(name):
+    return " ".join(tokenize(name))
+
+
+def iter_bits(bits):
+    """Yield the positions of the set bits of an int, lowest first"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class IngredientIndex:
+    """In-process inverted index from normalized ingredient to cocktails
+
+    Postings are Python ints used as bitsets over catalog positions, so AND,
+    OR and NOT over ingredient sets are single big-int operations. A query
+    term matches every ingredient that contains its words in order, e.g.
+    "rum" matches "Light rum" and "Dark rum" but "gin" never matches "Ginger".
+    """
+
+    def __init__(self, documents, ingredient_lists):
+        self.documents = documents
+        self.universe = (1 << len(documents)) - 1
+        self.postings = {}
+        self.ingredient_counts = [len(ingredients) for ingredients in ingredient_lists]
+
+        for position, ingredients in enumerate(ingredient_lists):
+            for ingredient in ingredients:
+                key = normalize_ingredient(ingredient)
+                if key:
+                    self.postings[key] = self.postings.get(key, 0) | (1 << position)
+
+        # Word -> ingredients containing it, used to resolve partial terms
+        self._by_token = {}
+        for key in self.postings:
+            for token in key.split():
+                self._by_token.setdefault(token, set()).add(key)
+
+        self.matcher = IngredientMatcher(self.postings)
+
+    @classmethod
+    def from_dataframe(cls, df, documents):
+        return cls(documents, df['ingredients'].tolist())
+
+    def __len__(self):
+        return len(self.documents)
+
+    def resolve(self, term):
+        """Ingredients whose name contains the term's words contiguously"""
+        words = normalize_ingredient(term).split()
+        if not words:
+            return set()
+        candidates = set(self._by_token.get(words[0], ()))
+        for word in words[1:]:
+            candidates &= self._by_token.get(word, set())
+        phrase = f" {' '.join(words)} "
+        return {key for key in candidates if phrase in f" {key} "}
+
+    def bits_for(self, term):
+        bits = 0
+        for key in self.resolve(term):
+            bits |= self.postings[key]
+        return bits
+
+    def query_bits(self, all_of=(), any_of=(), none_of=(), within=None):
+        bits = self.universe if within is None else within
+        for term in all_of:
+            bits &= self.bits_for(term)
+        if any_of:
+            matched = 0
+            for term in any_of:
+                matched |= self.bits_for(term)
+            bits &= matched
+        for term in none_of:
+            bits &= ~self.bits_for(term)
+        return bits
+
+    def query(self, all_of=(), any_of=(), none_of=(), limit=None, within=None):
+        """Documents matching every all_of term, at least one any_of term and no none_of term
+
+        `within` restricts the search to a bitset of positions, e.g. a facet
+        filter from FacetIndex.bits. Results are ranked by the number of any_of terms matched, then by the
+        number of ingredients (simpler drinks first), then by catalog order.
+        """
+        positions = list(iter_bits(self.query_bits(all_of, any_of, none_of, within)))
+        if any_of:
+            term_bits = [self.bits_for(term) for term in any_of]
+            score = {p: sum((bits >> p) & 1 for bits in term_bits) for p in positions}
+            positions.sort(key=lambda p: (-score[p], self.ingredient_counts[p], p))
+        else:
+            positions.sort(key=lambda p: (self.ingredient_counts[p], p))
+        if limit is not None:
+            positions = positions[:limit]
+        return [self.documents[p] for p in positions]
+
+    def find_mentions(self, text):
+        """Known ingredients mentioned in free text as (name, negated) pairs
+
+        Ingredient names are the matcher's leftmost-longest matches; a negation
+        word earlier in the same clause excludes the ingredient.
+        """
+        words = tokenize(text)
+        mentions = []
+        negated = False
+        i = 0
+        for start, end, name in self.matcher.find(words):
+            for word in words[i:start]:
+                if word in NEGATIONS or word.endswith("n't"):
+                    negated = True
+                elif word in {"but", "with"}:
+                    negated = False
+            mentions.append((name, negated))
+            i = end
+        return mentions
+
+    def parse_query(self, text):
+        """Split free text into (all_of, any_of, none_of) ingredient terms"""
+        mentions = self.find_mentions(text)
+        positive = [name for name, negated in mentions if not negated]
+        none_of = [name for name, negated in mentions if negated]
+        words = set(tokenize(text))
+        if "or" in words and "and" not in words:
+            return [], positive, none_of
+        return positive, [], none_of
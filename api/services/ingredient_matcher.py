@@ -0,0 +1,77 @@
+class IngredientMatcher:
+    """Aho-Corasick automaton over word tokens for a fixed ingredient vocabulary
+
+    Names are matched on whole words, so "gin" never fires inside "ginger",
+    and multi-word names like "lemon juice" are found in one pass over the
+    text regardless of how many names the vocabulary holds. Matches are
+    leftmost-longest and never overlap: "fresh lemon juice" is reported
+    once, not also as "lemon juice" and "lemon".
+    """
+
+    def __init__(self, names):
+        # Node 0 is the root; each node maps a word to the next node
+        self._goto = [{}]
+        self._fail = [0]
+        # Lengths (in words) of every name that ends at a node, own and via suffix links
+        self._lengths = [()]
+        self._size = 0
+
+        for name in names:
+            words = name.split()
+            if not words:
+                continue
+            node = 0
+            for word in words:
+                next_node = self._goto[node].get(word)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][word] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._lengths.append(())
+                node = next_node
+            if not self._lengths[node]:
+                self._lengths[node] = (len(words),)
+                self._size += 1
+
+        # Breadth-first so every suffix link points at an already finished node
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for word, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(word, 0)
+                self._fail[child] = target if target != child else 0
+                self._lengths[child] = tuple(sorted(
+                    set(self._lengths[child]) | set(self._lengths[self._fail[child]]),
+                    reverse=True,
+                ))
+                queue.append(child)
+
+    def __len__(self):
+        return self._size
+
+    def find(self, words):
+        """Non-overlapping (start, end, name) matches over a list of word tokens"""
+        candidates = []
+        node = 0
+        for end, word in enumerate(words, 1):
+            while node and word not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(word, 0)
+            for length in self._lengths[node]:
+                candidates.append((end - length, end))
+
+        if not candidates:
+            return []
+
+        # Leftmost first, longest first at the same start
+        candidates.sort(key=lambda span: (span[0], -span[1]))
+        matches = []
+        covered = 0
+        for start, end in candidates:
+            if start >= covered:
+                matches.append((start, end, " ".join(words[start:end])))
+                covered = end
+        return matches
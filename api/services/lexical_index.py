@@ -0,0 +1,58 @@
+import math
+from collections import Counter
+
+from .ingredient_index import iter_bits, tokenize
+
+
+class BM25Index:
+    """Okapi BM25 over document text, held in memory next to the vector store
+
+    Catches what embeddings rank poorly: exact cocktail names such as "A1" or
+    "ABC" and rare ingredient words.
+    """
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+
+        self.postings = {}
+        lengths = []
+        for position, doc in enumerate(documents):
+            counts = Counter(tokenize(doc.page_content))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((position, tf))
+
+        count = len(documents)
+        average_length = sum(lengths) / count if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+        # Per-document length normalization, precomputed once
+        self._norms = [
+            k1 * (1 - b + b * length / average_length) if average_length else k1
+            for length in lengths
+        ]
+
+    def search(self, query, k=4, allowed=None):
+        """Top-k (document, score) pairs for the query, best first
+
+        `allowed` is a bitset of the positions that may match, e.g. a facet
+        filter from FacetIndex.bits; other documents are never scored.
+        """
+        allowed_positions = None if allowed is None else set(iter_bits(allowed))
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for position, tf in postings:
+                if allowed_positions is not None and position not in allowed_positions:
+                    continue
+                scores[position] = scores.get(position, 0.0) + idf * tf * (self.k1 + 1) / (tf + self._norms[position])
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(self.documents[position], score) for position, score in best]
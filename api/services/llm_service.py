@@ -1,13 +1,396 @@
+import asyncio
+import random
+import threading
+import time
+
+import httpx
+import openai
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.messages import AIMessage, BaseMessage, message_chunk_to_message
+from langchain_core.runnables import Runnable
 from langchain_openai import ChatOpenAI
 
+from .concurrency import CircuitBreaker, UpstreamUnavailableError
+from .telemetry import DISABLED
+
+# Retry delays are drawn uniformly from [0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)]
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_DELAY = 4.0
+# Seconds allowed to open a connection, out of the whole request timeout
+CONNECT_TIMEOUT = 5.0
+# Idle keep-alive connections are kept this long
+KEEPALIVE_EXPIRY = 60.0
+
+
+class LLMTelemetryCallback(BaseCallbackHandler):
+    """Times prompt building, time to first token and the model call, and counts tokens
+
+    Token counts come from the usage the provider reports; models that report
+    none are timed but not counted.
+    """
+
+    run_inline = True
+
+    def __init__(self, telemetry, model, started):
+        self.telemetry = telemetry
+        self.model = model
+        self.started = started
+        self.llm_started = None
+        self.first_token = None
+        self.span = None
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.llm_started = time.perf_counter()
+        self.telemetry.observe("prompt", self.llm_started - self.started)
+        if self.telemetry.tracer is not None:
+            self.span = self.telemetry.tracer.start_span("llm", attributes={"llm.model": self.model})
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.first_token is None and token:
+            self.first_token = time.perf_counter()
+            self.telemetry.observe("llm_first_token", self.first_token - self.llm_started)
+
+    def on_llm_end(self, response, **kwargs):
+        if self.llm_started is None:
+            return
+        self.telemetry.observe("llm", time.perf_counter() - self.llm_started)
+
+        usage = None
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or usage
+        if usage:
+            self.telemetry.count_tokens(self.model, usage["input_tokens"], usage["output_tokens"])
+        if self.span is not None:
+            if usage:
+                self.span.set_attribute("llm.prompt_tokens", usage["input_tokens"])
+                self.span.set_attribute("llm.completion_tokens", usage["output_tokens"])
+            self.span.end()
+
+    def on_llm_error(self, error, **kwargs):
+        self.telemetry.count("llm_errors_total", model=self.model)
+        if self.span is not None:
+            self.span.record_exception(error)
+            self.span.end()
+
+
+def is_transient(error):
+    """Whether an upstream error is worth retrying: timeouts, dropped connections, 408/409/429 and 5xx"""
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_delay(attempt):
+    """Full-jitter exponential backoff, so clients that failed together do not retry together"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class LatencyBudgetExceeded(Exception):
+    """The primary model had not sent its first token within the latency budget"""
+
+
+def is_upstream_failure(error):
+    """Whether an error says the upstream is unhealthy, rather than that the request was bad
+
+    Only these count against the circuit breaker and go to the fallback
+    model; a 400, 401, 404 or an oversized prompt would fail there too.
+    """
+    return isinstance(error, (UpstreamUnavailableError, LatencyBudgetExceeded)) or is_transient(error)
+
+
+class ResilientChatModel(Runnable[LanguageModelInput, BaseMessage]):
+    """A chat model with retries, a circuit breaker and an optional fallback model
+
+    Every call streams from the model, and transient errors are retried
+    with jittered backoff as long as nothing has been produced yet.
+    Non-streaming calls join the chunks, so `latency_budget` always bounds
+    the time to first token. Calls that still fail on the upstream's side
+    count against the circuit breaker. With a fallback model configured
+    (typically a cheaper one), calls going over the latency budget count
+    against it as well and are handed to the fallback, as are those failed
+    calls and every call while the breaker is open. Transient errors left
+    after the retries, and an open breaker with no fallback, raise
+    UpstreamUnavailableError. Client errors (bad request, authentication,
+    context length) are raised as they are and leave the breaker alone.
+    """
+
+    def __init__(self, model_name, client, fallback_model=None, fallback=None, max_retries=2,
+                 latency_budget=None, breaker=None, telemetry=None):
+        self.model_name = model_name
+        self.client = client
+        self.fallback_model = fallback_model
+        self.fallback = fallback
+        self.max_retries = max_retries
+        # Only enforced when there is a fallback to hand slow calls to
+        self.latency_budget = latency_budget if fallback is not None else None
+        self.breaker = breaker or CircuitBreaker()
+        self.telemetry = telemetry or DISABLED
+        self.retries = 0
+        self.fallbacks = 0
+
+    def _primary_allowed(self):
+        if self.breaker.allow():
+            return True
+        if self.fallback is None:
+            raise UpstreamUnavailableError(retry_after=self.breaker.retry_after)
+        self._fell_back("breaker_open")
+        return False
+
+    def _fell_back(self, reason):
+        self.fallbacks += 1
+        self.telemetry.count("llm_fallbacks_total", model=self.model_name, reason=reason)
+
+    def _retrying(self, error, attempt):
+        if attempt >= self.max_retries or not is_transient(error):
+            return False
+        self.retries += 1
+        self.telemetry.count("llm_retries_total", model=self.model_name)
+        return True
+
+    def _attempts(self, client, input, config, breaker, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            stream = iter(client.stream(input, config, **kwargs))
+            try:
+                try:
+                    first = next(stream)
+                except StopIteration:
+                    break
+                except Exception as error:
+                    if self._retrying(error, attempt):
+                        time.sleep(retry_delay(attempt))
+                        continue
+                    if is_transient(error):
+                        raise UpstreamUnavailableError() from error
+                    raise
+                yield first
+                yield from stream
+                break
+            except Exception as error:
+                if breaker is not None and is_upstream_failure(error):
+                    breaker.record(False)
+                raise
+            finally:
+                getattr(stream, "close", lambda: None)()
+        if breaker is not None:
+            breaker.record(True)
+
+    async def _aattempts(self, client, input, config, breaker, budget, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            stream = client.astream(input, config, **kwargs).__aiter__()
+            try:
+                try:
+                    first = await asyncio.wait_for(stream.__anext__(), budget)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise LatencyBudgetExceeded(f"{self.model_name} sent nothing within {budget}s")
+                except Exception as error:
+                    if self._retrying(error, attempt):
+                        await asyncio.sleep(retry_delay(attempt))
+                        continue
+                    if is_transient(error):
+                        raise UpstreamUnavailableError() from error
+                    raise
+                yield first
+                async for chunk in stream:
+                    yield chunk
+                break
+            except Exception as error:
+                if breaker is not None and is_upstream_failure(error):
+                    breaker.record(False)
+                raise
+            finally:
+                await stream.aclose()
+        if breaker is not None:
+            breaker.record(True)
+
+    def stream(self, input, config=None, **kwargs):
+        if self._primary_allowed():
+            produced = False
+            try:
+                for chunk in self._attempts(self.client, input, config, self.breaker, **kwargs):
+                    produced = True
+                    yield chunk
+                return
+            except Exception as error:
+                # Half an answer cannot be continued by another model
+                if produced or self.fallback is None or not is_upstream_failure(error):
+                    raise
+                self._fell_back("error")
+        yield from self._attempts(self.fallback, input, config, None, **kwargs)
+
+    async def astream(self, input, config=None, **kwargs):
+        if self._primary_allowed():
+            produced = False
+            try:
+                async for chunk in self._aattempts(
+                    self.client, input, config, self.breaker, self.latency_budget, **kwargs
+                ):
+                    produced = True
+                    yield chunk
+                return
+            except Exception as error:
+                if produced or self.fallback is None or not is_upstream_failure(error):
+                    raise
+                self._fell_back("latency" if isinstance(error, LatencyBudgetExceeded) else "error")
+        async for chunk in self._aattempts(self.fallback, input, config, None, None, **kwargs):
+            yield chunk
+
+    @staticmethod
+    def _join(message, chunk):
+        return chunk if message is None else message + chunk
+
+    def invoke(self, input, config=None, **kwargs):
+        message = None
+        for chunk in self.stream(input, config, **kwargs):
+            message = self._join(message, chunk)
+        return message_chunk_to_message(message) if message is not None else AIMessage(content="")
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        message = None
+        async for chunk in self.astream(input, config, **kwargs):
+            message = self._join(message, chunk)
+        return message_chunk_to_message(message) if message is not None else AIMessage(content="")
+
+    def stats(self):
+        return {
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "retries": self.retries,
+            "fallbacks": self.fallbacks,
+            "fallback_model": self.fallback_model,
+        }
+
+
+class LLMClientPool:
+    """Keeps one resilient chat-model client per model name for the lifetime of the worker
+
+    The OpenAI clients of every model share one sync and one async HTTP
+    client, so connections are kept alive and reused across requests and
+    models. Each model gets its own circuit breaker. The OpenAI SDK's own
+    retries are off; ResilientChatModel retries instead, with jitter, so
+    the breaker sees each call once.
+    """
+
+    def __init__(self, client_factory=None, timeout=30.0, max_retries=2, fallback_model=None,
+                 latency_budget=None, breaker_reset=30.0, max_connections=100, telemetry=None):
+        self._client_factory = client_factory or self._openai_client
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.fallback_model = fallback_model or None
+        self.latency_budget = latency_budget or None
+        self.breaker_reset = breaker_reset
+        self.max_connections = max_connections
+        self.telemetry = telemetry or DISABLED
+        self._http_client = None
+        self._http_async_client = None
+        self._models = {}
+        self._clients = {}
+        self._lock = threading.RLock()
+
+    def _openai_client(self, model_name):
+        if self._http_client is None:
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            )
+            timeout = httpx.Timeout(self.timeout, connect=min(self.timeout, CONNECT_TIMEOUT))
+            self._http_client = httpx.Client(limits=limits, timeout=timeout)
+            self._http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        # stream_usage makes streamed answers report token usage too
+        return ChatOpenAI(
+            model=model_name,
+            stream_usage=True,
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=self._http_client,
+            http_async_client=self._http_async_client,
+        )
+
+    def _model(self, model_name):
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models[model_name] = self._client_factory(model_name)
+        return model
+
+    def get(self, model_name):
+        client = self._clients.get(model_name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(model_name)
+                if client is None:
+                    fallback_model = self.fallback_model if self.fallback_model != model_name else None
+                    client = ResilientChatModel(
+                        model_name,
+                        self._model(model_name),
+                        fallback_model=fallback_model,
+                        fallback=self._model(fallback_model) if fallback_model else None,
+                        max_retries=self.max_retries,
+                        latency_budget=self.latency_budget,
+                        breaker=CircuitBreaker(reset_timeout=self.breaker_reset),
+                        telemetry=self.telemetry,
+                    )
+                    self._clients[model_name] = client
+        return client
+
+    def stats(self):
+        return {model_name: client.stats() for model_name, client in list(self._clients.items())}
+
+    def close(self):
+        """Drop the clients and close the sync connection pool
+
+        The async pool can only be closed from its event loop; its idle
+        connections go away with the worker.
+        """
+        with self._lock:
+            self._clients.clear()
+            self._models.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = None
+            self._http_async_client = None
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_client_pool():
+    """Process-wide pool for LLMService instances created without one, e.g. in scripts"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = LLMClientPool()
+        return _default_pool
+
+
 class LLMService:
-    def __init__(self, model_name="gpt-3.5-turbo"):
+    def __init__(self, model_name="gpt-3.5-turbo", client_pool=None, telemetry=None):
         self.model_name = model_name
-        self.llm = ChatOpenAI(model=model_name)
+        # Switching models reuses pooled clients rather than opening new connections
+        self.client_pool = client_pool or default_client_pool()
+        self.telemetry = telemetry or DISABLED
+        self.llm = self._create_llm(model_name)
+
+    def _create_llm(self, model_name):
+        return self.client_pool.get(model_name)
 
     def get_llm(self):
         return self.llm
 
+    def run_config(self, started):
+        """Runnable config for a chain call that started at `started`, timing and counting its LLM call"""
+        if not self.telemetry.enabled:
+            return None
+        return {"callbacks": [LLMTelemetryCallback(self.telemetry, self.model_name, started)]}
+
     def set_model(self, model_name):
+        if model_name == self.model_name:
+            return
         self.model_name = model_name
-        self.llm = ChatOpenAI(model=model_name)
\ No newline at end of file
+        self.llm = self._create_llm(model_name)
@@ -0,0 +1,103 @@
+import re
+from typing import List, NamedTuple
+
+from .ingredient_index import NEGATIONS
+from .ingredient_matcher import IngredientMatcher
+
+# Words plus sentence punctuation, which ends the scope of an opinion
+TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?|[.!?;]")
+
+LIKE_WORDS = {
+    "like", "likes", "love", "loves", "enjoy", "enjoys", "prefer", "prefers",
+    "adore", "fan", "favorite", "favourite", "favorites", "favourites",
+}
+DISLIKE_WORDS = {"hate", "hates", "dislike", "dislikes", "detest", "avoid", "allergic"}
+OPINION_WORDS = LIKE_WORDS | DISLIKE_WORDS
+
+# Used when no catalog is available to build the vocabulary from
+DEFAULT_VOCABULARY = [
+    "rum", "vodka", "gin", "tequila", "whiskey", "bourbon",
+    "brandy", "cognac", "lime", "lemon", "orange", "mint",
+    "sugar", "syrup", "juice", "soda", "tonic", "vermouth",
+    "bitters", "grenadine", "cream", "coffee", "chocolate",
+]
+
+# Trailing words users leave out: "tonic" for "Tonic water", "cranberry" for "Cranberry juice"
+SHORTENED_SUFFIXES = {"water", "juice"}
+
+
+def short_names(vocabulary):
+    """Map names without a trailing "water" or "juice" to the one vocabulary name they stand for
+
+    A short name is only kept when it is unambiguous and not an ingredient
+    of its own, so "lemon" stays "lemon" rather than "lemon juice".
+    """
+    names = set(vocabulary)
+    expansions = {}
+    for name in names:
+        words = name.split()
+        if len(words) > 1 and words[-1] in SHORTENED_SUFFIXES:
+            expansions.setdefault(" ".join(words[:-1]), []).append(name)
+    return {short: full[0] for short, full in expansions.items() if len(full) == 1 and short not in names}
+
+
+def tokenize(text):
+    return TOKEN.findall(text.casefold().replace("’", "'"))
+
+
+def is_negation(word):
+    return word in NEGATIONS or word == "never" or word.endswith("n't")
+
+
+class Preferences(NamedTuple):
+    likes: List[str]
+    dislikes: List[str]
+
+
+class PreferenceExtractor:
+    """Liked and disliked ingredients stated in a chat message
+
+    An opinion word ("love", "hate") sets the polarity for the ingredients
+    that follow it in the same sentence; a negation flips it, so "I don't
+    like rum" and "I love gin but not vodka" both record a dislike.
+    Ingredients mentioned without any opinion are ignored. Short names
+    resolve to the vocabulary's full name ("tonic" records "tonic water").
+    """
+
+    def __init__(self, vocabulary):
+        vocabulary = list(vocabulary)
+        self.aliases = short_names(vocabulary)
+        self.matcher = IngredientMatcher(vocabulary + list(self.aliases))
+
+    def extract(self, text):
+        words = tokenize(text)
+        if OPINION_WORDS.isdisjoint(words):
+            return Preferences([], [])
+
+        opinions = {}
+        opinion = None
+        negated = False
+        i = 0
+        for start, end, name in self.matcher.find(words) + [(len(words), len(words), None)]:
+            for word in words[i:start]:
+                if word in ".!?;":
+                    opinion, negated = None, False
+                elif word in LIKE_WORDS:
+                    opinion, negated = (not negated), False
+                elif word in DISLIKE_WORDS:
+                    opinion, negated = negated, False
+                elif word == "but":
+                    negated = False
+                elif is_negation(word):
+                    negated = True
+            if name is not None and opinion is not None:
+                name = self.aliases.get(name, name)
+                # A later statement about the same ingredient wins
+                opinions.pop(name, None)
+                opinions[name] = opinion != negated
+            i = end
+
+        return Preferences(
+            [name for name, liked in opinions.items() if liked],
+            [name for name, liked in opinions.items() if not liked],
+        )
@@ -0,0 +1,132 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_USER_ID = "default"
+
+
+def merge_items(existing, new_items):
+    """Append new items to existing ones, skipping case-insensitive duplicates"""
+    merged = list(existing)
+    seen = {item.casefold() for item in merged}
+    for item in new_items:
+        item = item.strip()
+        if item and item.casefold() not in seen:
+            merged.append(item)
+            seen.add(item.casefold())
+    return merged
+
+
+def merge_recent(existing, new_items, limit):
+    """Move new items to the end of the list (case-insensitive) and keep only the last `limit`"""
+    new_items = merge_items([], new_items)
+    fresh = {item.casefold() for item in new_items}
+    return ([item for item in existing if item.casefold() not in fresh] + new_items)[-limit:]
+
+
+class PreferenceStore:
+    """Per-user preferences in SQLite (WAL mode) behind an in-memory write-through cache
+
+    Reads are dictionary lookups. Writes merge inside an IMMEDIATE transaction,
+    so concurrent writers (threads or worker processes) never lose an update,
+    and nothing on the write path calls an embedding model. SQLite's
+    data_version tells us when another process has committed, which drops
+    this process's cache so it never serves stale preferences.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS preferences ("
+            " user_id TEXT NOT NULL,"
+            " preference_type TEXT NOT NULL,"
+            " items TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (user_id, preference_type))"
+        )
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._data_version = self._current_data_version()
+
+    def _current_data_version(self):
+        return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def _check_external_writes(self):
+        version = self._current_data_version()
+        if version != self._data_version:
+            self._cache.clear()
+            self._data_version = version
+
+    def _load(self, user_id, preference_type):
+        row = self._db.execute(
+            "SELECT items FROM preferences WHERE user_id = ? AND preference_type = ?",
+            (user_id, preference_type),
+        ).fetchone()
+        return tuple(json.loads(row[0])) if row else ()
+
+    def get(self, user_id, preference_type):
+        key = (user_id, preference_type)
+        with self._lock:
+            self._check_external_writes()
+            items = self._cache.get(key)
+            if items is None:
+                items = self._load(user_id, preference_type)
+                self._cache[key] = items
+        return list(items)
+
+    def get_all(self, user_id):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT preference_type, items FROM preferences WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        return {preference_type: json.loads(items) for preference_type, items in rows}
+
+    def _update(self, user_id, preference_type, change):
+        key = (user_id, preference_type)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                current = self._load(user_id, preference_type)
+                items = tuple(change(current))
+                if items != current:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO preferences (user_id, preference_type, items, updated_at)"
+                        " VALUES (?, ?, ?, ?)",
+                        (user_id, preference_type, json.dumps(items), time.time()),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._cache[key] = items
+        return list(items)
+
+    def add(self, user_id, preference_type, items, keep_last=None):
+        """Atomically merge items into a preference list and return the result
+
+        With `keep_last` the list is a recency window instead: the items move
+        to its end and only the last `keep_last` are kept.
+        """
+        if keep_last:
+            return self._update(user_id, preference_type, lambda current: merge_recent(current, items, keep_last))
+        return self._update(user_id, preference_type, lambda current: merge_items(current, items))
+
+    def remove(self, user_id, preference_type, items):
+        """Atomically drop items (case-insensitive) from a preference list"""
+        removed = {item.strip().casefold() for item in items}
+        return self._update(
+            user_id, preference_type,
+            lambda current: [item for item in current if item.casefold() not in removed],
+        )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
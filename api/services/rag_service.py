@@ -1,138 +1,695 @@
+import asyncio
+import time
+from contextlib import nullcontext
+
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains.retrieval import create_retrieval_chain
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from .answer_cache import normalize_query
+from .chain_cache import CompiledChain
+from .concurrency import ServiceBusyError
+from .diversity import cosine_similarity_matrix, mmr_select
+from .embedding_cache import CachedEmbeddings
+from .facet_index import normalize_facets
+from .hybrid_retriever import HybridRetriever, LexicalRetriever, RetrievalConfig
+from .preference_store import DEFAULT_USER_ID
+from .session_store import SUMMARY_PROMPT
+from .telemetry import DISABLED
+
+NO_DATA_ANSWER = {"answer": "No cocktail data available. Please load the dataset first."}
+NO_FAVORITES_RESULT = {"recommendations": [], "message": "No favorite ingredients found. Please tell me what ingredients you like first."}
+
+# Recommendations rerank RECOMMEND_OVERSAMPLE times as many candidates as asked for
+RECOMMEND_OVERSAMPLE = 4
+RECOMMEND_DIVERSITY = 0.5
+MAX_RECOMMEND_CANDIDATES = 1000
+# exclude_seen skips this many of the most recently recommended cocktails, so
+# the list stays small and never ends up excluding the whole catalog
+SEEN_COCKTAILS_WINDOW = 100
+
+SYSTEM_PROMPT = """
+You are a cocktail expert and advisor. Use the provided context to answer questions about cocktails.
+If the information is not in the context, say you don't have that information.
+If the user mentions their favorite ingredients, remember them for future recommendations.
+
+Context: {context}
+"""
+
+# Compiled once; chat history is passed as a variable on every turn
+CHAT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT),
+    MessagesPlaceholder("chat_history", optional=True),
+    ("human", "{input}"),
+])
+
+def to_history_messages(chat_history):
+    """Convert request chat history into (role, content) tuples for the prompt"""
+    messages = []
+    for message in chat_history or []:
+        # Check if message is a dictionary or an object
+        if hasattr(message, 'role') and hasattr(message, 'content'):
+            # If it's an object with role and content attributes
+            messages.append((message.role, message.content))
+        elif isinstance(message, dict):
+            # If it's a dictionary
+            messages.append((message.get("role"), message.get("content")))
+        # If it's neither of the expected formats, skip
+    return messages
 
 class RAGService:
-    def __init__(self, llm_service, vector_store_service):
+    def __init__(self, llm_service, vector_store_service, llm_limiter=None, chain_cache=None,
+                 ingredient_index=None, lexical_index=None, answer_cache=None,
+                 preference_store=None, user_id=DEFAULT_USER_ID, preference_extractor=None,
+                 session_store=None, telemetry=None, facet_index=None, single_flight=None):
         self.llm_service = llm_service
         self.vector_store_service = vector_store_service
+        self.llm_limiter = llm_limiter
+        self.chain_cache = chain_cache
+        self.ingredient_index = ingredient_index
+        self.lexical_index = lexical_index
+        self.facet_index = facet_index
+        self.answer_cache = answer_cache
+        self.preference_store = preference_store
+        self.user_id = user_id
+        self.preference_extractor = preference_extractor
+        self.session_store = session_store
+        self.telemetry = telemetry or DISABLED
+        self.single_flight = single_flight
+
+    def _llm_slot(self):
+        """Concurrency slot for an upstream LLM call, if a limiter is configured"""
+        if self.llm_limiter is None:
+            return nullcontext()
+        return self.llm_limiter.slot()
 
-    def ask_question(self, query, chat_history=None):
-        llm = self.llm_service.get_llm()
-        retriever = self.vector_store_service.get_retriever()
+    def _facet_filter(self, text, retrieval=None, facets=None, facets_from_query=True):
+        """Facet filter for a request: named in the text, then set on the config, then passed explicitly
 
-        if not retriever:
-            return {"answer": "No cocktail data available. Please load the dataset first."}
+        Later sources override earlier ones per facet. Explicit values are
+        matched case-insensitively against the catalog's spelling.
+        """
+        filters = {}
+        if facets_from_query and text and self.facet_index is not None:
+            filters.update(self.facet_index.parse_query(text))
+        if retrieval is not None:
+            filters.update(retrieval.facets)
+        if facets:
+            explicit = self.facet_index.resolve(facets) if self.facet_index is not None else normalize_facets(facets)
+            filters.update(explicit)
+        return normalize_facets(filters)
 
-        system_prompt = """
-        You are a cocktail expert and advisor. Use the provided context to answer questions about cocktails.
-        If the information is not in the context, say you don't have that information.
-        If the user mentions their favorite ingredients, remember them for future recommendations.
+    def _filtered(self, text, retrieval=None, facets=None, facets_from_query=True):
+        """The retrieval config with the request's facet filter"""
+        return (retrieval or RetrievalConfig())._replace(
+            facets=self._facet_filter(text, retrieval, facets, facets_from_query)
+        )
 
-        Context: {context}
+    def _build_retriever(self, retrieval=None):
+        """Retriever for a RetrievalConfig; without a lexical index everything is vector-only
+
+        A facet filter restricts every side before scoring. Without a facet
+        index BM25 cannot be filtered, so filtered retrieval is vector-only.
         """
+        retrieval = retrieval or RetrievalConfig()
+        allowed = None
+        lexical_index = self.lexical_index
+        if retrieval.facets:
+            if self.facet_index is None:
+                lexical_index = None
+            else:
+                allowed = self.facet_index.bits(retrieval.facets)
+
+        if retrieval.mode == "lexical" and lexical_index is not None:
+            return LexicalRetriever(lexical_index=lexical_index, k=retrieval.k, allowed=allowed)
 
-        messages = [("system", system_prompt)]
-        if chat_history:
-            for message in chat_history:
-                # Check if message is a dictionary or an object
-                if hasattr(message, 'role') and hasattr(message, 'content'):
-                    # If it's an object with role and content attributes
-                    messages.append((message.role, message.content))
-                elif isinstance(message, dict):
-                    # If it's a dictionary
-                    messages.append((message.get("role"), message.get("content")))
-                else:
-                    # If it's neither of the expected formats, skip
-                    continue
-
-        messages.append(("human", "{input}"))
-
-        prompt = ChatPromptTemplate.from_messages(messages)
-
-        question_answer_chain = create_stuff_documents_chain(
-            llm=llm,
-            prompt=prompt,
+        if retrieval.mode == "hybrid" and lexical_index is not None:
+            fetch_k = max(20, retrieval.k * 4)
+            return HybridRetriever(
+                vector_retriever=self.vector_store_service.get_retriever({"k": fetch_k}, retrieval.facets),
+                lexical_index=lexical_index,
+                k=retrieval.k,
+                fetch_k=fetch_k,
+                vector_weight=retrieval.vector_weight,
+                lexical_weight=retrieval.lexical_weight,
+                allowed=allowed,
+            )
+
+        return self.vector_store_service.get_retriever({"k": retrieval.k}, retrieval.facets)
+
+    def _compile_chain(self, retrieval):
+        retriever = self._build_retriever(retrieval)
+        qa_chain = create_stuff_documents_chain(
+            llm=self.llm_service.get_llm(),
+            prompt=CHAT_PROMPT,
         )
+        return CompiledChain(retriever, qa_chain)
+
+    def _get_chain(self, retrieval=None):
+        """Compiled chain for the current model and retrieval config, or None without data"""
+        if not self.vector_store_service.available:
+            return None
+
+        retrieval = retrieval or RetrievalConfig()
+        if self.chain_cache is None:
+            return self._compile_chain(retrieval)
+
+        key = (self.llm_service.model_name, retrieval)
+        return self.chain_cache.get_or_create(key, lambda: self._compile_chain(retrieval))
+
+    def _use_answer_cache(self, chat_history, use_cache):
+        """Whether this turn may read and write the answer cache"""
+        if self.answer_cache is None:
+            return False
+        # Answers that depend on earlier turns are never cached
+        if not use_cache or chat_history:
+            self.answer_cache.record_bypass()
+            return False
+        return True
+
+    def ask_question(self, query, chat_history=None, retrieval=None, use_cache=True,
+                     facets=None, facets_from_query=True):
+        retrieval = self._filtered(query, retrieval, facets, facets_from_query)
+        chain = self._get_chain(retrieval)
+
+        if not chain:
+            return NO_DATA_ANSWER
+
+        with self.telemetry.stage("retrieve"):
+            context = chain.retriever.invoke(query)
+
+        answer = None
+        cacheable = self._use_answer_cache(chat_history, use_cache)
+        if cacheable:
+            with self.telemetry.stage("answer_cache"):
+                key = self.answer_cache.make_key(query, self.llm_service.model_name, context)
+                embedding = self._query_embedding(query)
+                answer = self.answer_cache.get(key, embedding)
+
+        if answer is None:
+            with self.telemetry.stage("generate"):
+                answer = chain.qa_chain.invoke({
+                    "input": query,
+                    "context": context,
+                    "chat_history": to_history_messages(chat_history),
+                }, config=self.llm_service.run_config(time.perf_counter()))
+            if cacheable:
+                self.answer_cache.put(key, answer, embedding)
+
+        return {"input": query, "context": context, "answer": answer, "facets": dict(retrieval.facets)}
+
+    def _query_embedding(self, query):
+        if not self.answer_cache.semantic_enabled:
+            return None
+        return self.vector_store_service.embedding_function.embed_query(query)
 
-        chain = create_retrieval_chain(
-            retriever=retriever,
-            combine_docs_chain=question_answer_chain,
+    async def _aquery_embedding(self, query):
+        # The retriever has just embedded the same query, so this is a cache hit
+        if not self.answer_cache.semantic_enabled:
+            return None
+        return await self.vector_store_service.embedding_function.aembed_query(query)
+
+    async def _acached_answer(self, query, context, chat_history, use_cache):
+        """(cached answer or None, cache key or None, query embedding) for an async turn"""
+        if not self._use_answer_cache(chat_history, use_cache):
+            return None, None, None
+        with self.telemetry.stage("answer_cache"):
+            key = self.answer_cache.make_key(query, self.llm_service.model_name, context)
+            embedding = await self._aquery_embedding(query)
+            return self.answer_cache.get(key, embedding), key, embedding
+
+    async def aask_question(self, query, chat_history=None, retrieval=None, use_cache=True,
+                            facets=None, facets_from_query=True):
+        """Async variant of ask_question that never blocks the event loop
+
+        Identical first-turn questions (same wording up to case and
+        punctuation, model and retrieval config) asked while one is being
+        answered share its retrieval and LLM call.
+        """
+        retrieval = self._filtered(query, retrieval, facets, facets_from_query)
+        if self.single_flight is None or chat_history:
+            return await self._aanswer(query, chat_history, retrieval, use_cache)
+
+        key = (normalize_query(query), self.llm_service.model_name, retrieval, bool(use_cache))
+        result = await self.single_flight.run(
+            key, lambda: self._aanswer(query, chat_history, retrieval, use_cache)
         )
+        return dict(result, input=query) if "input" in result else dict(result)
 
-        response = chain.invoke({"input": query})
+    async def _aanswer(self, query, chat_history, retrieval, use_cache):
+        chain = self._get_chain(retrieval)
 
-        # Detect user preferences
-        self._detect_user_preferences(query)
+        if not chain:
+            return NO_DATA_ANSWER
 
-        return response
+        # Retrieval runs in the bounded executor and does not hold an LLM slot
+        with self.telemetry.stage("retrieve"):
+            context = await chain.retriever.ainvoke(query)
 
-    def recommend_cocktails(self, criteria, count=5):
-        """Recommend cocktails based on criteria"""
-        llm = self.llm_service.get_llm()
-        retriever = self.vector_store_service.get_retriever()
+        answer, key, embedding = await self._acached_answer(query, context, chat_history, use_cache)
+        if answer is None:
+            async with self._llm_slot():
+                with self.telemetry.stage("generate"):
+                    answer = await chain.qa_chain.ainvoke({
+                        "input": query,
+                        "context": context,
+                        "chat_history": to_history_messages(chat_history),
+                    }, config=self.llm_service.run_config(time.perf_counter()))
+            if key is not None:
+                self.answer_cache.put(key, answer, embedding)
 
-        if not retriever:
-            return {"recommendations": [], "message": "No cocktail data available."}
+        return {"input": query, "context": context, "answer": answer, "facets": dict(retrieval.facets)}
 
-        # Check if we're searching based on favorite ingredients
-        if "favorite" in criteria.lower() or "favourite" in criteria.lower():
-            favorite_ingredients = self.vector_store_service.get_user_preferences("ingredients")
+    async def astream_question(self, query, chat_history=None, retrieval=None, use_cache=True,
+                               facets=None, facets_from_query=True):
+        """Stream an answer as events: retrieved cocktails, answer tokens, timings
 
+        The LLM slot is taken before the first event is yielded, so callers
+        that await the first event still see ServiceBusyError up front.
+        """
+        start = time.perf_counter()
+        retrieval = self._filtered(query, retrieval, facets, facets_from_query)
+        chain = self._get_chain(retrieval)
+
+        if not chain:
+            yield {"type": "token", "content": NO_DATA_ANSWER["answer"]}
+            yield {"type": "done", "ttft_ms": 0.0, "total_ms": 0.0}
+            return
+
+        with self.telemetry.stage("retrieve"):
+            context = await chain.retriever.ainvoke(query)
+        context_event = {
+            "type": "context",
+            "cocktails": [doc.metadata.get("name", "Unknown cocktail") for doc in context],
+            "facets": dict(retrieval.facets),
+        }
+
+        answer, key, embedding = await self._acached_answer(query, context, chat_history, use_cache)
+        cached = answer is not None
+        first_token_at = None
+
+        if cached:
+            yield context_event
+            first_token_at = time.perf_counter()
+            yield {"type": "token", "content": answer}
+        else:
+            chunks = []
+            async with self._llm_slot():
+                yield context_event
+
+                generate_start = time.perf_counter()
+                async for chunk in chain.qa_chain.astream({
+                    "input": query,
+                    "context": context,
+                    "chat_history": to_history_messages(chat_history),
+                }, config=self.llm_service.run_config(generate_start)):
+                    if not chunk:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    chunks.append(chunk)
+                    yield {"type": "token", "content": chunk}
+                if self.telemetry.enabled:
+                    self.telemetry.observe("generate", time.perf_counter() - generate_start)
+
+            if key is not None:
+                self.answer_cache.put(key, "".join(chunks), embedding)
+
+        end = time.perf_counter()
+        done = {
+            "type": "done",
+            "cached": cached,
+            "ttft_ms": round(((first_token_at or end) - start) * 1000, 1),
+            "total_ms": round((end - start) * 1000, 1),
+        }
+        if self.telemetry.enabled:
+            # The Server-Timing header went out before most of these finished
+            done["stages_ms"] = self.telemetry.request_timings()
+        yield done
+
+    def _wants_favorites(self, criteria):
+        return "favorite" in criteria.lower() or "favourite" in criteria.lower()
+
+    def _build_search_query(self, criteria, favorite_ingredients):
+        # Check if we're searching based on favorite ingredients
+        if self._wants_favorites(criteria):
             if not favorite_ingredients:
-                return {"recommendations": [], "message": "No favorite ingredients found. Please tell me what ingredients you like first."}
+                return None
 
             # Build query with favorite ingredients
             ingredients_text = ", ".join(favorite_ingredients)
-            search_query = f"cocktails with {ingredients_text}"
+            return f"cocktails with {ingredients_text}"
+
+        # Use criteria directly
+        return criteria
+
+    def _recommendation_plan(self, criteria, exclude=(), exclude_seen=False):
+        """(search query, favorite ingredients, casefolded names to leave out)"""
+        favorite_ingredients = []
+        if self._wants_favorites(criteria):
+            favorite_ingredients = self.get_preferences("ingredients")
+
+        excluded = self._excluded_names(exclude, exclude_seen)
+        return self._build_search_query(criteria, favorite_ingredients), favorite_ingredients, excluded
+
+    def _excluded_names(self, exclude=(), exclude_seen=False):
+        """Casefolded names of cocktails the user already likes or has already been shown"""
+        excluded = {name.casefold() for name in self.get_preferences("cocktails")}
+        excluded.update(name.casefold() for name in exclude or ())
+        if exclude_seen:
+            excluded.update(name.casefold() for name in self.get_preferences("seen_cocktails"))
+        return excluded
+
+    def _unique_candidates(self, docs, excluded):
+        """Docs in rank order, one per cocktail name, skipping excluded names"""
+        seen = set(excluded)
+        unique = []
+        for doc in docs:
+            name = doc.metadata.get("name", "Unknown cocktail").casefold()
+            if name not in seen:
+                seen.add(name)
+                unique.append(doc)
+        return unique
+
+    def _retrieve_candidates(self, search_query, count, excluded, retrieval):
+        """At least count unique, non-excluded docs from the retriever, unless the catalog runs out"""
+        fetch_k = max(count * RECOMMEND_OVERSAMPLE, count + len(excluded))
+        while True:
+            retriever = self._build_retriever((retrieval or RetrievalConfig())._replace(k=fetch_k))
+            docs = retriever.invoke(search_query)
+            candidates = self._unique_candidates(docs, excluded)
+            # Fewer docs than asked for means the catalog is exhausted
+            if len(candidates) >= count or len(docs) < fetch_k or fetch_k >= MAX_RECOMMEND_CANDIDATES:
+                return candidates
+            fetch_k *= 2
+
+    async def _aretrieve_candidates(self, search_query, count, excluded, retrieval):
+        """Async variant of _retrieve_candidates"""
+        fetch_k = max(count * RECOMMEND_OVERSAMPLE, count + len(excluded))
+        while True:
+            retriever = self._build_retriever((retrieval or RetrievalConfig())._replace(k=fetch_k))
+            docs = await retriever.ainvoke(search_query)
+            candidates = self._unique_candidates(docs, excluded)
+            if len(candidates) >= count or len(docs) < fetch_k or fetch_k >= MAX_RECOMMEND_CANDIDATES:
+                return candidates
+            fetch_k *= 2
+
+    def _diversity_similarity(self, pool):
+        """Pairwise embedding similarity of the pool, or None if a vector is missing"""
+        embeddings = self.vector_store_service.get_embeddings([doc.id for doc in pool if doc.id])
+        if len(embeddings) < len(pool):
+            return None
+        return cosine_similarity_matrix([embeddings[doc.id] for doc in pool])
+
+    def _diversify(self, pool, similarity, count, diversity, pinned=0):
+        """MMR over the rank-ordered pool, keeping the first pinned docs while they leave room
+
+        Pinned docs (exact ingredient matches) are all kept when fewer than
+        count, and MMR picks the rest. When they fill the results on their
+        own, MMR chooses among them instead. diversity=0 keeps the ranking as is.
+        """
+        if similarity is None or len(pool) <= count or diversity <= 0:
+            return pool[:count]
+        if pinned >= count:
+            pinned = 0
+        relevance = [1 - rank / len(pool) for rank in range(len(pool))]
+        selected = mmr_select(relevance, similarity, count, lambda_mult=1 - diversity, pinned=pinned)
+        return [pool[i] for i in selected]
+
+    def recommend_cocktails(self, criteria, count=5, retrieval=None, exclude=(),
+                            exclude_seen=False, diversity=RECOMMEND_DIVERSITY, facets=None, facets_from_query=True):
+        """Recommend up to count distinct cocktails for the criteria
+
+        Candidates are oversampled, deduplicated by name and filtered against
+        the exclusions, then reranked with MMR so the results are not all
+        variations of the same drink. The search widens until count cocktails
+        are found or the catalog runs out. Every stage only considers
+        cocktails matching the facet filter. "Drinks like X" criteria are
+        answered from the similarity graph when it has enough neighbors.
+        """
+        if not self.vector_store_service.available:
+            return {"recommendations": [], "message": "No cocktail data available."}
+        retrieval = self._filtered(criteria, retrieval, facets, facets_from_query)
+        similar = self._recommend_similar(criteria, count, exclude, exclude_seen, retrieval.facets)
+        if similar is not None:
+            return similar
+
+        search_query, favorite_ingredients, excluded = self._recommendation_plan(criteria, exclude, exclude_seen)
+        if search_query is None:
+            return NO_FAVORITES_RESULT
+
+        with self.telemetry.stage("ingredient_index"):
+            exact, excluded = self._search_ingredient_index(criteria, favorite_ingredients, excluded, retrieval.facets)
+        candidates = list(exact)
+        if len(candidates) < count:
+            # Top up exact ingredient matches with the nearest other cocktails
+            with self.telemetry.stage("retrieve"):
+                candidates += self._retrieve_candidates(search_query, count - len(candidates), excluded, retrieval)
+
+        pool = candidates[:count * RECOMMEND_OVERSAMPLE]
+        with self.telemetry.stage("diversify"):
+            similarity = self._diversity_similarity(pool) if len(pool) > count else None
+            docs = self._diversify(pool, similarity, count, diversity, pinned=len(exact))
+        return self._format_recommendations(docs, search_query, retrieval.facets)
+
+    async def arecommend_cocktails(self, criteria, count=5, retrieval=None, exclude=(),
+                                   exclude_seen=False, diversity=RECOMMEND_DIVERSITY,
+                                   facets=None, facets_from_query=True):
+        """Async variant of recommend_cocktails"""
+        if not self.vector_store_service.available:
+            return {"recommendations": [], "message": "No cocktail data available."}
+        retrieval = self._filtered(criteria, retrieval, facets, facets_from_query)
+        # Graph lookups are in-memory reads, fine on the event loop
+        similar = self._recommend_similar(criteria, count, exclude, exclude_seen, retrieval.facets)
+        if similar is not None:
+            return similar
+
+        search_query, favorite_ingredients, excluded = self._recommendation_plan(criteria, exclude, exclude_seen)
+        if search_query is None:
+            return NO_FAVORITES_RESULT
+
+        with self.telemetry.stage("ingredient_index"):
+            exact, excluded = self._search_ingredient_index(criteria, favorite_ingredients, excluded, retrieval.facets)
+        candidates = list(exact)
+        if len(candidates) < count:
+            with self.telemetry.stage("retrieve"):
+                candidates += await self._aretrieve_candidates(
+                    search_query, count - len(candidates), excluded, retrieval
+                )
+
+        pool = candidates[:count * RECOMMEND_OVERSAMPLE]
+        with self.telemetry.stage("diversify"):
+            similarity = None
+            if len(pool) > count:
+                # Reading stored vectors is a blocking Chroma call; to_thread keeps the
+                # request's context, so stages timed there reach Server-Timing
+                similarity = await asyncio.to_thread(self._diversity_similarity, pool)
+            docs = self._diversify(pool, similarity, count, diversity, pinned=len(exact))
+        return self._format_recommendations(docs, search_query, retrieval.facets)
+
+    async def arecommend_batch(self, requests):
+        """Answer many recommendation requests together
+
+        Every distinct search query is embedded in one batched call up front;
+        the individual searches then find their query vectors in the
+        embedding cache.
+        """
+        embedding_function = self.vector_store_service.embedding_function
+        if isinstance(embedding_function, CachedEmbeddings):
+            queries = {self._recommendation_plan(request["criteria"])[0] for request in requests}
+            queries.discard(None)
+            if queries:
+                await embedding_function.aembed_documents(sorted(queries))
+
+        return await asyncio.gather(*(self.arecommend_cocktails(**request) for request in requests))
+
+    def _search_ingredient_index(self, criteria, favorite_ingredients, excluded, facets=()):
+        """(exact ingredient matches in rank order, names to leave out of any top-up)
+
+        Favorite ingredients are OR-ed together; otherwise ingredients named in
+        the criteria become AND/OR/NOT constraints. Criteria without any known
+        ingredient return no matches and leave the search to the retriever.
+        A top-up never adds a cocktail that breaks a NOT constraint. Matches
+        are limited to the facet filter.
+        """
+        if self.ingredient_index is None or (facets and self.facet_index is None):
+            return [], excluded
+        within = self.facet_index.bits(facets) if facets else None
+
+        if favorite_ingredients:
+            all_of, any_of, none_of = [], favorite_ingredients, []
         else:
-            # Use criteria directly
-            search_query = criteria
-
-        # Search for similar documents
-        similar_docs = self.vector_store_service.search_similar(search_query, k=count)
-
-        # Extract recommendations from documents
-        recommendations = []
-        for doc in similar_docs:
-            cocktail_name = doc.metadata.get("name", "Unknown cocktail")
-            if cocktail_name not in [rec.get("name") for rec in recommendations]:
-                recommendations.append({
-                    "name": cocktail_name,
-                    "ingredients": doc.metadata.get("ingredients", ""),
-                    "content": doc.page_content
-                })
+            all_of, any_of, none_of = self.ingredient_index.parse_query(criteria)
+            if not (all_of or any_of or none_of):
+                return [], excluded
+
+        exact = self._unique_candidates(self.ingredient_index.query(all_of, any_of, none_of, within=within), excluded)
+        ruled_out = self.ingredient_index.query(any_of=none_of) if none_of else []
+        excluded = excluded | {doc.metadata.get("name", "Unknown cocktail").casefold() for doc in exact + ruled_out}
+        return exact, excluded
 
+    def _graph_neighbors(self, graph, seeds, excluded, facets=()):
+        """[(doc, score), ...] most similar to any seed row, best first, one per name
+
+        Skips the seeds, excluded names and cocktails outside the facet filter.
+        """
+        best = {}
+        for seed in seeds:
+            for row, score in graph.similar(seed):
+                best[row] = max(score, best.get(row, score))
+        seen = set(excluded)
+        seen.update(graph.documents[seed]["metadata"].get("name", "").casefold() for seed in seeds)
+        neighbors = []
+        for row in sorted(best, key=best.get, reverse=True):
+            doc = graph.document(row)
+            name = doc.metadata.get("name", "Unknown cocktail").casefold()
+            if name in seen or not all(doc.metadata.get(facet) in values for facet, values in facets):
+                continue
+            seen.add(name)
+            neighbors.append((doc, best[row]))
+        return neighbors
+
+    def _recommend_similar(self, criteria, count, exclude=(), exclude_seen=False, facets=()):
+        """Recommendations for "drinks like X" read off the similarity graph
+
+        None when there is no graph, the criteria ask for something else, or
+        the graph holds fewer than count acceptable neighbors; the caller
+        then searches as usual. Neighbors come in similarity order, without
+        MMR: the request asks for drinks close to one another.
+        """
+        graph = self.vector_store_service.similarity_graph
+        if graph is None:
+            return None
+        parsed = graph.parse_query(criteria)
+        if parsed is None:
+            return None
+        row, wants_favorites = parsed
+        if wants_favorites:
+            seeds = [graph.row_of(name) for name in self.get_preferences("cocktails")]
+            seeds = [seed for seed in seeds if seed is not None]
+        else:
+            seeds = [row]
+        if not seeds:
+            return None
+
+        with self.telemetry.stage("similarity_graph"):
+            neighbors = self._graph_neighbors(graph, seeds, self._excluded_names(exclude, exclude_seen), facets)
+        if len(neighbors) < count:
+            return None
+        names = ", ".join(graph.documents[seed]["metadata"].get("name", "") for seed in seeds)
+        return self._format_recommendations([doc for doc, _ in neighbors[:count]], f"similarity to {names}", facets)
+
+    def similar_cocktails(self, name, count=10, facets=None):
+        """The cocktails most like the named one with their scores, or None if it is not in the graph"""
+        graph = self.vector_store_service.similarity_graph
+        row = graph.row_of(name) if graph is not None else None
+        if row is None:
+            return None
+        facets = self.facet_index.resolve(facets) if self.facet_index is not None else normalize_facets(facets)
+        neighbors = self._graph_neighbors(graph, [row], set(), facets)
         return {
-            "recommendations": recommendations[:count],
-            "message": f"Here are {len(recommendations[:count])} cocktail recommendations based on {search_query}"
+            "cocktail": graph.documents[row]["metadata"].get("name", name),
+            "similar": [
+                {
+                    "name": doc.metadata.get("name", "Unknown cocktail"),
+                    "ingredients": doc.metadata.get("ingredients", ""),
+                    "score": round(score, 4),
+                }
+                for doc, score in neighbors[:count]
+            ],
+            "facets": dict(facets),
         }
 
-    def _detect_user_preferences(self, query):
-        """Detect user preferences from the query"""
-        # Keywords that indicate preferences
-        favorite_keywords = [
-            "favorite", "favourite", "love", "like", "prefer", "enjoy"
+    def _format_recommendations(self, docs, search_query, facets=()):
+        recommendations = [
+            {
+                "name": doc.metadata.get("name", "Unknown cocktail"),
+                "ingredients": doc.metadata.get("ingredients", ""),
+                "content": doc.page_content
+            }
+            for doc in docs
         ]
 
-        query_lower = query.lower()
-        print(f"Detecting preferences in: {query_lower}")  # Debug log
-
-        # Check if the query contains preference keywords
-        if any(keyword in query_lower for keyword in favorite_keywords):
-            print("Preference keyword detected")  # Debug log
-            # List of common ingredients to detect
-            common_ingredients = [
-                "rum", "vodka", "gin", "tequila", "whiskey", "bourbon",
-                "brandy", "cognac", "lime", "lemon", "orange", "mint",
-                "sugar", "syrup", "juice", "soda", "tonic", "vermouth",
-                "bitters", "grenadine", "cream", "coffee", "chocolate"
-            ]
-
-            # Find mentioned ingredients
-            found_ingredients = []
-            for ingredient in common_ingredients:
-                if ingredient in query_lower:
-                    found_ingredients.append(ingredient)
-                    print(f"Ingredient found: {ingredient}")  # Debug log
-
-            # If ingredients were found, store them
-            if found_ingredients:
-                print(f"Storing preferences: {found_ingredients}")  # Debug log
-                success = self.vector_store_service.store_user_preference("ingredients", found_ingredients)
-                print(f"Storage successful: {success}")  # Debug log
-                return True
-            else:
-                print("No known ingredients found")  # Debug log
+        return {
+            "recommendations": recommendations,
+            "message": f"Here are {len(recommendations)} cocktail recommendations based on {search_query}",
+            "facets": dict(facets)
+        }
+
+    async def asession_history(self, session_id):
+        """Token-budgeted history of a server-side session, read off the event loop"""
+        with self.telemetry.stage("session_history"):
+            return await asyncio.to_thread(self.session_store.history, self.user_id, session_id)
+
+    async def arecord_turn(self, session_id, query, answer):
+        """Append a finished turn to its session and fold overflow into the summary"""
+        needs_summary = await asyncio.to_thread(
+            self.session_store.append_turn, self.user_id, session_id, query, answer
+        )
+        if needs_summary:
+            await self.asummarize_session(session_id)
+
+    async def asummarize_session(self, session_id):
+        """Fold messages that slid out of the history window into the running summary
+
+        Both SQLite calls take a write transaction, so they run in the
+        executor like the other session reads and writes.
+        """
+        summary, pending = await asyncio.to_thread(self.session_store.pending_summary, self.user_id, session_id)
+        if not pending:
+            return
+
+        chain = SUMMARY_PROMPT | self.llm_service.get_llm() | StrOutputParser()
+        try:
+            async with self._llm_slot():
+                with self.telemetry.stage("summarize"):
+                    new_summary = await chain.ainvoke(
+                        self.session_store.summary_inputs(summary, pending),
+                        config=self.llm_service.run_config(time.perf_counter()),
+                    )
+        except ServiceBusyError:
+            # The messages stay pending and are folded in after a later turn
+            return
+        await asyncio.to_thread(
+            self.session_store.fold_summary, self.user_id, session_id, new_summary, len(pending)
+        )
+
+    def get_preferences(self, preference_type):
+        if self.preference_store is None:
+            return []
+        return self.preference_store.get(self.user_id, preference_type)
+
+    def store_preferences(self, preference_type, items):
+        if self.preference_store is None:
+            return []
+        return self.preference_store.add(self.user_id, preference_type, items)
+
+    def record_seen(self, names):
+        """Remember recommended cocktails for exclude_seen, keeping the SEEN_COCKTAILS_WINDOW most recent"""
+        if self.preference_store is None or not names:
+            return []
+        return self.preference_store.add(self.user_id, "seen_cocktails", names, keep_last=SEEN_COCKTAILS_WINDOW)
+
+    def remove_preferences(self, preference_type, items):
+        if self.preference_store is None:
+            return []
+        return self.preference_store.remove(self.user_id, preference_type, items)
+
+    def detect_user_preferences(self, query):
+        """Store the ingredients a message says the user likes or dislikes
+
+        Runs after the response has been sent (see the chat routes), so it
+        never adds to chat latency.
+        """
+        if self.preference_extractor is None:
+            return False
 
-        return False
\ No newline at end of file
+        with self.telemetry.stage("detect_preferences"):
+            likes, dislikes = self.preference_extractor.extract(query)
+            if likes:
+                self.store_preferences("ingredients", likes)
+                self.remove_preferences("disliked_ingredients", likes)
+            if dislikes:
+                self.store_preferences("disliked_ingredients", dislikes)
+                self.remove_preferences("ingredients", dislikes)
+        return bool(likes or dislikes)
@@ -0,0 +1,10 @@
+from typing import NamedTuple
+
+
+class RetrievalConfig(NamedTuple):
+    """How an endpoint retrieves context; hashable so compiled chains can be cached by it"""
+    mode: str = "hybrid"  # "vector", "lexical" or "hybrid"
+    k: int = 4
+    vector_weight: float = 1.0
+    lexical_weight: float = 1.0
+    facets: tuple = ()  # ((facet, (value, ...)), ...) from facet_index.normalize_facets
@@ -0,0 +1,227 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import List, NamedTuple
+
+from langchain_core.prompts import ChatPromptTemplate
+
+# Role markers and separators the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "You maintain a running summary of a conversation between a user and a cocktail advisor. "
+     "Merge the new messages into the summary. Keep names of cocktails, ingredients the user "
+     "likes or dislikes, and open questions. Reply with the updated summary only, at most {max_words} words."),
+    ("human", "Current summary:\n{summary}\n\nNew messages:\n{messages}"),
+])
+
+
+class TokenCounter:
+    """Prompt token counts with tiktoken, estimated when the encoding is unavailable
+
+    tiktoken downloads its encodings on first use; without network access
+    (or a pre-populated TIKTOKEN_CACHE_DIR) this falls back to roughly four
+    characters per token, which is close enough for budgeting.
+    """
+
+    def __init__(self, model="gpt-3.5-turbo"):
+        self.model = model
+        try:
+            import tiktoken
+
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            self._encoding = None
+
+    @property
+    def exact(self):
+        return self._encoding is not None
+
+    def count(self, text):
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return math.ceil(len(text) / 4)
+
+    def count_message(self, content):
+        return self.count(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+class SessionHistory(NamedTuple):
+    messages: List[dict]  # summary (as a system message) followed by the recent window
+    prompt_tokens: int  # tokens this history adds to the prompt
+    full_tokens: int  # tokens the whole conversation would have added
+
+
+class SessionStore:
+    """Conversation sessions in SQLite with a token-budgeted sliding window
+
+    A session keeps the most recent messages that fit, together with a
+    running summary, within max_history_tokens. Older messages slide into
+    a pending list and are folded into the summary by an LLM call made off
+    the request path, so context is condensed instead of dropped.
+    Sessions are scoped to the user that created them.
+    """
+
+    def __init__(self, path, max_history_tokens=1000, max_summary_words=150,
+                 ttl_seconds=7 * 24 * 3600, token_counter=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_history_tokens = max_history_tokens
+        self.max_summary_words = max_summary_words
+        # Room kept for the summary, about 4 tokens per 3 words
+        self.summary_token_allowance = max_summary_words * 4 // 3 + MESSAGE_OVERHEAD_TOKENS
+        self.token_counter = token_counter or TokenCounter()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " user_id TEXT NOT NULL,"
+            " session_id TEXT NOT NULL,"
+            " summary TEXT NOT NULL DEFAULT '',"
+            " messages TEXT NOT NULL DEFAULT '[]',"
+            " pending TEXT NOT NULL DEFAULT '[]',"
+            " full_tokens INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (user_id, session_id))"
+        )
+        self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - ttl_seconds,))
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.tokens_saved = 0
+
+    def _load(self, user_id, session_id):
+        row = self._db.execute(
+            "SELECT summary, messages, pending, full_tokens FROM sessions WHERE user_id = ? AND session_id = ?",
+            (user_id, session_id),
+        ).fetchone()
+        if row is None:
+            return "", [], [], 0
+        summary, messages, pending, full_tokens = row
+        return summary, json.loads(messages), json.loads(pending), full_tokens
+
+    def _save(self, user_id, session_id, summary, messages, pending, full_tokens):
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions"
+            " (user_id, session_id, summary, messages, pending, full_tokens, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, session_id, summary, json.dumps(messages), json.dumps(pending), full_tokens, time.time()),
+        )
+
+    def _summary_message(self, summary):
+        return {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+
+    def history(self, user_id, session_id):
+        """The prompt history for the next turn of a session, with its token accounting"""
+        with self._lock:
+            summary, messages, _, full_tokens = self._load(user_id, session_id)
+            history = [{"role": m["role"], "content": m["content"]} for m in messages]
+            prompt_tokens = sum(m["tokens"] for m in messages)
+            if summary:
+                summary_message = self._summary_message(summary)
+                history.insert(0, summary_message)
+                prompt_tokens += self.token_counter.count_message(summary_message["content"])
+            self.turns += 1
+            self.prompt_tokens += prompt_tokens
+            self.tokens_saved += max(0, full_tokens - prompt_tokens)
+        return SessionHistory(history, prompt_tokens, full_tokens)
+
+    def _transaction(self, user_id, session_id, change):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = change(*self._load(user_id, session_id))
+                self._save(user_id, session_id, *result)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return result
+
+    def _trim(self, summary, messages, pending):
+        """Slide the oldest messages into pending until window and summary fit the budget"""
+        summary_tokens = 0
+        if summary:
+            summary_tokens = self.token_counter.count_message(self._summary_message(summary)["content"])
+        budget = self.max_history_tokens - summary_tokens
+        window_tokens = sum(m["tokens"] for m in messages)
+        if window_tokens > budget or pending:
+            # Once anything overflows, leave room for the summary it will be folded into
+            budget = self.max_history_tokens - max(summary_tokens, self.summary_token_allowance)
+
+        messages, pending = list(messages), list(pending)
+        # Always keep the latest exchange, even if it alone is over budget
+        while len(messages) > 2 and window_tokens > budget:
+            message = messages.pop(0)
+            window_tokens -= message["tokens"]
+            pending.append(message)
+        return messages, pending
+
+    def append_turn(self, user_id, session_id, question, answer):
+        """Add a question and its answer, sliding old messages out of the budget
+
+        Returns True when messages are waiting to be folded into the summary.
+        """
+        new_messages = [
+            {"role": role, "content": content, "tokens": self.token_counter.count_message(content)}
+            for role, content in (("user", question), ("assistant", answer))
+        ]
+
+        def change(summary, messages, pending, full_tokens):
+            messages, pending = self._trim(summary, messages + new_messages, pending)
+            full_tokens += sum(m["tokens"] for m in new_messages)
+            return summary, messages, pending, full_tokens
+
+        _, _, pending, _ = self._transaction(user_id, session_id, change)
+        return bool(pending)
+
+    def pending_summary(self, user_id, session_id):
+        """(current summary, messages waiting to be folded into it)"""
+        with self._lock:
+            summary, _, pending, _ = self._load(user_id, session_id)
+        return summary, pending
+
+    def summary_inputs(self, summary, pending):
+        """Variables for SUMMARY_PROMPT"""
+        return {
+            "summary": summary or "(none yet)",
+            "messages": "\n".join(f"{m['role']}: {m['content']}" for m in pending),
+            "max_words": self.max_summary_words,
+        }
+
+    def fold_summary(self, user_id, session_id, new_summary, folded):
+        """Replace the summary and drop the first `folded` pending messages it now covers"""
+        def change(summary, messages, pending, full_tokens):
+            summary = new_summary.strip()
+            # A summary longer than allowed pushes more of the window out for next time
+            messages, pending = self._trim(summary, messages, pending[folded:])
+            return summary, messages, pending, full_tokens
+
+        self._transaction(user_id, session_id, change)
+
+    def delete(self, user_id, session_id):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE user_id = ? AND session_id = ?", (user_id, session_id))
+
+    def stats(self):
+        return {
+            "turns": self.turns,
+            "prompt_tokens": self.prompt_tokens,
+            "tokens_saved": self.tokens_saved,
+            "tokens_saved_per_turn": self.tokens_saved / self.turns if self.turns else 0.0,
+            "max_history_tokens": self.max_history_tokens,
+            "exact_token_counts": self.token_counter.exact,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
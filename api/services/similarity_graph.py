@@ -0,0 +1,240 @@
+import os
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .ingredient_index import normalize_ingredient, tokenize
+
+NEIGHBORS_NAME = "neighbors.npy"
+NEIGHBOR_SCORES_NAME = "neighbor_scores.npy"
+
+# Neighbors kept per cocktail
+GRAPH_NEIGHBORS = 20
+# Share of embedding similarity in a neighbor's score; the rest is ingredient overlap (Jaccard)
+EMBEDDING_WEIGHT = 0.6
+# Rows scored against the whole catalog at once while building
+BLOCK_ROWS = 512
+# An update touching more than this share of rows rebuilds the graph instead
+FULL_REBUILD_SHARE = 0.5
+
+# "like" after these is a preference ("I like gin"), not a comparison
+NOT_SIMILAR_BEFORE = {"i", "we", "you", "they", "would", "i'd", "we'd", "really"}
+# Words a "drinks like X" request may contain besides the comparison itself; any
+# other word is a constraint the graph cannot honour, so the request is searched
+SIMILAR_FILLER = {
+    "a", "an", "the", "some", "any", "something", "anything", "else", "other", "others", "more",
+    "drink", "drinks", "cocktail", "cocktails", "one", "ones", "recipe", "recipes",
+    "recommend", "suggest", "show", "give", "find", "me", "us", "please", "what", "which", "is", "are",
+    "there", "can", "could", "you", "i", "try", "make", "have", "get", "to", "want", "would", "love",
+}
+FAVORITE_WORDS = {"favorite", "favorites", "favourite", "favourites"}
+
+
+def ingredient_sets(metadatas):
+    """Normalized ingredient set per document, read from the comma-joined `ingredients` metadata"""
+    return [
+        frozenset(filter(None, (normalize_ingredient(item) for item in (metadata or {}).get("ingredients", "").split(","))))
+        for metadata in metadatas
+    ]
+
+
+def name_key(name):
+    return " ".join(tokenize(name))
+
+
+class _Scorer:
+    """Combined similarity between rows: weighted cosine of the unit vectors plus ingredient Jaccard"""
+
+    def __init__(self, matrix, sets, embedding_weight=EMBEDDING_WEIGHT):
+        self.matrix = np.asarray(matrix, dtype=np.float32)
+        self.embedding_weight = embedding_weight
+        vocabulary = {}
+        for ingredients in sets:
+            for ingredient in ingredients:
+                vocabulary.setdefault(ingredient, len(vocabulary))
+        self.ingredients = np.zeros((len(sets), max(1, len(vocabulary))), dtype=np.float32)
+        for row, ingredients in enumerate(sets):
+            self.ingredients[row, [vocabulary[ingredient] for ingredient in ingredients]] = 1
+        self.sizes = self.ingredients.sum(axis=1)
+
+    def __call__(self, rows, columns=None):
+        """Scores of rows (an index array) against columns (all rows by default), -inf against themselves"""
+        columns = np.arange(len(self.matrix)) if columns is None else columns
+        cosine = self.matrix[rows] @ self.matrix[columns].T
+        shared = self.ingredients[rows] @ self.ingredients[columns].T
+        union = self.sizes[rows, np.newaxis] + self.sizes[np.newaxis, columns] - shared
+        jaccard = np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+        scores = self.embedding_weight * cosine + (1 - self.embedding_weight) * jaccard
+        scores[rows[:, np.newaxis] == columns[np.newaxis, :]] = -np.inf
+        return scores
+
+
+def _top(candidates, scores, k):
+    """The k best candidates per row, best first: (neighbors int32, scores float32)"""
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    best = np.take_along_axis(top, order, axis=1)
+    return (np.take_along_axis(candidates, best, axis=1).astype(np.int32),
+            np.take_along_axis(top_scores, order, axis=1).astype(np.float32))
+
+
+def _fill(scorer, rows, neighbors, scores, k):
+    """Recompute the neighbor lists of rows against every row, a block at a time"""
+    columns = np.arange(len(scorer.matrix))
+    for start in range(0, len(rows), BLOCK_ROWS):
+        block = rows[start:start + BLOCK_ROWS]
+        candidates = np.broadcast_to(columns, (len(block), len(columns)))
+        neighbors[block], scores[block] = _top(candidates, scorer(block), k)
+
+
+def build_graph(matrix, sets, k=GRAPH_NEIGHBORS):
+    """(neighbors, scores): the k most similar other rows of every row, best first"""
+    count = len(sets)
+    k = max(0, min(k, count - 1))
+    neighbors = np.zeros((count, k), dtype=np.int32)
+    scores = np.zeros((count, k), dtype=np.float32)
+    if k:
+        _fill(_Scorer(matrix, sets), np.arange(count), neighbors, scores, k)
+    return neighbors, scores
+
+
+def update_graph(previous, previous_rows, matrix, sets, k=GRAPH_NEIGHBORS):
+    """(neighbors, scores, rows recomputed) for a changed collection, reusing the previous graph
+
+    `previous_rows[row]` is the row a document had in the previous graph if
+    it is unchanged, or -1 if it is new or changed. Changed rows and rows
+    that listed a changed or deleted neighbor are recomputed; every other
+    row keeps its list, merged with its scores against the changed rows,
+    which gives the same top k as a full rebuild.
+    """
+    count = len(sets)
+    k = max(0, min(k, count - 1))
+    previous_rows = np.asarray(previous_rows, dtype=np.int64)
+    unchanged = previous_rows >= 0
+    if previous is None or previous.width != k or not k:
+        return (*build_graph(matrix, sets, k), count)
+
+    # Previous row -> current row for documents that are still the same
+    current_rows = np.full(len(previous), -1, dtype=np.int64)
+    current_rows[previous_rows[unchanged]] = np.flatnonzero(unchanged)
+    kept = np.zeros(count, dtype=bool)
+    kept[unchanged] = (current_rows[previous.neighbors[previous_rows[unchanged]]] >= 0).all(axis=1)
+    recompute = np.flatnonzero(~kept)
+    if len(recompute) > FULL_REBUILD_SHARE * count:
+        return (*build_graph(matrix, sets, k), count)
+
+    scorer = _Scorer(matrix, sets)
+    neighbors = np.zeros((count, k), dtype=np.int32)
+    scores = np.zeros((count, k), dtype=np.float32)
+    _fill(scorer, recompute, neighbors, scores, k)
+
+    changed = np.flatnonzero(~unchanged)
+    merged = np.flatnonzero(kept)
+    for start in range(0, len(merged), BLOCK_ROWS):
+        block = merged[start:start + BLOCK_ROWS]
+        old = previous_rows[block]
+        candidates = np.concatenate([
+            current_rows[previous.neighbors[old]],
+            np.broadcast_to(changed, (len(block), len(changed))),
+        ], axis=1)
+        candidate_scores = np.concatenate([previous.scores[old], scorer(block, changed)], axis=1)
+        neighbors[block], scores[block] = _top(candidates, candidate_scores, k)
+    return neighbors, scores, len(recompute)
+
+
+def save_graph(directory, neighbors, scores):
+    np.save(os.path.join(directory, NEIGHBORS_NAME), np.ascontiguousarray(neighbors, dtype=np.int32))
+    np.save(os.path.join(directory, NEIGHBOR_SCORES_NAME), np.ascontiguousarray(scores, dtype=np.float32))
+
+
+class SimilarityGraph:
+    """Precomputed most similar cocktails of every snapshot row
+
+    Row i of `neighbors` holds the rows of the documents most similar to
+    row i, best first, and the same row of `scores` their combined
+    embedding and ingredient similarity. Both arrays are memory-mapped, so
+    answering "drinks like X" is one name lookup and one row read.
+    """
+
+    def __init__(self, neighbors, scores, documents):
+        self.neighbors = neighbors
+        self.scores = scores
+        self.documents = documents
+        self._row_by_name = None
+
+    @classmethod
+    def load(cls, directory, documents):
+        """The graph stored in a snapshot version directory, or None if it has none"""
+        try:
+            neighbors = np.load(os.path.join(directory, NEIGHBORS_NAME), mmap_mode="r")
+            scores = np.load(os.path.join(directory, NEIGHBOR_SCORES_NAME), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if neighbors.shape != scores.shape or len(neighbors) != len(documents):
+            return None
+        return cls(neighbors, scores, documents)
+
+    def __len__(self):
+        return len(self.neighbors)
+
+    @property
+    def width(self):
+        return self.neighbors.shape[1]
+
+    def row_of(self, name):
+        """Row of the cocktail with this name (ignoring case and punctuation), or None"""
+        if self._row_by_name is None:
+            row_by_name = {}
+            for row, doc in enumerate(self.documents):
+                row_by_name.setdefault(name_key(doc["metadata"].get("name", "")), row)
+            self._row_by_name = row_by_name
+        return self._row_by_name.get(name_key(name))
+
+    def similar(self, row, k=None):
+        """[(row, score), ...] of the cocktails most similar to row, best first"""
+        neighbors = self.neighbors[row, :k]
+        return list(zip(neighbors.tolist(), self.scores[row, :k].tolist()))
+
+    def document(self, row):
+        stored = self.documents[row]
+        return Document(id=stored["id"], page_content=stored["page_content"], metadata=dict(stored["metadata"]))
+
+    def parse_query(self, text):
+        """(row, False) for "drinks like <cocktail>", (None, True) for "like my favorites", else None
+
+        Only requests that ask for nothing but the comparison qualify, e.g.
+        "something like a Negroni"; "like a Negroni but sweeter" does not.
+        """
+        words = tokenize(text)
+        for start, word in enumerate(words):
+            if word == "like" and (start == 0 or words[start - 1] not in NOT_SIMILAR_BEFORE):
+                after = start + 1
+            elif word == "resembling":
+                after = start + 1
+            elif word == "similar" and words[start + 1:start + 2] == ["to"]:
+                after = start + 2
+            else:
+                continue
+            while after < len(words) and words[after] in ("a", "an", "the"):
+                after += 1
+            found = self._match_after(words, after)
+            if found is None:
+                continue
+            end, parsed = found
+            if all(other in SIMILAR_FILLER for other in words[:start] + words[end:]):
+                return parsed
+        return None
+
+    def _match_after(self, words, start):
+        """(end, parsed) for the longest cocktail name or "my favorite(s)" starting at start"""
+        if words[start:start + 1] == ["my"] and words[start + 1:start + 2] and words[start + 1] in FAVORITE_WORDS:
+            return start + 2, (None, True)
+        for end in range(len(words), start, -1):
+            row = self.row_of(" ".join(words[start:end]))
+            if row is not None:
+                return end, (row, False)
+        return None
@@ -0,0 +1,226 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Upper bounds, in seconds, of the per-stage latency histogram buckets
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_PREFIX = "cocktail_"
+
+COUNTER_HELP = {
+    "llm_tokens_total": "LLM tokens reported by the provider, by model and type",
+    "llm_errors_total": "LLM calls that raised, by model",
+    "llm_retries_total": "LLM calls retried after a transient error, by model",
+    "llm_fallbacks_total": "LLM calls sent to the fallback model, by primary model and reason",
+    "requests_coalesced_total": "Chat requests answered by joining an identical request in flight",
+}
+
+# Stage durations of the request being handled, for its Server-Timing header
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+# Shared by every stage while telemetry is disabled
+NULL_STAGE = nullcontext()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+class Telemetry:
+    """Per-stage latency, token and cache metrics, with optional OpenTelemetry spans
+
+    Deliberately free of langchain imports, so the API module loads quickly.
+
+    Stages are timed into a Prometheus histogram, added up per request for
+    the Server-Timing header, and opened as spans when a tracer is set.
+    Disabled telemetry hands out one shared no-op context manager, so an
+    instrumented hot path costs a method call.
+    """
+
+    def __init__(self, enabled=True, tracer=None):
+        self.enabled = enabled
+        self.tracer = tracer
+        self._lock = threading.Lock()
+        self._stages = {}  # stage -> (bucket counts, then +Inf) and [sum]
+        self._counters = {}  # (metric, sorted label pairs) -> value
+        self._collectors = []
+
+    def stage(self, name):
+        """Context manager timing one stage of the current request"""
+        if not self.enabled:
+            return NULL_STAGE
+        return _Stage(self, name)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            series = self._stages.get(stage)
+            if series is None:
+                series = self._stages[stage] = ([0] * (len(STAGE_BUCKETS) + 1), [0.0])
+            counts, total = series
+            for i, bound in enumerate(STAGE_BUCKETS):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += seconds
+
+        # Threads see the request only when started with its context, e.g. by
+        # asyncio.to_thread; plain run_in_executor work lands in the histogram alone
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+    def count(self, metric, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def count_tokens(self, model, prompt_tokens, completion_tokens):
+        self.count("llm_tokens_total", prompt_tokens, model=model, type="prompt")
+        self.count("llm_tokens_total", completion_tokens, model=model, type="completion")
+
+    def add_collector(self, collector):
+        """Register a function returning (name, type, help, [(labels, value)]) tuples at scrape time
+
+        Used for values other services already keep, such as cache hit counts.
+        """
+        self._collectors.append(collector)
+
+    @contextmanager
+    def request(self):
+        """Collect the stage durations of one request; yields the {stage: seconds} dict"""
+        stages = {}
+        token = _request_stages.set(stages)
+        try:
+            yield stages
+        finally:
+            _request_stages.reset(token)
+
+    def request_timings(self):
+        """{stage: milliseconds} so far for the current request"""
+        stages = _request_stages.get() or {}
+        return {stage: round(seconds * 1000, 1) for stage, seconds in stages.items()}
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            stages = {stage: (list(counts), total[0]) for stage, (counts, total) in self._stages.items()}
+            counters = dict(self._counters)
+
+        name = METRIC_PREFIX + "stage_duration_seconds"
+        lines += [f"# HELP {name} Time spent per request stage", f"# TYPE {name} histogram"]
+        for stage, (counts, total) in sorted(stages.items()):
+            cumulative = 0
+            for bound, count in zip(STAGE_BUCKETS + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {cumulative}')
+
+        by_metric = {}
+        for (metric, labels), value in counters.items():
+            by_metric.setdefault(metric, []).append((labels, value))
+        families = [
+            (metric, "counter", COUNTER_HELP.get(metric, metric), samples) for metric, samples in by_metric.items()
+        ]
+        for collector in self._collectors:
+            families += [
+                (metric, kind, help_text, [(tuple(sorted(labels.items())), value) for labels, value in samples])
+                for metric, kind, help_text, samples in collector()
+            ]
+
+        for metric, kind, help_text, samples in sorted(families, key=lambda family: family[0]):
+            name = METRIC_PREFIX + metric
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_format_labels(labels)} {value}" for labels, value in sorted(samples)]
+        return "\n".join(lines) + "\n"
+
+
+class _Stage:
+    __slots__ = ("telemetry", "name", "span", "start")
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.name = name
+        self.span = None
+
+    def __enter__(self):
+        if self.telemetry.tracer is not None:
+            self.span = self.telemetry.tracer.start_as_current_span(self.name)
+            self.span.__enter__()
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.telemetry.observe(self.name, time.perf_counter() - self.start)
+        if self.span is not None:
+            self.span.__exit__(exc_type, exc, traceback)
+
+
+# Default for services created without telemetry
+DISABLED = Telemetry(enabled=False)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware adding a Server-Timing header with the request's stage durations
+
+    Streaming responses send their headers first, so they only report the
+    stages finished by then; the stream's final event carries the rest.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        container = getattr(scope.get("app").state, "container", None) if scope["type"] == "http" else None
+        telemetry = getattr(container, "telemetry", None)
+        if telemetry is None or not telemetry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        with telemetry.request() as stages:
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    timings = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages.items()]
+                    timings.append(f"total;dur={(time.perf_counter() - start) * 1000:.1f}")
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", ", ".join(timings).encode("latin-1")))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
+
+
+def setup_tracing(app, service_name="cocktail-advisor", endpoint=None):
+    """Export spans over OTLP and instrument the FastAPI app; returns a tracer, or None
+
+    The OpenTelemetry SDK is imported here so the API runs without it when
+    tracing is off.
+    """
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        return None
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    exporter = OTLPSpanExporter(endpoint=endpoint) if endpoint else OTLPSpanExporter()
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    FastAPIInstrumentor.instrument_app(app, tracer_provider=provider, excluded_urls="metrics,healthz,readyz")
+    return trace.get_tracer("cocktail-advisor")
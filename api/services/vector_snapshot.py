@@ -0,0 +1,329 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from .facet_index import FacetIndex
+from .similarity_graph import (
+    EMBEDDING_WEIGHT, GRAPH_NEIGHBORS, SimilarityGraph, ingredient_sets, save_graph, update_graph,
+)
+from .telemetry import DISABLED
+
+SNAPSHOT_DIRNAME = "snapshot"
+VERSIONS_DIRNAME = "versions"
+# Holds the name of the version workers serve; replaced atomically to swap or roll back
+CURRENT_NAME = "CURRENT"
+MANIFEST_NAME = "manifest.json"
+VECTORS_NAME = "vectors.npy"
+SNAPSHOT_VERSION = 1
+
+# Rows read from Chroma per call while exporting
+EXPORT_PAGE_SIZE = 5000
+# Versions kept on disk for rollback, besides the current one
+SNAPSHOT_KEEP = 5
+# Distinct facet filters whose matching rows are kept per snapshot
+FACET_ROWS_CACHE_SIZE = 256
+
+
+def collection_fingerprint(ids, metadatas):
+    """Hash of the collection's IDs and content hashes; changes whenever a row does"""
+    digest = hashlib.sha256()
+    for doc_id, content_hash in sorted(zip(ids, ((m or {}).get("content_hash", "") for m in metadatas))):
+        digest.update(f"{doc_id}:{content_hash}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _replace_file(path, write):
+    """Write a file next to path and rename it over path, so readers never see it half-written"""
+    with open(path + ".partial", "w") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".partial", path)
+
+
+def list_versions(directory):
+    """Exported snapshot versions, oldest first"""
+    versions_dir = os.path.join(directory, VERSIONS_DIRNAME)
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(versions_dir)
+        if os.path.isfile(os.path.join(versions_dir, name, MANIFEST_NAME))
+    )
+
+
+def current_version(directory):
+    """The version workers should serve, or None before the first export"""
+    try:
+        with open(os.path.join(directory, CURRENT_NAME)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def activate_version(directory, version):
+    """Point CURRENT at an exported version; workers swap to it on their next refresh"""
+    if version not in list_versions(directory):
+        raise ValueError(f"No snapshot version {version!r} in {directory}")
+    _replace_file(os.path.join(directory, CURRENT_NAME), lambda f: f.write(version + "\n"))
+
+
+def prune_versions(directory, keep=SNAPSHOT_KEEP):
+    """Delete all but the newest `keep` versions, never the current one
+
+    Workers still mapping a deleted matrix keep reading it until they swap.
+    """
+    current = current_version(directory)
+    old = [version for version in list_versions(directory) if version != current]
+    for version in old[:max(0, len(old) - keep)]:
+        shutil.rmtree(os.path.join(directory, VERSIONS_DIRNAME, version), ignore_errors=True)
+
+
+def _graph_settings(k):
+    return {"neighbors": k, "embedding_weight": EMBEDDING_WEIGHT}
+
+
+def _previous_rows(previous, ids, metadatas):
+    """Row of each document in the previous snapshot if its content is unchanged there, else -1"""
+    rows = []
+    for doc_id, metadata in zip(ids, metadatas):
+        row = previous.row_by_id.get(doc_id, -1)
+        if row >= 0 and previous.documents[row]["metadata"].get("content_hash") != (metadata or {}).get("content_hash"):
+            row = -1
+        rows.append(row)
+    return rows
+
+
+def export_snapshot(vector_store, directory, embedding_model, keep=SNAPSHOT_KEEP, graph_neighbors=GRAPH_NEIGHBORS):
+    """Write a Chroma collection as a new immutable snapshot version and make it current
+
+    A version is a directory holding a normalized float32 matrix
+    (vectors.npy), the cocktail similarity graph (see similarity_graph) and
+    a JSON manifest with the IDs, texts and metadata row by row. It is
+    written under a temporary name, renamed into versions/ complete and
+    never modified afterwards; CURRENT is switched to it last. The graph is
+    updated from the current version's for the rows that changed. An export
+    of an unchanged collection reuses the current version. Returns the
+    version name.
+    """
+    collection = vector_store._collection
+    ids, texts, metadatas, vectors = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"],
+                              limit=EXPORT_PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        ids += page["ids"]
+        texts += page["documents"]
+        metadatas += page["metadatas"]
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+
+    fingerprint = collection_fingerprint(ids, metadatas)
+    current = VectorSnapshot.load(directory)
+    graph_settings = _graph_settings(graph_neighbors)
+    same_model = current is not None and current.embedding_model == embedding_model
+    if (same_model and current.fingerprint == fingerprint
+            and current.graph is not None and current.graph_settings == graph_settings):
+        return current.version
+
+    matrix = normalize_rows(np.concatenate(vectors)) if vectors else np.zeros((0, 0), dtype=np.float32)
+    version = f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{fingerprint[:12]}"
+    final_dir = os.path.join(directory, VERSIONS_DIRNAME, version)
+    if not os.path.isdir(final_dir):
+        staging_dir = final_dir + ".partial"
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+        with open(os.path.join(staging_dir, VECTORS_NAME), "wb") as f:
+            np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+        # Only rows whose content changed since the current version are scored against the catalog again
+        reusable = same_model and current.graph is not None and current.graph_settings == graph_settings
+        neighbors, scores, recomputed = update_graph(
+            current.graph if reusable else None,
+            _previous_rows(current, ids, metadatas) if reusable else [-1] * len(ids),
+            matrix, ingredient_sets(metadatas), graph_neighbors,
+        )
+        save_graph(staging_dir, neighbors, scores)
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "embedding_model": embedding_model,
+            "fingerprint": fingerprint,
+            "count": len(ids),
+            "dimension": int(matrix.shape[1]) if len(ids) else 0,
+            "graph": {**graph_settings, "recomputed": recomputed},
+            "documents": [
+                {"id": doc_id, "page_content": text, "metadata": metadata or {}}
+                for doc_id, text, metadata in zip(ids, texts, metadatas)
+            ],
+        }
+        with open(os.path.join(staging_dir, MANIFEST_NAME), "w") as f:
+            json.dump(manifest, f)
+        os.replace(staging_dir, final_dir)
+
+    activate_version(directory, version)
+    prune_versions(directory, keep)
+    return version
+
+
+class VectorSnapshot:
+    """Read-only, memory-mapped copy of the collection with exact top-k search
+
+    The matrix is mapped rather than read, so every worker on a machine
+    shares the same pages through the OS page cache. Rows are normalized at
+    export time, so a query's cosine similarity to every document is one
+    matrix-vector product, and argpartition picks the top k without sorting
+    the whole corpus. For the unit-length vectors every embedding provider
+    here returns, that ranks exactly as Chroma's L2 distance would.
+    """
+
+    def __init__(self, matrix, documents, embedding_model=None, fingerprint=None, version=None,
+                 graph=None, graph_info=None):
+        self.matrix = matrix
+        self.documents = documents
+        self.embedding_model = embedding_model
+        self.fingerprint = fingerprint
+        self.version = version
+        self.graph = graph
+        # The graph's parameters and how many rows its export recomputed
+        self.graph_info = graph_info or {}
+        self.row_by_id = {doc["id"]: row for row, doc in enumerate(documents)}
+        self._facet_index = None
+        self._facet_rows = {}
+
+    @classmethod
+    def load(cls, directory, version=None):
+        """A snapshot version (the current one by default), or None if there is none or it is invalid"""
+        version = version or current_version(directory)
+        if version is None:
+            return None
+        version_dir = os.path.join(directory, VERSIONS_DIRNAME, version)
+        try:
+            with open(os.path.join(version_dir, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+            matrix = np.load(os.path.join(version_dir, VECTORS_NAME), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != SNAPSHOT_VERSION or matrix.shape[0] != len(manifest.get("documents", ())):
+            return None
+        documents = manifest["documents"]
+        graph_info = dict(manifest.get("graph") or {})
+        graph = SimilarityGraph.load(version_dir, documents) if graph_info else None
+        return cls(matrix, documents, manifest.get("embedding_model"), manifest.get("fingerprint"), version,
+                   graph, graph_info)
+
+    def __len__(self):
+        return len(self.documents)
+
+    @property
+    def graph_settings(self):
+        return {key: self.graph_info[key] for key in ("neighbors", "embedding_weight") if key in self.graph_info}
+
+    def facet_rows(self, filters):
+        """Rows matching a normalized facet filter, as an index array (cached per filter)"""
+        rows = self._facet_rows.get(filters)
+        if rows is None:
+            if self._facet_index is None:
+                self._facet_index = FacetIndex([doc["metadata"] for doc in self.documents])
+            rows = np.fromiter(self._facet_index.positions(filters), dtype=np.int64)
+            if len(self._facet_rows) >= FACET_ROWS_CACHE_SIZE:
+                self._facet_rows.clear()
+            self._facet_rows[filters] = rows
+        return rows
+
+    def search(self, query_vectors, k, rows=None):
+        """[(row, score), ...] best first, for one query vector or a list of them
+
+        A list of queries is answered with one matrix product and returns one
+        result list per query. With `rows` (e.g. from facet_rows) only those
+        rows are scored.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        single = queries.ndim == 1
+        queries = normalize_rows(np.atleast_2d(queries))
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        k = min(k, len(matrix))
+        if k <= 0:
+            return [] if single else [[] for _ in queries]
+
+        if single:
+            scores = (matrix @ queries[0])[np.newaxis]
+        else:
+            scores = queries @ matrix.T
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        best = np.take_along_axis(top, order, axis=1)
+        if rows is not None:
+            best = rows[best]
+        results = [
+            list(zip(row.tolist(), score.tolist()))
+            for row, score in zip(best, np.take_along_axis(top_scores, order, axis=1))
+        ]
+        return results[0] if single else results
+
+    def document(self, row):
+        stored = self.documents[row]
+        return Document(id=stored["id"], page_content=stored["page_content"], metadata=dict(stored["metadata"]))
+
+    def embeddings(self, ids):
+        """Map IDs present in the snapshot to their (normalized) vectors"""
+        return {doc_id: self.matrix[self.row_by_id[doc_id]] for doc_id in ids if doc_id in self.row_by_id}
+
+
+class SnapshotRetriever(BaseRetriever):
+    """Exact vector retriever over a VectorSnapshot
+
+    batch() and abatch() embed all queries in one call and score them with
+    a single matrix product.
+    """
+
+    snapshot: Any
+    embedding_function: Any
+    k: int = 4
+    # Rows a facet filter allows, None for all
+    rows: Any = None
+    telemetry: Any = DISABLED
+
+    def _documents(self, hits):
+        return [self.snapshot.document(row) for row, _ in hits]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        with self.telemetry.stage("vector_search"):
+            vector = self.embedding_function.embed_query(query)
+            return self._documents(self.snapshot.search(vector, self.k, self.rows))
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        with self.telemetry.stage("vector_search"):
+            # A cached query vector comes back without leaving the event loop
+            vector = await self.embedding_function.aembed_query(query)
+            return self._documents(self.snapshot.search(vector, self.k, self.rows))
+
+    def batch(self, inputs, config=None, **kwargs):
+        if not inputs:
+            return []
+        with self.telemetry.stage("vector_search"):
+            vectors = self.embedding_function.embed_documents(list(inputs))
+            return [self._documents(hits) for hits in self.snapshot.search(vectors, self.k, self.rows)]
+
+    async def abatch(self, inputs, config=None, **kwargs):
+        if not inputs:
+            return []
+        with self.telemetry.stage("vector_search"):
+            vectors = await self.embedding_function.aembed_documents(list(inputs))
+            return [self._documents(hits) for hits in self.snapshot.search(vectors, self.k, self.rows)]
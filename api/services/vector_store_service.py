@@ -1,113 +1,328 @@
 import os
+from typing import Any
+
+from filelock import FileLock
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.vectorstores import VectorStoreRetriever
+
+from .embedding_cache import embedding_model_id
+from .embedding_providers import create_embeddings
+from .facet_index import facet_where
+from .telemetry import DISABLED
+from .vector_snapshot import (
+    SNAPSHOT_DIRNAME, SnapshotRetriever, VectorSnapshot, collection_fingerprint, current_version, export_snapshot,
+)
+
+# Collection metadata key recording which model produced the stored vectors
+EMBEDDING_MODEL_KEY = "embedding_model"
+
+
+class EmbeddingModelMismatchError(RuntimeError):
+    """The collection was built with a different embedding model than the one configured"""
+
+
+class ReadOnlyVectorStoreError(RuntimeError):
+    """A write was attempted on a service serving snapshots only"""
+
+
+def writer_lock(persist_directory):
+    """Inter-process lock held by whoever writes the collection or its snapshots
+
+    One instance per path and process, reentrant, so a script can hold it
+    while opening the store and the service's own writes take it again. It
+    lives next to the persist directory rather than in it, so taking it
+    never makes a missing store look present.
+    """
+    return FileLock(os.path.normpath(persist_directory) + ".lock", is_singleton=True)
+
+
+class TimedVectorStoreRetriever(VectorStoreRetriever):
+    """Vector retriever recording each search, query embedding included, as the vector_search stage"""
+
+    telemetry: Any = None
+
+    def _get_relevant_documents(self, query, *, run_manager, **kwargs):
+        with self.telemetry.stage("vector_search"):
+            return super()._get_relevant_documents(query, run_manager=run_manager, **kwargs)
+
+    async def _aget_relevant_documents(self, query, *, run_manager, **kwargs):
+        with self.telemetry.stage("vector_search"):
+            return await super()._aget_relevant_documents(query, run_manager=run_manager, **kwargs)
+
 
 class VectorStoreService:
-    def __init__(self, persist_directory='db'):
+    """The cocktail collection in Chroma, searched through a memory-mapped snapshot when possible
+
+    `snapshot_max_docs` is the largest corpus served from the exported
+    snapshot (see export_snapshot), facet-filtered searches included;
+    bigger corpora and stale or missing snapshots go to Chroma. 0 never
+    uses a snapshot.
+
+    With `read_only`, Chroma is never opened: searches are served from the
+    current snapshot version alone, whatever its size, writes raise
+    ReadOnlyVectorStoreError, and refresh_snapshot() swaps to a newly
+    activated version. Writes in the default mode take the writer lock, so
+    processes sharing the directory write one at a time.
+
+    `similarity_graph` is the current version's cocktail similarity graph
+    whenever that version matches the collection, whatever its size.
+    """
+
+    def __init__(self, persist_directory='db', embedding_function=None, telemetry=None,
+                 snapshot_max_docs=0, snapshot_directory=None, read_only=False):
         self.persist_directory = persist_directory
-        self.embedding_function = OpenAIEmbeddings()
+        self.telemetry = telemetry or DISABLED
+        self.snapshot_max_docs = snapshot_max_docs
+        self.snapshot_directory = snapshot_directory or os.path.join(persist_directory, SNAPSHOT_DIRNAME)
+        self.read_only = read_only
+        self.snapshot = None
+        self.similarity_graph = None
+        self._loaded_version = None
+        self._writer = None if read_only else writer_lock(persist_directory)
+        self.embedding_function = embedding_function or create_embeddings()
+        # Cached embeddings report the model they wrap
+        self.embedding_model = (
+            getattr(self.embedding_function, "model_id", None) or embedding_model_id(self.embedding_function)
+        )
+        self._reload_callbacks = []
         self.vector_store = self._load_or_create_vector_store()
+        self.snapshot, self.similarity_graph = self._load_snapshot()
 
-    def _load_or_create_vector_store(self):
-        if os.path.exists(os.path.join(self.persist_directory)):
-            return Chroma(
-                persist_directory=self.persist_directory,
-                embedding_function=self.embedding_function,
+    @property
+    def available(self):
+        """Whether there is anything to search"""
+        return self.vector_store is not None or self.snapshot is not None
+
+    def writer(self):
+        """The writer lock, for callers grouping several writes (e.g. an ingest and its export)
+
+        Reentrant, so the write methods taking it as well is fine.
+        """
+        self._check_writable()
+        return self._writer
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ReadOnlyVectorStoreError(
+                f"Vector store at {self.persist_directory} is served read-only from snapshots"
             )
+
+    def _load_or_create_vector_store(self, create=False):
+        if self.read_only:
+            return None
+        if create or os.path.exists(os.path.join(self.persist_directory)):
+            with self.telemetry.stage("vector_store_open"):
+                return self._check_embedding_model(Chroma(
+                    persist_directory=self.persist_directory,
+                    embedding_function=self.embedding_function,
+                ))
         return None
 
-    def add_documents(self, documents):
-        if self.vector_store:
-            self.vector_store.add_documents(documents)
-        else:
-            self.vector_store = Chroma.from_documents(
-                documents=documents,
-                embedding=self.embedding_function,
-                persist_directory=self.persist_directory,
+    def _check_embedding_model(self, vector_store):
+        """Refuse a collection whose vectors came from another embedding model"""
+        stored_model = (vector_store._collection.metadata or {}).get(EMBEDDING_MODEL_KEY)
+        if stored_model is None:
+            stored_model = self._adopt_embedding_model(vector_store)
+        if stored_model != self.embedding_model:
+            raise EmbeddingModelMismatchError(
+                f"Vector store at {self.persist_directory} was built with {stored_model}, "
+                f"but the configured embedding model is {self.embedding_model}. "
+                "Switch the embedding provider back or rebuild the store in a new directory."
             )
-        return self.vector_store
+        return vector_store
 
-    def get_retriever(self):
-        if self.vector_store:
-            return self.vector_store.as_retriever()
-        return None
+    def _adopt_embedding_model(self, vector_store):
+        """Record the current model on a collection that has none yet; returns the recorded model
 
-    def search_similar(self, query, k=5):
-        if self.vector_store:
-            return self.vector_store.similarity_search(query, k=k)
-        return []
+        New collections, and ones created before the model was recorded,
+        adopt it. This writes the collection, so it takes the writer lock
+        and re-reads the metadata under it, in case another process got there first.
+        """
+        with self._writer:
+            collection = vector_store._client.get_collection(vector_store._collection.name)
+            metadata = collection.metadata or {}
+            stored_model = metadata.get(EMBEDDING_MODEL_KEY)
+            if stored_model is None:
+                metadata = {key: value for key, value in metadata.items() if not key.startswith("hnsw:")}
+                vector_store._collection.modify(metadata={**metadata, EMBEDDING_MODEL_KEY: self.embedding_model})
+                stored_model = self.embedding_model
+        return stored_model
 
-    def store_user_preference(self, preference_type, content):
-        """Store user preferences in the vector store"""
-        if not self.vector_store:
-            self.vector_store = self._load_or_create_vector_store()
-            if not self.vector_store:
-                # If we don't have a vector store yet, create an empty one
-                self.vector_store = Chroma.from_documents(
-                    documents=[],
-                    embedding=self.embedding_function,
-                    persist_directory=self.persist_directory,
-                )
-                print("Creating new vector store for preferences")
+    def _load_snapshot(self):
+        """(snapshot to search, if enabled, current and small enough to brute-force; its similarity graph)
 
-        # Create a document for each preference
-        from langchain_core.documents import Document
+        Records the CURRENT version it looked at, served or not, so
+        refresh_snapshot() only reloads when CURRENT moves again.
+        """
+        self._loaded_version = version = current_version(self.snapshot_directory)
+        if version is None:
+            return None, None
+        if self.read_only:
+            snapshot = VectorSnapshot.load(self.snapshot_directory, version)
+            if snapshot is None:
+                return None, None
+            if snapshot.embedding_model != self.embedding_model:
+                raise EmbeddingModelMismatchError(
+                    f"Snapshot {snapshot.version} in {self.snapshot_directory} was built with "
+                    f"{snapshot.embedding_model}, but the configured embedding model is {self.embedding_model}."
+                )
+            return snapshot, snapshot.graph
+        if self.vector_store is None:
+            return None, None
+        snapshot = VectorSnapshot.load(self.snapshot_directory, version)
+        if snapshot is None or snapshot.embedding_model != self.embedding_model:
+            return None, None
+        # A snapshot exported before the last write to the collection is stale
+        stored = self.vector_store._collection.get(include=["metadatas"])
+        if snapshot.fingerprint != collection_fingerprint(stored["ids"], stored["metadatas"]):
+            return None, None
+        if not self.snapshot_max_docs or len(snapshot) > self.snapshot_max_docs:
+            return None, snapshot.graph
+        return snapshot, snapshot.graph
 
-        # Convert content list to string (ChromaDB doesn't accept lists as values)
-        content_str = ", ".join(content)
+    def export_snapshot(self):
+        """Write the collection as a new snapshot version and make it current; returns the version"""
+        with self.writer():
+            if not self.vector_store:
+                return None
+            return export_snapshot(self.vector_store, self.snapshot_directory, self.embedding_model)
 
-        # Check if a preference document already exists
-        existing_docs = self.vector_store.get(
-            where={"preference_type": preference_type}
-        )
+    def refresh_snapshot(self):
+        """Swap to the current snapshot version if another process activated a new one
 
-        if existing_docs and len(existing_docs['documents']) > 0:
-            # Get existing preferences as string
-            existing_content_str = existing_docs['metadatas'][0].get('content_str', "")
+        Cheap enough to poll: it reads the CURRENT pointer and only loads
+        anything when it differs from the version last loaded, whether or
+        not that one is served (it may be stale, too big or rolled back).
+        Returns True after a swap.
+        """
+        version = current_version(self.snapshot_directory)
+        if version is None or version == self._loaded_version:
+            return False
+        if self.read_only:
+            snapshot, similarity_graph = self._load_snapshot()
+            if snapshot is None:
+                return False
+            self.snapshot, self.similarity_graph = snapshot, similarity_graph
+            self._notify_reload()
+        else:
+            # A new export follows writes to Chroma, which the open handle should see too
+            self.reload()
+        return True
 
-            # Convert back to list, add new items and remove duplicates
-            existing_content = existing_content_str.split(", ") if existing_content_str else []
-            updated_content = list(set(existing_content + content))
+    def get_content_hashes(self, source):
+        """Map stored document IDs of a source to their recorded content hash"""
+        if not self.vector_store:
+            return {}
+        stored = self.vector_store.get(where={"source": source}, include=["metadatas"])
+        return {
+            doc_id: (metadata or {}).get("content_hash")
+            for doc_id, metadata in zip(stored["ids"], stored["metadatas"])
+        }
 
-            # Convert back to string
-            updated_content_str = ", ".join(updated_content)
+    def get_embeddings(self, ids):
+        """Map stored document IDs to their embedding vectors"""
+        if not self.available or not ids:
+            return {}
+        if self.snapshot is not None:
+            found = self.snapshot.embeddings(ids)
+            if len(found) == len(set(ids)) or self.read_only:
+                return found
+        stored = self.vector_store._collection.get(ids=list(ids), include=["embeddings"])
+        return dict(zip(stored["ids"], stored["embeddings"]))
 
-            # Remove existing document
-            self.vector_store.delete(
-                where={"preference_type": preference_type}
+    def upsert_embedded(self, ids, texts, metadatas, embeddings):
+        """Insert or replace documents whose embeddings were computed by the caller"""
+        with self.writer():
+            if not self.vector_store:
+                self.vector_store = self._load_or_create_vector_store(create=True)
+            self.vector_store._collection.upsert(
+                ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings
             )
+        # Searches see the write right away; the snapshot is current again after the next export
+        self.snapshot = None
+        self.similarity_graph = None
+        self._notify_reload()
 
-            # Update content string
-            content_str = updated_content_str
-
-        # Create document
-        doc = Document(
-            page_content=f"User preference - {preference_type}: {content_str}",
-            metadata={
-                "preference_type": preference_type,
-                "content_str": content_str,  # Store as string
-                "source": "user_preference"
-            }
-        )
+    def delete_documents(self, ids):
+        with self.writer():
+            if not self.vector_store or not ids:
+                return
+            self.vector_store.delete(ids=ids)
+        self.snapshot = None
+        self.similarity_graph = None
+        self._notify_reload()
 
-        # Add to vector store
-        self.vector_store.add_documents([doc])
-        return True
+    def on_reload(self, callback):
+        """Register a callback run whenever the underlying store is (re)opened"""
+        self._reload_callbacks.append(callback)
 
-    def get_user_preferences(self, preference_type):
-        """Get user preferences from the vector store"""
-        if not self.vector_store:
-            return []
+    def _notify_reload(self):
+        for callback in self._reload_callbacks:
+            callback()
 
-        # Fetch preferences
-        results = self.vector_store.get(
-            where={"preference_type": preference_type}
-        )
+    def reload(self):
+        """Reopen the persisted store, e.g. after an external ingest"""
+        self.vector_store = self._load_or_create_vector_store()
+        self.snapshot, self.similarity_graph = self._load_snapshot()
+        self._notify_reload()
+        return self.vector_store
+
+    def add_documents(self, documents):
+        with self.writer():
+            if self.vector_store:
+                self.vector_store.add_documents(documents)
+            else:
+                self.vector_store = self._load_or_create_vector_store(create=True)
+                self.vector_store.add_documents(documents)
+        self.snapshot = None
+        self.similarity_graph = None
+        self._notify_reload()
+        return self.vector_store
 
-        if results and len(results['documents']) > 0:
-            # Get preference string and convert to list
-            content_str = results['metadatas'][0].get('content_str', "")
-            if content_str:
-                return content_str.split(", ")
+    def close(self):
+        """Release the Chroma handle held by this service"""
+        self.vector_store = None
+        self.snapshot = None
+        self.similarity_graph = None
+        self._notify_reload()
 
-        return []
\ No newline at end of file
+    def get_retriever(self, search_kwargs=None, facets=()):
+        """Retriever over the collection, restricted to a normalized facet filter if given
+
+        The filter is applied before similarity scoring: the snapshot scores
+        only the matching rows, Chroma gets it as a `where` clause.
+        """
+        if not self.available:
+            return None
+        search_kwargs = search_kwargs or {}
+        if self.read_only and not set(search_kwargs) <= {"k"}:
+            raise ValueError(f"Snapshot search supports only k, got {sorted(search_kwargs)}")
+        if self.snapshot is not None and set(search_kwargs) <= {"k"}:
+            return SnapshotRetriever(
+                snapshot=self.snapshot,
+                embedding_function=self.embedding_function,
+                k=search_kwargs.get("k", 4),
+                rows=self.snapshot.facet_rows(facets) if facets else None,
+                telemetry=self.telemetry,
+            )
+        if facets:
+            search_kwargs = {**search_kwargs, "filter": facet_where(facets)}
+        if self.telemetry.enabled:
+            return TimedVectorStoreRetriever(
+                vectorstore=self.vector_store, search_kwargs=search_kwargs, telemetry=self.telemetry
+            )
+        return self.vector_store.as_retriever(search_kwargs=search_kwargs)
+
+    def search_similar(self, query, k=5):
+        if self.snapshot is not None:
+            return self.get_retriever({"k": k}).invoke(query)
+        if self.vector_store:
+            return self.vector_store.similarity_search(query, k=k)
+        return []
+
+    async def asearch_similar(self, query, k=5):
+        if self.snapshot is not None:
+            return await self.get_retriever({"k": k}).ainvoke(query)
+        if self.vector_store:
+            return await self.vector_store.asimilarity_search(query, k=k)
+        return []
@@ -0,0 +1,86 @@
+"""Concurrent /api/chat requests against a fake LLM with injectable delay
+
+N concurrent chats should finish in about one LLM latency on a single
+worker, and requests over the concurrency limit should get a 429.
+
+Run with: python -m benchmarks.bench_async_chat
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import httpx
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from api.main import app
+from api.services.container import ServiceContainer
+from benchmarks.fakes import FakeChatModel
+
+LLM_LATENCY = 0.5
+CONCURRENT_CHATS = 20
+
+
+def build_store(persist_directory, embeddings):
+    Chroma.from_documents(
+        documents=[Document(page_content=f"Cocktail: Test {i}", metadata={"name": f"Test {i}"}) for i in range(20)],
+        embedding=embeddings,
+        persist_directory=persist_directory,
+    )
+
+
+async def run_chats(container, count):
+    container.startup()
+    asyncio.get_running_loop().set_default_executor(container.executor)
+    app.state.container = container
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(
+                client.post("/api/chat", json={"query": f"What is in cocktail {i}?"}) for i in range(count)
+            ))
+            elapsed = time.perf_counter() - start
+    finally:
+        container.shutdown()
+    return elapsed, [response.status_code for response in responses]
+
+
+def make_container(persist_directory, embeddings, **limits):
+    return ServiceContainer(
+        persist_directory=persist_directory,
+        embedding_function=embeddings,
+        llm_client_factory=lambda model_name: FakeChatModel(latency=LLM_LATENCY),
+        **limits,
+    )
+
+
+def main():
+    embeddings = DeterministicFakeEmbedding(size=64)
+    with tempfile.TemporaryDirectory() as persist_directory:
+        build_store(persist_directory, embeddings)
+
+        container = make_container(persist_directory, embeddings, max_llm_concurrency=CONCURRENT_CHATS)
+        elapsed, statuses = asyncio.run(run_chats(container, CONCURRENT_CHATS))
+        print(f"{CONCURRENT_CHATS} concurrent chats, LLM latency {LLM_LATENCY:.2f}s: {elapsed:.2f}s total")
+        concurrent_ok = all(status == 200 for status in statuses) and elapsed < 2 * LLM_LATENCY
+
+        container = make_container(persist_directory, embeddings, max_llm_concurrency=2, llm_queue_timeout=0)
+        elapsed, statuses = asyncio.run(run_chats(container, 6))
+        rejected = statuses.count(429)
+        print(f"6 chats with a limit of 2 and no queueing: {statuses.count(200)} served, {rejected} rejected with 429")
+        backpressure_ok = statuses.count(200) == 2 and rejected == 4
+
+    if not (concurrent_ok and backpressure_ok):
+        print("FAILED")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Embedding backends: ingest throughput and end-to-end query latency
+
+For each provider that can run here, this embeds the catalog to measure
+ingest throughput, loads it into a fresh Chroma store, and times
+embed-plus-search queries. Two providers are skipped with the reason
+printed: OpenAI without a real OPENAI_API_KEY, and ONNX when its model
+can't be downloaded. Finally it checks that a store built with one model
+refuses to open with another, and exits non-zero if it does not.
+
+Run with: python -m benchmarks.bench_embeddings
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from api.services.embedding_providers import HashingEmbeddings, OnnxEmbeddings, create_embeddings
+from api.services.vector_store_service import EmbeddingModelMismatchError, VectorStoreService
+from utils.data_processor import CocktailDataProcessor
+
+QUERIES = [
+    "a refreshing summer drink with mint",
+    "something sweet and creamy",
+    "classic gin cocktail",
+    "tropical rum punch",
+] * 10
+INGEST_ROUNDS = 3
+
+
+def backends():
+    yield "hashing", lambda: HashingEmbeddings()
+    yield "onnx", lambda: OnnxEmbeddings(batch_size=64)
+    yield "onnx, 4 threads", lambda: OnnxEmbeddings(batch_size=64, max_workers=4)
+    if os.environ.get("OPENAI_API_KEY", "sk-benchmark") != "sk-benchmark":
+        yield "openai", lambda: create_embeddings("openai")
+
+
+def measure(name, embeddings, documents):
+    texts = [doc.page_content for doc in documents]
+    embeddings.embed_query("warm up")
+
+    start = time.perf_counter()
+    for _ in range(INGEST_ROUNDS):
+        vectors = embeddings.embed_documents(texts)
+    ingest_rate = len(texts) * INGEST_ROUNDS / (time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        store = VectorStoreService(persist_directory, embedding_function=embeddings)
+        store.upsert_embedded([doc.id for doc in documents], texts, [doc.metadata for doc in documents], vectors)
+
+        latencies = []
+        for query in QUERIES:
+            start = time.perf_counter()
+            store.search_similar(query, k=5)
+            latencies.append((time.perf_counter() - start) * 1000)
+        store.close()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:18} {ingest_rate:10,.0f} docs/s  query p50={statistics.median(latencies):7.2f}ms  p95={p95:7.2f}ms"
+          f"  dim={len(vectors[0])}")
+
+
+def mismatch_rejected():
+    with tempfile.TemporaryDirectory() as persist_directory:
+        VectorStoreService(persist_directory, embedding_function=HashingEmbeddings(size=256)).add_documents(
+            CocktailDataProcessor().convert_to_documents(
+                CocktailDataProcessor().load_cocktails_data("data/cocktails.csv").head(5)
+            )
+        )
+        try:
+            VectorStoreService(persist_directory, embedding_function=HashingEmbeddings(size=128))
+        except EmbeddingModelMismatchError as error:
+            print(f"\nopening with another model is refused: {error}")
+            return True
+    print("\nopening with another model was NOT refused")
+    return False
+
+
+def main():
+    processor = CocktailDataProcessor()
+    documents = processor.convert_to_documents(processor.load_cocktails_data("data/cocktails.csv"))
+    print(f"{len(documents)} catalog documents x{INGEST_ROUNDS}, {len(QUERIES)} queries\n")
+
+    for name, factory in backends():
+        embeddings = factory()
+        try:
+            measure(name, embeddings, documents)
+        except Exception as error:
+            print(f"{name:18} skipped: {type(error).__name__}: {str(error)[:80]}")
+        finally:
+            close = getattr(embeddings, "close", None)
+            if callable(close):
+                close()
+
+    if not mismatch_rejected():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Facet-filtered retrieval vs unfiltered retrieval over the catalog
+
+For a set of questions and facet filters, times the RAG service's vector,
+lexical and hybrid retrievers with and without the filter, served from
+the memory-mapped snapshot and from Chroma, and reports how many
+candidates each filter leaves to score. Every filtered result is checked
+against the filter. Exits non-zero if any result breaks its filter.
+
+Run with: python -m benchmarks.bench_facets [--rounds N]
+"""
+import argparse
+import sys
+import tempfile
+import time
+
+from api.services.retrieval_config import RetrievalConfig
+from api.services.vector_store_service import VectorStoreService
+from benchmarks.fakes import FakeEmbeddings
+from benchmarks.harness import fake_container, percentiles, save_results
+
+K = 10
+QUERIES = [
+    "something fruity with orange juice",
+    "a refreshing drink with mint and lime",
+    "creamy coffee dessert",
+    "tropical punch with pineapple",
+]
+FILTERS = {
+    "non_alcoholic": {"alcoholic": ["Non alcoholic", "Optional alcohol"]},
+    "highball": {"glassType": ["Highball glass"]},
+    "alcoholic_shot": {"alcoholic": ["Alcoholic"], "category": ["Shot"]},
+    "party_or_soft": {"category": ["Punch / Party Drink", "Soft Drink"]},
+}
+
+
+def timings_us(fn, inputs):
+    """Per-call timings in microseconds, after one warm-up call"""
+    fn(inputs[0])
+    samples = []
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def violations(docs, filters):
+    return sum(
+        any(doc.metadata.get(facet) not in values for facet, values in filters)
+        for doc in docs
+    )
+
+
+def run_backend(label, rag_service, texts):
+    """{filter: {mode: results}} and the number of results breaking their filter"""
+    results, broken = {}, 0
+    for name, facets in {"none": None, **FILTERS}.items():
+        results[name] = {}
+        for mode in ("vector", "lexical", "hybrid"):
+            retrieval = rag_service._filtered("", RetrievalConfig(mode=mode, k=K), facets, facets_from_query=False)
+            retriever = rag_service._build_retriever(retrieval)
+            samples = timings_us(retriever.invoke, texts)
+            wrong = sum(violations(retriever.invoke(text), retrieval.facets) for text in QUERIES)
+            broken += wrong
+            results[name][mode] = {
+                **{f"{point}_us": value for point, value in percentiles(samples).items()},
+                "violations": wrong,
+            }
+        print(f"{label:>9} {name:>15}  " + "  ".join(
+            f"{mode} p50 {result['p50_us']:7.0f}us" for mode, result in results[name].items()
+        ) + f"  violations {sum(result['violations'] for result in results[name].values())}")
+    return results, broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=25, help="passes over the questions per measurement")
+    args = parser.parse_args()
+
+    texts = QUERIES * args.rounds
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        container = fake_container(directory, vector_snapshot_max_docs=100_000)
+        container.startup()
+        try:
+            facet_index = container.facet_index
+            results["candidates"] = {
+                name: facet_index.bits(facet_index.resolve(facets)).bit_count()
+                for name, facets in {"none": {}, **FILTERS}.items()
+            }
+            print("candidates per filter: " + ", ".join(f"{name} {count}"
+                                                        for name, count in results["candidates"].items()))
+
+            vector_store_service = container.vector_store_service
+            vector_store_service.export_snapshot()
+            vector_store_service.reload()
+            if vector_store_service.snapshot is None:
+                sys.exit("the exported snapshot was not picked up")
+            rag_service = container.create_rag_service()
+            results["snapshot"], broken = run_backend("snapshot", rag_service, texts)
+
+            # The same service with vector search answered by Chroma's filtered HNSW query
+            rag_service.vector_store_service = VectorStoreService(
+                vector_store_service.persist_directory,
+                embedding_function=FakeEmbeddings(),
+                snapshot_max_docs=0,
+            )
+            results["chroma"], chroma_broken = run_backend("chroma", rag_service, texts)
+            broken += chroma_broken
+        finally:
+            container.shutdown()
+
+    print(f"\nsaved {save_results('facets', results)}")
+    if broken:
+        sys.exit(f"{broken} results did not match their facet filter")
+
+
+if __name__ == "__main__":
+    main()
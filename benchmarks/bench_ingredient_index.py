@@ -0,0 +1,69 @@
+"""Structured ingredient queries: inverted index vs the vector search path
+
+The vector path uses a local fake embedding, so its numbers exclude the
+OpenAI round trip that every real query pays on top.
+
+Run with: python -m benchmarks.bench_ingredient_index
+"""
+import os
+import tempfile
+import time
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from api.services.ingredient_index import IngredientIndex
+from utils.data_processor import CocktailDataProcessor
+
+QUERIES = [
+    "cocktails with gin and lemon juice but no grenadine",
+    "vodka or rum drinks without lime juice",
+    "something with tequila and triple sec",
+]
+ROUNDS = 200
+K = 5
+
+
+def per_call_us(fn):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn()
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def satisfies(index, doc, all_of, any_of, none_of):
+    bits = index.query_bits(all_of, any_of, none_of)
+    position = index.documents.index(doc)
+    return bool((bits >> position) & 1)
+
+
+def main():
+    processor = CocktailDataProcessor()
+    df = processor.load_cocktails_data("data/cocktails.csv")
+    documents = processor.convert_to_documents(df)
+
+    start = time.perf_counter()
+    index = IngredientIndex.from_dataframe(df, documents)
+    print(f"index build: {(time.perf_counter() - start) * 1000:.1f}ms for {len(index)} cocktails, {len(index.postings)} ingredients")
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        store = Chroma.from_documents(documents, DeterministicFakeEmbedding(size=256), persist_directory=persist_directory)
+
+        for query in QUERIES:
+            all_of, any_of, none_of = index.parse_query(query)
+            index_us = per_call_us(lambda: index.query(*index.parse_query(query), limit=K))
+            vector_us = per_call_us(lambda: store.similarity_search(query, k=K))
+
+            vector_docs = store.similarity_search(query, k=K)
+            by_id = {doc.id: doc for doc in documents}
+            valid = sum(satisfies(index, by_id[doc.id], all_of, any_of, none_of) for doc in vector_docs)
+
+            print(f"\n{query!r}")
+            print(f"  index : {index_us:9.1f}us  ({len(index.query(all_of, any_of, none_of))} exact matches)")
+            print(f"  vector: {vector_us:9.1f}us  ({valid}/{K} results satisfy the constraints, network excluded)")
+
+
+if __name__ == "__main__":
+    main()
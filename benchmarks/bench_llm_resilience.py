@@ -0,0 +1,270 @@
+"""Request coalescing, pooled connections, retries, circuit breaker and fallback against a fake OpenAI server
+
+Serves a local OpenAI-compatible /v1/chat/completions (streaming and not)
+with per-model latency and injected 500s, and points the real ChatOpenAI
+clients at it through OPENAI_BASE_URL, so every request goes through the
+OpenAI SDK and httpx as in production. Measures:
+
+- a burst of identical /api/chat questions, with and without coalescing
+- TCP connections opened for sequential requests switching between two
+  models, pooled clients vs a new ChatOpenAI per switch
+- retries recovering from transient 500s
+- a failing primary: fallback answers, the breaker opening, 503 without a fallback
+- a slow primary: calls over the latency budget answered by the fallback
+
+Exits non-zero if any of these does not behave as expected.
+
+Run with: python -m benchmarks.bench_llm_resilience [--burst 32] [--latency 0.3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.harness import fake_container, live_server, percentiles, running_app, save_results
+
+PRIMARY = "gpt-4o"
+FALLBACK = "gpt-4o-mini"
+ANSWER = "Stir gin and vermouth over ice, then strain into a chilled glass."
+
+
+class FakeOpenAI:
+    """An OpenAI-compatible chat completions endpoint with scripted latency and failures"""
+
+    def __init__(self):
+        self.latency = {}
+        self.failing = set()
+        self.fail_next = 0
+        self.calls = {}
+        self.connections = set()
+        self.app = FastAPI()
+        self.app.post("/v1/chat/completions")(self.completions)
+
+    def reset(self, latency=None, failing=()):
+        self.latency = dict(latency or {})
+        self.failing = set(failing)
+        self.fail_next = 0
+        self.calls = {}
+        self.connections = set()
+
+    async def completions(self, request: Request):
+        body = await request.json()
+        model = body["model"]
+        self.calls[model] = self.calls.get(model, 0) + 1
+        self.connections.add((request.client.host, request.client.port))
+        await asyncio.sleep(self.latency.get(model, 0.0))
+        if model in self.failing or self.fail_next > 0:
+            self.fail_next = max(0, self.fail_next - 1)
+            return JSONResponse({"error": {"message": "injected failure", "type": "server_error"}}, status_code=500)
+
+        usage = {"prompt_tokens": 50, "completion_tokens": len(ANSWER.split()), "total_tokens": 50 + len(ANSWER.split())}
+        if not body.get("stream"):
+            return {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": 0, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        def event(choices, **extra):
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0, "model": model,
+                     "choices": choices, **extra}
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        async def events():
+            for i, token in enumerate(ANSWER.split(" ")):
+                delta = {"role": "assistant", "content": token} if i == 0 else {"content": " " + token}
+                yield event([{"index": 0, "delta": delta, "finish_reason": None}])
+            yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if body.get("stream_options", {}).get("include_usage"):
+                yield event([], usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@contextmanager
+def app_client(directory, **options):
+    container = fake_container(directory, llm_client_factory=None, default_model=PRIMARY, **options)
+    with running_app(container) as app:
+        transport = httpx.ASGITransport(app=app)
+        yield container, httpx.AsyncClient(transport=transport, base_url="http://api", timeout=60)
+
+
+async def chat(client, query, model=PRIMARY):
+    start = time.perf_counter()
+    response = await client.post("/api/chat", json={"query": query, "model": model, "use_cache": False})
+    return response, (time.perf_counter() - start) * 1000
+
+
+async def burst(client, size, query="What can I make with gin and vermouth?"):
+    return await asyncio.gather(*(chat(client, query) for _ in range(size)))
+
+
+def coalescing(upstream, directory, size, latency):
+    """Identical questions at once: upstream calls and latency with and without coalescing"""
+    results = {}
+    for label, coalesce in (("separate", False), ("coalesced", True)):
+        upstream.reset(latency={PRIMARY: latency})
+        with app_client(directory) as (container, client):
+            if not coalesce:
+                container.single_flight = None
+
+            async def run():
+                async with client:
+                    return await burst(client, size)
+
+            responses = asyncio.run(run())
+            stats = container.single_flight.stats() if coalesce else None
+        results[label] = {
+            "requests": size,
+            "ok": sum(response.status_code == 200 for response, _ in responses),
+            "upstream_calls": upstream.calls.get(PRIMARY, 0),
+            **{f"{point}_ms": value for point, value in percentiles([ms for _, ms in responses]).items()},
+            "single_flight": stats,
+        }
+        print(f"{label:>10}: {size} identical questions -> {results[label]['upstream_calls']:3} upstream calls, "
+              f"p50 {results[label]['p50_ms']:7.1f}ms  p95 {results[label]['p95_ms']:7.1f}ms")
+    ok = (results["coalesced"]["upstream_calls"] == 1 and results["coalesced"]["ok"] == size
+          and results["separate"]["upstream_calls"] == size)
+    return results, ok
+
+
+def connection_reuse(upstream, rounds):
+    """TCP connections for sequential calls that switch models, pooled vs a new client per switch"""
+    from langchain_openai import ChatOpenAI
+
+    from api.services.llm_service import LLMClientPool, LLMService
+
+    results = {}
+    models = [PRIMARY, FALLBACK] * rounds
+
+    upstream.reset()
+    service = LLMService(PRIMARY, client_pool=LLMClientPool())
+    for model in models:
+        service.set_model(model)
+        service.get_llm().invoke("hi")
+    service.client_pool.close()
+    results["pooled"] = len(upstream.connections)
+
+    upstream.reset()
+    for model in models:
+        ChatOpenAI(model=model, stream_usage=True).invoke("hi")
+    results["client_per_switch"] = len(upstream.connections)
+
+    print(f"{'connections':>10}: {len(models)} calls switching models -> {results['pooled']} pooled vs "
+          f"{results['client_per_switch']} with a new client per switch")
+    return results, results["pooled"] <= 2
+
+
+def retries(upstream, directory):
+    """Transient 500s are retried with backoff and the question still gets an answer"""
+    upstream.reset()
+    upstream.fail_next = 2
+    with app_client(directory, llm_max_retries=2) as (container, client):
+        async def run():
+            async with client:
+                return await chat(client, "How do I make a Martini?")
+
+        response, ms = asyncio.run(run())
+        stats = container.llm_pool.stats()[PRIMARY]
+    results = {"status": response.status_code, "upstream_calls": upstream.calls.get(PRIMARY, 0),
+               "retries": stats["retries"], "ms": ms}
+    print(f"{'retries':>10}: 2 injected 500s -> status {response.status_code} after {stats['retries']} retries, "
+          f"{ms:.0f}ms")
+    return results, response.status_code == 200 and stats["retries"] == 2
+
+
+def failing_primary(upstream, directory, requests):
+    """A primary that always fails: fallback answers and the breaker stops calling it; 503 with no fallback"""
+    results = {}
+    for label, fallback in (("fallback", FALLBACK), ("no_fallback", None)):
+        upstream.reset(failing={PRIMARY})
+        with app_client(directory, llm_max_retries=0, llm_fallback_model=fallback) as (container, client):
+            async def run():
+                async with client:
+                    return [await chat(client, f"Question {i} about gin") for i in range(requests)]
+
+            responses = asyncio.run(run())
+            stats = container.llm_pool.stats()[PRIMARY]
+        statuses = [response.status_code for response, _ in responses]
+        results[label] = {
+            "statuses": {status: statuses.count(status) for status in sorted(set(statuses))},
+            "primary_calls": upstream.calls.get(PRIMARY, 0),
+            "fallback_calls": upstream.calls.get(FALLBACK, 0),
+            "breaker": stats["breaker"],
+            "retry_after": responses[-1][0].headers.get("Retry-After"),
+        }
+        print(f"{label:>10}: {requests} questions, primary down -> statuses {results[label]['statuses']}, "
+              f"primary called {results[label]['primary_calls']}x, fallback {results[label]['fallback_calls']}x, "
+              f"breaker {stats['breaker']}")
+    with_fallback, without = results["fallback"], results["no_fallback"]
+    ok = (with_fallback["statuses"] == {200: requests} and with_fallback["primary_calls"] < requests
+          and with_fallback["breaker"] == "open"
+          and without["primary_calls"] < requests and 503 in without["statuses"]
+          and without["retry_after"] is not None)
+    return results, ok
+
+
+def latency_budget(upstream, directory, requests, budget):
+    """A primary slower than the budget: answers come from the fallback within about the budget"""
+    upstream.reset(latency={PRIMARY: 10 * budget, FALLBACK: 0.0})
+    with app_client(directory, llm_fallback_model=FALLBACK, llm_latency_budget=budget) as (container, client):
+        async def run():
+            async with client:
+                return [await chat(client, f"Something with rum, take {i}") for i in range(requests)]
+
+        responses = asyncio.run(run())
+        stats = container.llm_pool.stats()[PRIMARY]
+    latencies = [ms for _, ms in responses]
+    results = {
+        "budget_ms": budget * 1000,
+        "primary_latency_ms": 10 * budget * 1000,
+        "ok": sum(response.status_code == 200 for response, _ in responses),
+        "fallbacks": stats["fallbacks"],
+        **{f"{point}_ms": value for point, value in percentiles(latencies).items()},
+    }
+    print(f"{'budget':>10}: primary {10 * budget * 1000:.0f}ms to first token, budget {budget * 1000:.0f}ms -> "
+          f"{stats['fallbacks']}/{requests} fell back, p50 {results['p50_ms']:.0f}ms  p95 {results['p95_ms']:.0f}ms")
+    ok = results["ok"] == requests and stats["fallbacks"] == requests and results["p95_ms"] < 5 * budget * 1000
+    return results, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--burst", type=int, default=32, help="identical questions sent at once")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake upstream time to first token, seconds")
+    parser.add_argument("--requests", type=int, default=10, help="questions per failure scenario")
+    parser.add_argument("--budget", type=float, default=0.2, help="latency budget before falling back, seconds")
+    args = parser.parse_args()
+
+    upstream = FakeOpenAI()
+    results, failed = {}, []
+    with live_server(upstream.app) as base_url, tempfile.TemporaryDirectory() as directory:
+        os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        for name, scenario in (
+            ("coalescing", lambda: coalescing(upstream, directory, args.burst, args.latency)),
+            ("connections", lambda: connection_reuse(upstream, args.requests)),
+            ("retries", lambda: retries(upstream, directory)),
+            ("failing_primary", lambda: failing_primary(upstream, directory, args.requests)),
+            ("latency_budget", lambda: latency_budget(upstream, directory, args.requests, args.budget)),
+        ):
+            results[name], ok = scenario()
+            if not ok:
+                failed.append(name)
+
+    print(f"\nsaved {save_results('llm_resilience', results)}")
+    if failed:
+        sys.exit(f"unexpected behaviour in: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Microbenchmarks for the hot paths that don't need an HTTP server
+
+- dataset processing: CocktailDataProcessor.process_dataset, cold CSV parse vs Parquet snapshot
+- retrieval: vector, lexical and hybrid retrievers over the full catalog
+- preference detection: extraction alone and with the preference store write
+
+Results are printed and saved as JSON under benchmarks/results/.
+
+Run with: python -m benchmarks.bench_micro [--rounds N]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from benchmarks.harness import CATALOG_PATH, fake_container, percentiles, running_app, save_results
+from api.services.hybrid_retriever import RetrievalConfig
+from utils.data_processor import CocktailDataProcessor
+
+QUERIES = [
+    "a refreshing summer drink with mint",
+    "Margarita",
+    "something with gin and lemon juice",
+    "creamy coffee dessert cocktail",
+]
+MESSAGES = [
+    "I love gin and fresh lemon juice",
+    "I don't like rum, but I enjoy vodka with cranberry juice",
+    "How do I make a Margarita?",
+]
+
+
+def time_calls(fn, rounds):
+    """Per-call timings in microseconds, after one warm-up call"""
+    fn()
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return {"mean_us": statistics.fmean(samples), **{f"{k}_us": v for k, v in percentiles(samples).items()}}
+
+
+def report(results, name, stats):
+    results[name] = stats
+    print(f"{name:38} mean={stats['mean_us']:10.1f}us  p50={stats['p50_us']:10.1f}us  p99={stats['p99_us']:10.1f}us")
+
+
+def bench_processing(results, rounds):
+    with tempfile.TemporaryDirectory() as directory:
+        # A private copy so the snapshot written next to it stays out of data/
+        path = os.path.join(directory, "cocktails.csv")
+        shutil.copy(CATALOG_PATH, path)
+        report(results, "process_dataset (CSV)",
+               time_calls(lambda: CocktailDataProcessor(use_snapshot=False).process_dataset(path), rounds))
+        CocktailDataProcessor().load_cocktails_data(path)
+        report(results, "process_dataset (snapshot)",
+               time_calls(lambda: CocktailDataProcessor().process_dataset(path), rounds))
+
+
+def bench_retrieval(results, rag_service, rounds):
+    for mode in ("vector", "lexical", "hybrid"):
+        retriever = rag_service._build_retriever(RetrievalConfig(mode=mode, k=4))
+        queries = iter(QUERIES * (rounds + 1))
+        report(results, f"retrieve k=4 ({mode})", time_calls(lambda: retriever.invoke(next(queries)), rounds))
+    # Hybrid's vector leg fetches 20 candidates; its overhead is measured against that
+    retriever = rag_service.vector_store_service.get_retriever({"k": 20})
+    queries = iter(QUERIES * (rounds + 1))
+    report(results, "retrieve k=20 (vector)", time_calls(lambda: retriever.invoke(next(queries)), rounds))
+
+
+def bench_preferences(results, rag_service, rounds):
+    messages = iter(MESSAGES * (rounds * 2 + 2))
+    report(results, "preference extraction",
+           time_calls(lambda: rag_service.preference_extractor.extract(next(messages)), rounds))
+    report(results, "detect_user_preferences (with store)",
+           time_calls(lambda: rag_service.detect_user_preferences(next(messages)), rounds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    results = {}
+    bench_processing(results, max(3, args.rounds // 10))
+    with tempfile.TemporaryDirectory() as directory:
+        with running_app(fake_container(directory)) as app:
+            rag_service = app.state.container.create_rag_service()
+            bench_retrieval(results, rag_service, args.rounds)
+            bench_preferences(results, rag_service, args.rounds)
+
+    print(f"\nsaved {save_results('micro', results)}")
+
+
+if __name__ == "__main__":
+    main()
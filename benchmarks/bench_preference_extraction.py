@@ -0,0 +1,100 @@
+"""Preference extraction throughput: catalog automaton vs the old keyword scan
+
+Both extractors run over the same mix of chat messages. The old function is
+copied here, minus its prints and storage call, as the baseline. The script
+also checks the cases the old scan got wrong and exits non-zero if the new
+extractor regresses on them.
+
+Run with: python -m benchmarks.bench_preference_extraction
+"""
+import sys
+import time
+
+from api.services.ingredient_index import IngredientIndex
+from api.services.preference_extractor import PreferenceExtractor
+from utils.data_processor import CocktailDataProcessor
+
+MESSAGES = [
+    "What is a good cocktail for a summer party?",
+    "I love gin and fresh lemon juice",
+    "How do I make a Margarita?",
+    "I don't like rum, but I enjoy vodka with cranberry juice",
+    "Recommend something with ginger beer, I really like it",
+    "Which drinks use triple sec and lime juice?",
+    "My favorite is a Moscow Mule, anything similar?",
+    "I hate whiskey. Suggest something fruity instead.",
+]
+ROUNDS = 2000
+
+# (message, expected likes, expected dislikes)
+CASES = [
+    ("I love ginger beer", ["ginger beer"], []),
+    ("I don't like rum", [], ["rum"]),
+    ("I love gin but not vodka", ["gin"], ["vodka"]),
+    ("I like Lemon Juice and mint", ["lemon juice", "mint"], []),
+    ("What has gin in it?", [], []),
+]
+
+
+def old_detect_user_preferences(query):
+    """RAGService._detect_user_preferences before this change"""
+    favorite_keywords = [
+        "favorite", "favourite", "love", "like", "prefer", "enjoy"
+    ]
+
+    query_lower = query.lower()
+
+    if any(keyword in query_lower for keyword in favorite_keywords):
+        common_ingredients = [
+            "rum", "vodka", "gin", "tequila", "whiskey", "bourbon",
+            "brandy", "cognac", "lime", "lemon", "orange", "mint",
+            "sugar", "syrup", "juice", "soda", "tonic", "vermouth",
+            "bitters", "grenadine", "cream", "coffee", "chocolate"
+        ]
+
+        found_ingredients = []
+        for ingredient in common_ingredients:
+            if ingredient in query_lower:
+                found_ingredients.append(ingredient)
+        return found_ingredients
+
+    return []
+
+
+def throughput(fn):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for message in MESSAGES:
+            fn(message)
+    return ROUNDS * len(MESSAGES) / (time.perf_counter() - start)
+
+
+def main():
+    processor = CocktailDataProcessor()
+    df = processor.load_cocktails_data("data/cocktails.csv")
+    index = IngredientIndex.from_dataframe(df, processor.convert_to_documents(df))
+
+    start = time.perf_counter()
+    extractor = PreferenceExtractor(index.postings)
+    print(f"automaton build: {(time.perf_counter() - start) * 1000:.1f}ms for {len(extractor.matcher)} ingredients")
+
+    old_qps = throughput(old_detect_user_preferences)
+    new_qps = throughput(extractor.extract)
+    print(f"old keyword scan  : {old_qps:12,.0f} messages/s (23 hard-coded ingredients)")
+    print(f"catalog automaton : {new_qps:12,.0f} messages/s ({len(extractor.matcher)} ingredients)")
+
+    failures = 0
+    print()
+    for message, likes, dislikes in CASES:
+        result = extractor.extract(message)
+        ok = result.likes == likes and result.dislikes == dislikes
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {message!r}: likes={result.likes} dislikes={result.dislikes}"
+              f"  (old: {old_detect_user_preferences(message)})")
+
+    if failures:
+        sys.exit(f"{failures} extraction case(s) failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Recommendation quality and batching: MMR over oversampled candidates vs top-k
+
+Quality runs the old path (top `count` vector hits, deduplicated by name)
+and the new one over the full catalog. It reports how many distinct
+cocktails each returns and how similar they are to each other. The batch
+part times sequential /api/recommend calls against one
+/api/recommend/batch call, with an embedding model that takes
+EMBED_LATENCY per request.
+
+Exits non-zero if a recommendation comes back short, duplicated or
+containing an excluded cocktail.
+
+Run with: python -m benchmarks.bench_recommendations
+"""
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import httpx
+from langchain_chroma import Chroma
+
+from api.main import app
+from api.services.container import ServiceContainer
+from api.services.hybrid_retriever import RetrievalConfig
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from utils.data_processor import CocktailDataProcessor
+
+COUNT = 10
+CRITERIA = [
+    "a refreshing summer drink",
+    "something sweet and creamy for dessert",
+    "a strong classic cocktail",
+    "a fruity tropical punch",
+]
+BATCH_SIZE = 200
+EMBED_LATENCY = 0.02
+VECTOR = RetrievalConfig(mode="vector", k=COUNT)
+
+
+def mean_pairwise_similarity(embeddings, docs):
+    vectors = [embeddings._vector(doc["content"]) for doc in docs]
+    pairs = list(itertools.combinations(vectors, 2))
+    if not pairs:
+        return 0.0
+    return sum(sum(a * b for a, b in zip(u, v)) for u, v in pairs) / len(pairs)
+
+
+def old_recommend(rag_service, criteria, count):
+    """Top-count vector hits deduplicated by name, as before this change"""
+    docs = rag_service._build_retriever(VECTOR._replace(k=count)).invoke(criteria)
+    recommendations = []
+    for doc in docs:
+        name = doc.metadata.get("name")
+        if name not in [rec["name"] for rec in recommendations]:
+            recommendations.append({"name": name, "content": doc.page_content})
+    return recommendations
+
+
+def check(recommendations, count, excluded=()):
+    names = [rec["name"] for rec in recommendations]
+    return len(names) == count and len(set(names)) == count and not set(names) & set(excluded)
+
+
+def quality(container, embeddings):
+    rag_service = container.create_rag_service()
+    ok = True
+    print(f"{'criteria':42} {'old: n  sim':>13} {'new: n  sim':>13}")
+    for criteria in CRITERIA:
+        old = old_recommend(rag_service, criteria, COUNT)
+        new = rag_service.recommend_cocktails(criteria, COUNT, retrieval=VECTOR)["recommendations"]
+        ok &= check(new, COUNT)
+        print(f"{criteria:42} {len(old):>8} {mean_pairwise_similarity(embeddings, old):.2f}"
+              f" {len(new):>8} {mean_pairwise_similarity(embeddings, new):.2f}")
+
+    shown = [rec["name"] for rec in rag_service.recommend_cocktails(CRITERIA[0], COUNT)["recommendations"]]
+    again = rag_service.recommend_cocktails(CRITERIA[0], COUNT, exclude=shown)["recommendations"]
+    excluded_ok = check(again, COUNT, excluded=shown)
+    print(f"\nexcluding the {len(shown)} already shown: {len(again)} new results, none repeated: {excluded_ok}")
+    return ok and excluded_ok
+
+
+async def batching(container, embeddings, names):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        calls = embeddings.calls
+        start = time.perf_counter()
+        sequential = []
+        for name in names:
+            response = await client.post("/api/recommend", json={"criteria": f"something like a {name}", "count": 3})
+            sequential.append(response.json())
+        sequential_s = time.perf_counter() - start
+        sequential_calls = embeddings.calls - calls
+
+        calls = embeddings.calls
+        start = time.perf_counter()
+        response = await client.post("/api/recommend/batch", json={
+            "requests": [{"criteria": f"a drink similar to {name}", "count": 3} for name in names],
+        })
+        batch_s = time.perf_counter() - start
+        batch_calls = embeddings.calls - calls
+        batched = response.json()["results"]
+
+    print(f"\n{len(names)} recommendations, embedding latency {EMBED_LATENCY * 1000:.0f}ms per call")
+    print(f"sequential /recommend : {sequential_s:6.2f}s  {sequential_calls:4} embedding calls")
+    print(f"/recommend/batch      : {batch_s:6.2f}s  {batch_calls:4} embedding calls")
+    return all(check(result["recommendations"], 3) for result in sequential + batched)
+
+
+def main():
+    processor = CocktailDataProcessor()
+    documents = processor.convert_to_documents(processor.load_cocktails_data("data/cocktails.csv"))
+    embeddings = FakeEmbeddings()
+
+    with tempfile.TemporaryDirectory() as directory:
+        persist_directory = os.path.join(directory, "db")
+        Chroma.from_documents(documents, embeddings, persist_directory=persist_directory,
+                              ids=[doc.id for doc in documents])
+        container = ServiceContainer(
+            persist_directory=persist_directory,
+            embedding_function=embeddings,
+            llm_client_factory=lambda model_name: FakeChatModel(),
+            preference_db_path=os.path.join(directory, "preferences.sqlite"),
+        )
+        container.startup()
+        app.state.container = container
+        try:
+            quality_ok = quality(container, embeddings)
+            embeddings.latency = EMBED_LATENCY
+            names = [doc.metadata["name"] for doc in documents[:BATCH_SIZE]]
+            batch_ok = asyncio.run(batching(container, embeddings, names))
+        finally:
+            container.shutdown()
+
+    if not (quality_ok and batch_ok):
+        sys.exit("recommendations were short, duplicated or not excluded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Per-request service setup overhead: per-request construction vs the lifespan container
+
+Run with: python -m benchmarks.bench_service_lifecycle
+"""
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from api.dependencies import get_rag_service
+from api.main import app
+from api.services.llm_service import LLMService
+from api.services.rag_service import RAGService
+from api.services.vector_store_service import VectorStoreService
+
+REQUESTS = 200
+
+
+def build_store(persist_directory):
+    Chroma.from_documents(
+        documents=[Document(page_content=f"Cocktail: Test {i}", metadata={"name": f"Test {i}"}) for i in range(20)],
+        embedding=DeterministicFakeEmbedding(size=64),
+        persist_directory=persist_directory,
+    )
+
+
+# A route that does nothing but resolve the RAG service, so only setup cost is measured
+@app.get("/bench/probe")
+def probe(rag_service: RAGService = Depends(get_rag_service)):
+    return {}
+
+
+def time_requests(client, path):
+    timings = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        response = client.get(path)
+        timings.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return timings
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<28} mean={statistics.mean(timings):7.2f}ms  p50={statistics.median(timings):7.2f}ms  p95={p95:7.2f}ms")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        persist_directory = os.path.join(directory, "db")
+        build_store(persist_directory)
+        os.environ["VECTOR_DB_DIR"] = persist_directory
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(directory, "embeddings.sqlite")
+        os.environ["PREFERENCE_DB_PATH"] = os.path.join(directory, "preferences.sqlite")
+
+        with TestClient(app) as client:
+            # Before: the original per-request factory
+            app.dependency_overrides[get_rag_service] = lambda: RAGService(
+                LLMService(), VectorStoreService(persist_directory)
+            )
+            before = time_requests(client, "/bench/probe")
+
+            # After: services injected from the lifespan-managed container
+            app.dependency_overrides.clear()
+            after = time_requests(client, "/bench/probe")
+
+        print(f"RAG service setup per request, x{REQUESTS}")
+        report("per-request construction", before)
+        report("lifespan container", after)
+
+
+if __name__ == "__main__":
+    main()
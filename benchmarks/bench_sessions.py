@@ -0,0 +1,113 @@
+"""Prompt history per turn: resending the full conversation vs server-side sessions
+
+Plays the same TURNS-turn conversation twice through /api/chat: once with
+the client resending the full chat_history (the old frontend), and once
+with only a session_id. Reports request size and history tokens per turn.
+Exits non-zero if a session prompt ever exceeds the token budget, or if
+overflowing turns were not folded into the summary.
+
+Run with: python -m benchmarks.bench_sessions
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import httpx
+from langchain_chroma import Chroma
+
+from api.main import app
+from api.services.container import ServiceContainer
+from api.services.preference_store import DEFAULT_USER_ID
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from utils.data_processor import CocktailDataProcessor
+
+TURNS = 40
+HISTORY_BUDGET = 600
+ANSWER = (
+    "A Negroni is a good fit: equal parts gin, Campari and sweet vermouth, stirred over ice "
+    "and garnished with an orange peel. If you want something lighter, try an Americano, which "
+    "swaps the gin for soda water, or a Negroni Sbagliato made with prosecco instead of gin."
+)
+
+
+def question(turn):
+    return f"Turn {turn}: what else would you suggest if I liked the previous drink but want more citrus?"
+
+
+async def converse(client, use_session):
+    history = []
+    rows = []
+    for turn in range(TURNS):
+        payload = {"query": question(turn), "use_cache": False}
+        if use_session:
+            payload["session_id"] = "bench-session"
+        else:
+            payload["chat_history"] = history
+        body = json.dumps(payload)
+        response = (await client.post("/api/chat", content=body, headers={"Content-Type": "application/json"})).json()
+        history = history + [{"role": "user", "content": payload["query"]},
+                             {"role": "assistant", "content": response["answer"]}]
+        rows.append((len(body), response.get("history_tokens"), response.get("tokens_saved")))
+    return rows
+
+
+async def run(container):
+    counter = container.session_store.token_counter
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        full = await converse(client, use_session=False)
+        session = await converse(client, use_session=True)
+
+    ok = True
+    full_tokens = 0
+    print(f"{'turn':>4} {'full history: bytes  tokens':>28} {'session: bytes  tokens  saved':>30}")
+    for turn, ((full_bytes, _, _), (session_bytes, history_tokens, saved)) in enumerate(zip(full, session)):
+        if turn:
+            full_tokens += counter.count_message(question(turn - 1)) + counter.count_message(ANSWER)
+        ok &= history_tokens <= HISTORY_BUDGET
+        if turn % 5 == 4 or turn == TURNS - 1:
+            print(f"{turn + 1:>4} {full_bytes:>20} {full_tokens:>7} {session_bytes:>16} {history_tokens:>7} {saved:>6}")
+
+    summary, pending = container.session_store.pending_summary(DEFAULT_USER_ID, "bench-session")
+    stats = container.session_store.stats()
+    print(f"\nsummary folded in: {bool(summary)}, messages still pending: {len(pending)}")
+    print(f"tokens saved per turn: {stats['tokens_saved_per_turn']:.0f} "
+          f"({'tiktoken' if stats['exact_token_counts'] else 'estimated, tiktoken encoding unavailable'})")
+    return ok and bool(summary) and not pending
+
+
+def main():
+    processor = CocktailDataProcessor()
+    documents = processor.convert_to_documents(processor.load_cocktails_data("data/cocktails.csv"))
+    embeddings = FakeEmbeddings()
+
+    with tempfile.TemporaryDirectory() as directory:
+        persist_directory = os.path.join(directory, "db")
+        Chroma.from_documents(documents, embeddings, persist_directory=persist_directory,
+                              ids=[doc.id for doc in documents])
+        container = ServiceContainer(
+            persist_directory=persist_directory,
+            embedding_function=embeddings,
+            llm_client_factory=lambda model_name: FakeChatModel(response=ANSWER),
+            preference_db_path=os.path.join(directory, "preferences.sqlite"),
+            session_db_path=os.path.join(directory, "sessions.sqlite"),
+            max_history_tokens=HISTORY_BUDGET,
+        )
+        container.startup()
+        app.state.container = container
+        try:
+            ok = asyncio.run(run(container))
+        finally:
+            container.shutdown()
+
+    if not ok:
+        sys.exit("session history exceeded its budget or was not summarized")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Precomputed cocktail similarity graph: build cost, incremental updates and lookups
+
+Builds the graph for synthetic corpora of random unit vectors and
+ingredient sets, then changes a share of the rows and times the
+incremental update against a full rebuild, checking both give the same
+neighbor scores. On the catalog (fake embeddings) it compares "drinks like
+X" recommendations served from the graph with the same requests searched
+as before (query embedding, vector search, MMR). Exits non-zero if an
+incremental update differs from a rebuild or the graph is not faster.
+
+Run with: python -m benchmarks.bench_similarity_graph [--sizes 5000,20000] [--changed 0.01]
+"""
+import argparse
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from api.services.similarity_graph import SimilarityGraph, build_graph, update_graph
+from api.services.vector_snapshot import normalize_rows
+from benchmarks.harness import fake_container, percentiles, save_results
+
+DIMENSION = 384
+VOCABULARY = 500
+SEEDS = ["Negroni", "Mojito", "Margarita", "Cosmopolitan", "Old Fashioned", "Whiskey Sour", "Daiquiri", "Manhattan"]
+
+
+def synthetic_rows(rng, count):
+    vectors = normalize_rows(rng.standard_normal((count, DIMENSION))).astype(np.float32)
+    sets = [frozenset(rng.choice(VOCABULARY, rng.integers(2, 7), replace=False).tolist()) for _ in range(count)]
+    return vectors, sets
+
+
+def synthetic_benchmark(size, changed_share):
+    rng = np.random.default_rng(size)
+    vectors, sets = synthetic_rows(rng, size)
+    start = time.perf_counter()
+    neighbors, scores = build_graph(vectors, sets)
+    build_s = time.perf_counter() - start
+    previous = SimilarityGraph(neighbors, scores, documents=[None] * size)
+
+    # Replace a share of the rows with new content and delete as many more
+    changed = rng.choice(size, max(1, int(size * changed_share)), replace=False)
+    deleted = set(rng.choice(np.setdiff1d(np.arange(size), changed), len(changed), replace=False).tolist())
+    new_vectors, new_sets = synthetic_rows(rng, len(changed))
+    vectors, sets = vectors.copy(), list(sets)
+    vectors[changed], previous_rows = new_vectors, np.arange(size)
+    for row, ingredients in zip(changed, new_sets):
+        sets[row] = ingredients
+    previous_rows[changed] = -1
+    keep = np.array([row not in deleted for row in range(size)])
+    vectors, sets = vectors[keep], [ingredients for row, ingredients in enumerate(sets) if keep[row]]
+    previous_rows = previous_rows[keep]
+
+    start = time.perf_counter()
+    _, updated_scores, recomputed = update_graph(previous, previous_rows, vectors, sets)
+    update_s = time.perf_counter() - start
+    start = time.perf_counter()
+    _, rebuilt_scores = build_graph(vectors, sets)
+    rebuild_s = time.perf_counter() - start
+    exact = np.allclose(updated_scores, rebuilt_scores, atol=1e-5)
+
+    result = {
+        "documents": size,
+        "build_s": build_s,
+        "changed": len(changed),
+        "deleted": len(deleted),
+        "recomputed_rows": recomputed,
+        "update_s": update_s,
+        "rebuild_s": rebuild_s,
+        "graph_bytes": neighbors.nbytes + scores.nbytes,
+        "exact": exact,
+    }
+    print(f"{size:>8} docs  build {build_s:7.2f}s  {len(changed)} changed + {len(deleted)} deleted: "
+          f"update {update_s:6.2f}s ({recomputed} rows recomputed) vs rebuild {rebuild_s:6.2f}s  "
+          f"graph {result['graph_bytes'] / 1e6:.1f} MB  same as rebuild: {exact}")
+    return result, exact
+
+
+def timings_ms(fn, inputs):
+    fn(inputs[0])
+    samples = []
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def catalog_benchmark(directory, rounds):
+    container = fake_container(directory, vector_snapshot_max_docs=100_000)
+    container.startup()
+    try:
+        vector_store_service = container.vector_store_service
+        vector_store_service.export_snapshot()
+        vector_store_service.reload()
+        graph = vector_store_service.similarity_graph
+        if graph is None:
+            sys.exit("the exported snapshot has no similarity graph")
+        rag_service = container.create_rag_service()
+        seeds = [seed for seed in SEEDS if graph.row_of(seed) is not None]
+        criteria = [f"something like a {seed}" for seed in seeds] * rounds
+
+        from_graph = timings_ms(lambda text: rag_service.recommend_cocktails(text, count=5), criteria)
+        answered = sum(
+            rag_service.recommend_cocktails(text, count=5)["message"].endswith(f"similarity to {seed}")
+            for text, seed in zip(criteria, seeds)
+        )
+        # The same requests with no graph, as they were served before
+        vector_store_service.similarity_graph = None
+        searched = timings_ms(lambda text: rag_service.recommend_cocktails(text, count=5), criteria)
+    finally:
+        container.shutdown()
+
+    results = {
+        "graph": {f"{point}_ms": value for point, value in percentiles(from_graph).items()},
+        "search": {f"{point}_ms": value for point, value in percentiles(searched).items()},
+        "answered_from_graph": answered,
+        "requests": len(seeds),
+    }
+    print(f"{'catalog':>8}       'like X' p50 {results['graph']['p50_ms']:6.2f}ms from the graph "
+          f"vs {results['search']['p50_ms']:6.2f}ms searched  ({answered}/{len(seeds)} answered from the graph)")
+    return results, answered == len(seeds) and results["graph"]["p50_ms"] < results["search"]["p50_ms"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="5000", help="comma-separated synthetic corpus sizes")
+    parser.add_argument("--changed", type=float, default=0.01, help="share of rows changed (and deleted) per update")
+    parser.add_argument("--rounds", type=int, default=25, help="passes over the catalog requests")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        results["catalog"], ok = catalog_benchmark(directory, args.rounds)
+    for size in (int(size) for size in args.sizes.split(",") if size):
+        results[f"synthetic_{size}"], exact = synthetic_benchmark(size, args.changed)
+        ok &= exact
+
+    print(f"\nsaved {save_results('similarity_graph', results)}")
+    if not ok:
+        sys.exit("an incremental update differed from a rebuild, or the graph was not faster than searching")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Read-only workers serving vector snapshots while a single writer swaps versions
+
+Reader processes open the catalog store in read-only snapshot mode and
+search it in a loop, polling for a new version as the API does. Meanwhile
+this process, the only writer, rewrites the whole collection again and
+again (tagging every row with a generation) and exports each state as a
+new snapshot version, then rolls back to the previous one. Reports the
+search rate per process count, export time and how long readers took to
+see each swap. Exits non-zero if a result mixes documents from two
+generations, a reader fails, or a reader never sees a version.
+
+Run with: python -m benchmarks.bench_snapshot_swap [--workers 1,4] [--swaps N]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from api.services.vector_snapshot import SNAPSHOT_DIRNAME, activate_version, current_version, list_versions
+from api.services.vector_store_service import VectorStoreService
+from benchmarks.fakes import FakeEmbeddings
+from benchmarks.harness import build_store, catalog_documents, percentiles, save_results
+
+QUERIES = ["gin and lemon", "something with mint", "Margarita", "creamy coffee", "rum punch", "bitter campari"]
+POLL_INTERVAL = 0.05
+SWAP_INTERVAL = 0.5
+
+
+def reader(persist_directory, ready, stop, results):
+    service = VectorStoreService(persist_directory, embedding_function=FakeEmbeddings(), read_only=True)
+    service.search_similar(QUERIES[0], k=5)
+    ready.put(True)
+    searches, mixed, seen = 0, 0, {}
+    last_poll = 0.0
+    try:
+        while not stop.is_set():
+            if time.time() - last_poll >= POLL_INTERVAL:
+                service.refresh_snapshot()
+                last_poll = time.time()
+                seen.setdefault(service.snapshot.version, time.time())
+            docs = service.search_similar(QUERIES[searches % len(QUERIES)], k=5)
+            mixed += len({doc.metadata.get("generation") for doc in docs}) > 1
+            searches += 1
+        results.put({"searches": searches, "mixed": mixed, "seen": seen, "error": None})
+    except Exception as error:
+        results.put({"searches": searches, "mixed": mixed, "seen": seen, "error": repr(error)})
+
+
+def rewrite(service, generation):
+    """Upsert every row again with a new generation (and so a new content hash)"""
+    stored = service.vector_store._collection.get(include=["documents", "metadatas", "embeddings"])
+    metadatas = [
+        {**metadata, "generation": generation, "content_hash": f"generation-{generation}-{doc_id}"}
+        for doc_id, metadata in zip(stored["ids"], stored["metadatas"])
+    ]
+    service.upsert_embedded(stored["ids"], stored["documents"], metadatas, stored["embeddings"])
+
+
+def run(persist_directory, service, workers, swaps, generation):
+    context = multiprocessing.get_context("spawn")
+    ready, results, stop = context.Queue(), context.Queue(), context.Event()
+    processes = [
+        context.Process(target=reader, args=(persist_directory, ready, stop, results)) for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    # Readers import langchain and chromadb first
+    for _ in processes:
+        ready.get(timeout=120)
+
+    started = time.perf_counter()
+    activated, write_ms, export_ms = {}, [], []
+    directory = service.snapshot_directory
+    for offset in range(swaps):
+        with service.writer():
+            start = time.perf_counter()
+            rewrite(service, generation + offset)
+            write_ms.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            version = service.export_snapshot()
+            export_ms.append((time.perf_counter() - start) * 1000)
+        activated[version] = time.time()
+        time.sleep(SWAP_INTERVAL)
+
+    versions = list_versions(directory)
+    previous = versions[versions.index(current_version(directory)) - 1]
+    activate_version(directory, previous)
+    activated[previous] = time.time()
+    time.sleep(SWAP_INTERVAL)
+    stop.set()
+    duration = time.perf_counter() - started
+
+    reports = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join()
+
+    swap_ms = [
+        (report["seen"][version] - at) * 1000
+        for report in reports for version, at in activated.items() if version in report["seen"]
+    ]
+    missed = sum(version not in report["seen"] for report in reports for version in activated)
+    searches = sum(report["searches"] for report in reports)
+    return {
+        "workers": workers,
+        "searches_per_s": searches / duration,
+        "rewrite": {f"{point}_ms": value for point, value in percentiles(write_ms).items()},
+        "export": {f"{point}_ms": value for point, value in percentiles(export_ms).items()},
+        "swap_visible": {f"{point}_ms": value for point, value in percentiles(swap_ms).items()},
+        "mixed_results": sum(report["mixed"] for report in reports),
+        "missed_versions": missed,
+        "errors": [report["error"] for report in reports if report["error"]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,4", help="comma-separated reader process counts")
+    parser.add_argument("--swaps", type=int, default=5, help="snapshot versions exported per run")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        persist_directory = os.path.join(directory, "db")
+        build_store(persist_directory, catalog_documents(), FakeEmbeddings())
+        service = VectorStoreService(persist_directory, embedding_function=FakeEmbeddings())
+        rewrite(service, 0)
+        service.export_snapshot()
+        print(f"snapshots in {os.path.join(persist_directory, SNAPSHOT_DIRNAME)}")
+
+        for run_index, workers in enumerate(int(count) for count in args.workers.split(",")):
+            result = run(persist_directory, service, workers, args.swaps, 1 + run_index * args.swaps)
+            results.append(result)
+            print(f"{workers:3} readers  {result['searches_per_s']:8.0f} searches/s  "
+                  f"export p50 {result['export']['p50_ms']:6.1f}ms  "
+                  f"swap visible p50 {result['swap_visible']['p50_ms']:6.1f}ms "
+                  f"p99 {result['swap_visible']['p99_ms']:6.1f}ms  "
+                  f"mixed results {result['mixed_results']}  missed versions {result['missed_versions']}")
+            for error in result["errors"]:
+                print(f"  reader failed: {error}")
+
+    print(f"\nsaved {save_results('snapshot_swap', results)}")
+    if any(result["mixed_results"] or result["missed_versions"] or result["errors"] for result in results):
+        sys.exit("a reader saw an inconsistent result, missed a version or failed")
+
+
+if __name__ == "__main__":
+    main()
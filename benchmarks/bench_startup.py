@@ -0,0 +1,133 @@
+"""Cold start: import time, probe timings and time to first good response
+
+Measures `import api.main` in fresh interpreters, then starts real uvicorn
+workers over a local store (hashing embeddings, no network) with warmup
+on and off. For each it polls /healthz and /readyz from the moment the
+process is spawned, routes /api/recommend traffic once /readyz passes
+(as an orchestrator would), and compares the first request with the
+steady state. Exits non-zero if a probe never passes, /healthz passes
+after /readyz, or a routed request fails.
+
+Run with: python -m benchmarks.bench_startup
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from api.services.embedding_providers import HashingEmbeddings
+from benchmarks.harness import build_store, catalog_documents, free_port, save_results
+
+IMPORT_ROUNDS = 5
+STEADY_REQUESTS = 20
+STARTUP_TIMEOUT = 120
+# Not among the warmup queries, so nothing about it is cached ahead of time
+FIRST_CRITERIA = "a bitter aperitif with campari"
+
+
+def import_seconds(statement):
+    """Median wall time of `statement` in fresh interpreters"""
+    code = f"import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+    env = {**os.environ, "OPENAI_API_KEY": "sk-benchmark"}
+    samples = [
+        float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env).stdout)
+        for _ in range(IMPORT_ROUNDS)
+    ]
+    return statistics.median(samples)
+
+
+def wait_for(client, path, spawned, process):
+    while time.perf_counter() - spawned < STARTUP_TIMEOUT and process.poll() is None:
+        try:
+            if client.get(path).status_code == 200:
+                return time.perf_counter() - spawned
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def recommend(client, criteria):
+    start = time.perf_counter()
+    response = client.post("/api/recommend", json={"criteria": criteria, "count": 5})
+    return (time.perf_counter() - start) * 1000, response.status_code
+
+
+def measure_server(directory, warmup):
+    port = free_port()
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "sk-benchmark",
+        "ANONYMIZED_TELEMETRY": "False",
+        "EMBEDDING_PROVIDER": "hashing",
+        "VECTOR_DB_DIR": os.path.join(directory, "db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(directory, f"embeddings-{warmup}.sqlite"),
+        "PREFERENCE_DB_PATH": os.path.join(directory, "preferences.sqlite"),
+        "SESSION_DB_PATH": os.path.join(directory, "sessions.sqlite"),
+        "WARMUP_ENABLED": str(warmup),
+    }
+    spawned = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            healthz = wait_for(client, "/healthz", spawned, process)
+            readyz = wait_for(client, "/readyz", spawned, process)
+            if readyz is None:
+                return None
+            first_ms, first_status = recommend(client, FIRST_CRITERIA)
+            first_response = time.perf_counter() - spawned
+            steady = [recommend(client, f"something with gin, take {i}") for i in range(STEADY_REQUESTS)]
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        "healthz_s": healthz,
+        "readyz_s": readyz,
+        "first_response_s": first_response,
+        "first_request_ms": first_ms,
+        "steady_p50_ms": statistics.median(latency for latency, _ in steady),
+        "failed_requests": sum(status != 200 for _, status in [(first_ms, first_status)] + steady),
+    }
+
+
+def main():
+    results = {
+        "import_api_main_s": import_seconds("import api.main"),
+        "import_deferred_s": import_seconds(
+            "import api.main, api.services.rag_service, api.services.vector_store_service, utils.data_processor"
+        ),
+    }
+    print(f"import api.main: {results['import_api_main_s']:.2f}s "
+          f"(with the services it defers: {results['import_deferred_s']:.2f}s)\n")
+
+    ok = True
+    with tempfile.TemporaryDirectory() as directory:
+        build_store(os.path.join(directory, "db"), catalog_documents(), HashingEmbeddings())
+        for label, warmup in (("no warmup", False), ("warmup", True)):
+            result = measure_server(directory, warmup)
+            if result is None:
+                print(f"{label:10} never became ready")
+                ok = False
+                continue
+            results[label] = result
+            print(f"{label:10} /healthz {result['healthz_s']:5.2f}s  /readyz {result['readyz_s']:5.2f}s  "
+                  f"first good response {result['first_response_s']:5.2f}s  "
+                  f"first request {result['first_request_ms']:6.1f}ms vs steady p50 {result['steady_p50_ms']:5.1f}ms")
+            ok &= result["healthz_s"] is not None and result["healthz_s"] <= result["readyz_s"]
+            ok &= result["failed_requests"] == 0
+
+    print(f"\nsaved {save_results('startup', results)}")
+    if not ok:
+        sys.exit("a probe or a routed request failed")
+
+
+if __name__ == "__main__":
+    main()
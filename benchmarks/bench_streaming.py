@@ -0,0 +1,73 @@
+"""Time-to-first-token vs total latency for /api/chat and /api/chat/stream
+
+Run with: python -m benchmarks.bench_streaming
+"""
+import json
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.harness import fake_container, live_server, running_app
+
+FIRST_TOKEN_LATENCY = 0.3
+TOKEN_INTERVAL = 0.02
+ROUNDS = 10
+QUERY = {"query": "How do I make a test cocktail?"}
+
+
+def measure_blocking(client):
+    start = time.perf_counter()
+    response = client.post("/api/chat", json=QUERY)
+    response.raise_for_status()
+    total = (time.perf_counter() - start) * 1000
+    # Nothing is shown until the whole answer arrives
+    return total, total, None
+
+
+def measure_streaming(client):
+    start = time.perf_counter()
+    first_token = None
+    server_timings = None
+    with client.stream("POST", "/api/chat/stream", json=QUERY) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["type"] == "token" and first_token is None:
+                first_token = (time.perf_counter() - start) * 1000
+            elif event["type"] == "done":
+                server_timings = event
+    total = (time.perf_counter() - start) * 1000
+    return first_token, total, server_timings
+
+
+def run(container):
+    results = {}
+    with running_app(container) as app, live_server(app) as base_url:
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            for label, measure in (("/api/chat", measure_blocking), ("/api/chat/stream", measure_streaming)):
+                results[label] = [measure(client) for _ in range(ROUNDS)]
+    return results
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        results = run(fake_container(directory, llm_latency=FIRST_TOKEN_LATENCY,
+                                     tokens_per_second=1 / TOKEN_INTERVAL))
+
+    print(f"LLM: first token after {FIRST_TOKEN_LATENCY * 1000:.0f}ms, then one token every {TOKEN_INTERVAL * 1000:.0f}ms")
+    for label, samples in results.items():
+        ttft = statistics.median(sample[0] for sample in samples)
+        total = statistics.median(sample[1] for sample in samples)
+        print(f"{label:<18} ttft p50={ttft:7.1f}ms  total p50={total:7.1f}ms")
+        server = [sample[2] for sample in samples if sample[2]]
+        if server:
+            print(f"{'':<18} server-reported ttft p50={statistics.median(s['ttft_ms'] for s in server):7.1f}ms"
+                  f"  total p50={statistics.median(s['total_ms'] for s in server):7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
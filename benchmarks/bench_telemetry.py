@@ -0,0 +1,84 @@
+"""Cost of per-stage instrumentation, and what it reports
+
+Times a bare stage() call and /api/chat requests (fake LLM without delay,
+so instrumentation is as large a share of the request as it gets) with
+telemetry disabled and enabled. Exits non-zero if the enabled run is
+missing stages in its Server-Timing header or token and cache metrics in
+/metrics, or if the disabled run sends a Server-Timing header at all.
+
+Run with: python -m benchmarks.bench_telemetry
+"""
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+from api.services.telemetry import Telemetry
+from benchmarks.harness import fake_container, percentiles, running_app, save_results
+
+REQUESTS = 200
+STAGE_CALLS = 200_000
+EXPECTED_STAGES = {"retrieve", "vector_search", "embed", "prompt", "llm", "generate", "total"}
+EXPECTED_METRICS = ("cocktail_stage_duration_seconds_bucket", "cocktail_llm_tokens_total",
+                    "cocktail_cache_hit_ratio")
+
+
+def stage_overhead(telemetry):
+    """Nanoseconds per `with telemetry.stage(...)` block"""
+    start = time.perf_counter()
+    for _ in range(STAGE_CALLS):
+        with telemetry.stage("bench"):
+            pass
+    return (time.perf_counter() - start) / STAGE_CALLS * 1e9
+
+
+async def chat_requests(app):
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for i in range(REQUESTS):
+            start = time.perf_counter()
+            response = await client.post("/api/chat", json={"query": f"gin and lemon, take {i}", "use_cache": False})
+            latencies.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+        metrics = await client.get("/metrics")
+    return latencies, response.headers.get("server-timing"), metrics
+
+
+def main():
+    results = {}
+    ok = True
+    for label, enabled in (("disabled", False), ("enabled", True)):
+        ns = stage_overhead(Telemetry(enabled=enabled))
+        with tempfile.TemporaryDirectory() as directory:
+            with running_app(fake_container(directory, telemetry=Telemetry(enabled=enabled))) as app:
+                latencies, server_timing, metrics = asyncio.run(chat_requests(app))
+
+        results[label] = {"stage_ns": ns, "chat_mean_ms": statistics.fmean(latencies),
+                          **{f"chat_{k}_ms": v for k, v in percentiles(latencies).items()}}
+        print(f"telemetry {label:8}  stage() {ns:7.0f}ns  /api/chat mean={results[label]['chat_mean_ms']:6.2f}ms"
+              f"  p50={results[label]['chat_p50_ms']:6.2f}ms  p99={results[label]['chat_p99_ms']:6.2f}ms")
+
+        if not enabled:
+            ok &= server_timing is None and metrics.status_code == 404
+            continue
+        print(f"  Server-Timing: {server_timing}")
+        stages = {entry.split(";")[0].strip() for entry in (server_timing or "").split(",")}
+        missing = EXPECTED_STAGES - stages
+        missing_metrics = [name for name in EXPECTED_METRICS if name not in metrics.text]
+        if missing or missing_metrics:
+            print(f"  missing stages: {sorted(missing)}, missing metrics: {missing_metrics}")
+            ok = False
+
+    overhead = results["enabled"]["chat_mean_ms"] - results["disabled"]["chat_mean_ms"]
+    print(f"\ninstrumentation adds {overhead:+.2f}ms per chat request when enabled")
+    print(f"saved {save_results('telemetry', results)}")
+    if not ok:
+        sys.exit("telemetry did not report what it should")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Exact search over the memory-mapped snapshot vs Chroma's HNSW index
+
+At catalog scale (fake embeddings) and for synthetic corpora of random
+unit vectors, times one query at a time through Chroma's
+similarity_search_by_vector and through VectorSnapshot.search, a batch of
+queries through one matrix product, and the retriever the RAG service
+uses, with the snapshot on and off. The snapshot's top k is checked
+against a float64 brute-force reference, and Chroma's recall against the
+same reference is reported. Exits non-zero if the snapshot returns a
+wrong result or is slower than Chroma at catalog scale.
+
+Run with: python -m benchmarks.bench_vector_snapshot [--sizes 20000,50000] [--queries N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from langchain_chroma import Chroma
+
+from api.services.vector_snapshot import VectorSnapshot, export_snapshot, normalize_rows
+from api.services.vector_store_service import VectorStoreService
+from benchmarks.fakes import FakeEmbeddings
+from benchmarks.harness import build_store, catalog_documents, percentiles, save_results
+
+K = 10
+SYNTHETIC_DIMENSION = 384
+CATALOG_QUERIES = [
+    "a refreshing summer drink with mint",
+    "Margarita",
+    "something with gin and lemon juice",
+    "creamy coffee dessert cocktail",
+    "a bitter aperitif with campari",
+    "tropical rum punch with pineapple",
+    "non alcoholic fruity drink",
+    "whiskey sour with egg white",
+]
+
+
+def timings_us(fn, inputs):
+    """Per-call timings in microseconds, after one warm-up call"""
+    fn(inputs[0])
+    samples = []
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def summary(samples):
+    return {f"{point}_us": value for point, value in percentiles(samples).items()}
+
+
+def reference_scores(vectors, queries):
+    """Cosine similarity of every query to every stored vector, in float64"""
+    matrix = normalize_rows(np.asarray(vectors, dtype=np.float64))
+    return normalize_rows(np.asarray(queries, dtype=np.float64)) @ matrix.T
+
+
+def is_exact(rows, scores, k):
+    """Whether rows hold a true top k; ties may come back in any order, so scores are compared"""
+    best = np.sort(scores)[::-1][:k]
+    return len(rows) == len(best) and np.allclose(np.sort(scores[rows])[::-1], best, atol=1e-5)
+
+
+def compare_search(label, vector_store, snapshot, queries):
+    """Time Chroma and the snapshot on the same query vectors; returns (results, ok)"""
+    stored = vector_store._collection.get(include=["embeddings"])
+    row_of_id = {doc_id: row for row, doc_id in enumerate(stored["ids"])}
+    # The snapshot's row order, in terms of the reference rows
+    reference_rows = [row_of_id[doc["id"]] for doc in snapshot.documents]
+    scores = reference_scores(stored["embeddings"], queries)
+    expected = [set(np.argsort(-row, kind="stable")[:K].tolist()) for row in scores]
+
+    chroma = timings_us(lambda query: vector_store.similarity_search_by_vector(query, k=K), queries)
+    single = timings_us(
+        lambda query: [snapshot.document(row) for row, _ in snapshot.search(query, K)], queries
+    )
+    start = time.perf_counter()
+    batched = snapshot.search(queries, K)
+    batch_us = (time.perf_counter() - start) * 1e6 / len(queries)
+
+    exact = all(
+        is_exact([reference_rows[row] for row, _ in hits], row_scores, K)
+        for hits, row_scores in zip(batched, scores)
+    ) and all(
+        is_exact([reference_rows[row] for row, _ in snapshot.search(query, K)], row_scores, K)
+        for query, row_scores in zip(queries, scores)
+    )
+    chroma_recall = sum(
+        len({row_of_id[doc.id] for doc in vector_store.similarity_search_by_vector(query, k=K)} & want)
+        for query, want in zip(queries, expected)
+    ) / (K * len(queries))
+
+    results = {
+        "documents": len(snapshot),
+        "chroma": summary(chroma),
+        "snapshot": summary(single),
+        "snapshot_batched_per_query_us": batch_us,
+        "chroma_recall": chroma_recall,
+        "exact": exact,
+    }
+    print(f"{label:>16}  chroma p50 {results['chroma']['p50_us']:8.0f}us  "
+          f"snapshot p50 {results['snapshot']['p50_us']:8.0f}us  batched {batch_us:8.0f}us/query  "
+          f"chroma recall@{K} {chroma_recall:.3f}  snapshot exact: {exact}")
+    return results, exact
+
+
+def catalog_benchmark(directory, rounds):
+    embeddings = FakeEmbeddings()
+    persist_directory = os.path.join(directory, "catalog")
+    build_store(persist_directory, catalog_documents(), embeddings)
+    service = VectorStoreService(persist_directory, embedding_function=embeddings, snapshot_max_docs=100_000)
+    service.export_snapshot()
+    service.reload()
+    if service.snapshot is None:
+        sys.exit("the exported snapshot was not picked up")
+
+    queries = [embeddings.embed_query(text) for text in CATALOG_QUERIES] * rounds
+    results, ok = compare_search("catalog", service.vector_store, service.snapshot, queries)
+
+    # The full retriever path, query embedding included
+    texts = CATALOG_QUERIES * rounds
+    with_snapshot = timings_us(service.get_retriever({"k": K}).invoke, texts)
+    chroma_only = VectorStoreService(persist_directory, embedding_function=embeddings)
+    without_snapshot = timings_us(chroma_only.get_retriever({"k": K}).invoke, texts)
+    results["retriever_chroma"] = summary(without_snapshot)
+    results["retriever_snapshot"] = summary(with_snapshot)
+    print(f"{'retriever':>16}  chroma p50 {results['retriever_chroma']['p50_us']:8.0f}us  "
+          f"snapshot p50 {results['retriever_snapshot']['p50_us']:8.0f}us")
+
+    faster = results["snapshot"]["p50_us"] < results["chroma"]["p50_us"]
+    return results, ok and faster
+
+
+def synthetic_benchmark(directory, size, query_count):
+    rng = np.random.default_rng(size)
+    vectors = normalize_rows(rng.standard_normal((size, SYNTHETIC_DIMENSION))).astype(np.float32)
+    ids = [f"doc-{i}" for i in range(size)]
+    persist_directory = os.path.join(directory, f"synthetic-{size}")
+    vector_store = Chroma(persist_directory=persist_directory, embedding_function=FakeEmbeddings())
+    batch = vector_store._client.get_max_batch_size()
+    for start in range(0, size, batch):
+        vector_store._collection.add(
+            ids=ids[start:start + batch],
+            embeddings=vectors[start:start + batch],
+            documents=[f"document {i}" for i in range(start, min(size, start + batch))],
+            metadatas=[{"content_hash": str(i)} for i in range(start, min(size, start + batch))],
+        )
+
+    snapshot_directory = os.path.join(persist_directory, "snapshot")
+    # Search only; these rows have no ingredients to build a similarity graph from
+    export_snapshot(vector_store, snapshot_directory, "synthetic", graph_neighbors=0)
+    snapshot = VectorSnapshot.load(snapshot_directory)
+
+    # Queries near stored documents, like real queries near their answers
+    picks = rng.choice(size, query_count, replace=False)
+    queries = normalize_rows(vectors[picks] + 0.5 * rng.standard_normal((query_count, SYNTHETIC_DIMENSION)) /
+                             np.sqrt(SYNTHETIC_DIMENSION)).astype(np.float32)
+    return compare_search(f"{size} docs", vector_store, snapshot, queries.tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="20000", help="comma-separated synthetic corpus sizes")
+    parser.add_argument("--queries", type=int, default=200, help="queries per synthetic corpus")
+    parser.add_argument("--rounds", type=int, default=25, help="passes over the catalog queries")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        results["catalog"], ok = catalog_benchmark(directory, args.rounds)
+        for size in (int(size) for size in args.sizes.split(",") if size):
+            results[f"synthetic_{size}"], exact = synthetic_benchmark(directory, size, args.queries)
+            ok &= exact
+
+    print(f"\nsaved {save_results('vector_snapshot', results)}")
+    if not ok:
+        sys.exit("the snapshot returned a wrong result or was slower than Chroma at catalog scale")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Compare two saved benchmark results, e.g. before and after a change
+
+Prints every metric both files share with its relative change. Metrics
+ending in rps, qps or per_s are better when higher, latencies and sizes
+when lower. With --threshold, exits non-zero if any metric regressed by
+more than that fraction.
+
+Run with: python -m benchmarks.compare benchmarks/results/load-abc123.json benchmarks/results/load-def456.json
+"""
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = ("rps", "qps", "per_s")
+# Run settings and raw counts rather than measurements
+SKIPPED = {"settings", "concurrency", "requests", "statuses"}
+
+
+def flatten(value, prefix=""):
+    """{"a.b": number} for every number in nested results; list items keyed by concurrency when present"""
+    if isinstance(value, bool):
+        return {}
+    if isinstance(value, (int, float)):
+        return {prefix: value}
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = (
+            (f"c={item['concurrency']}" if isinstance(item, dict) and "concurrency" in item else str(i), item)
+            for i, item in enumerate(value)
+        )
+    else:
+        return {}
+    flat = {}
+    for key, item in items:
+        if key in SKIPPED:
+            continue
+        flat.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+
+def change(before, after):
+    return (after - before) / abs(before) if before else 0.0
+
+
+def regression(metric, before, after):
+    """Fractional change for the worse (negative when it improved)"""
+    return -change(before, after) if metric.endswith(HIGHER_IS_BETTER) else change(before, after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, help="fail on a regression larger than this, e.g. 0.1 for 10%%")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    old, new = flatten(before["results"]), flatten(after["results"])
+    print(f"{before['revision']} ({before['timestamp']}) -> {after['revision']} ({after['timestamp']})")
+    if before["machine"] != after["machine"]:
+        print(f"warning: different machines: {before['machine']} vs {after['machine']}")
+
+    regressed = []
+    width = max((len(metric) for metric in old), default=0)
+    for metric in sorted(old.keys() & new.keys()):
+        flag = ""
+        if args.threshold is not None and regression(metric, old[metric], new[metric]) > args.threshold:
+            regressed.append(metric)
+            flag = "  REGRESSED"
+        before, after = old[metric], new[metric]
+        print(f"{metric:<{width}} {before:>12.2f} {after:>12.2f} {change(before, after):>+8.1%}{flag}")
+
+    if regressed:
+        sys.exit(f"{len(regressed)} metrics regressed by more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
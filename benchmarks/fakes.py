@@ -0,0 +1,90 @@
+"""Offline stand-ins for the OpenAI chat and embedding models used by the benchmarks"""
+import asyncio
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from api.services.embedding_providers import HashingEmbeddings
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers after a fixed, injectable delay
+
+    `latency` is the time to first token and `token_interval` the delay
+    between streamed tokens; a full completion takes both into account.
+    Usage is reported like OpenAI does, counting words as tokens.
+    """
+
+    latency: float = 0.0
+    token_interval: float = 0.0
+    response: str = "A classic choice. Shake with ice and strain into a chilled glass."
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _tokens(self):
+        words = self.response.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def _usage(self, messages):
+        prompt = sum(len(str(message.content).split()) for message in messages)
+        completion = len(self._tokens())
+        return {"input_tokens": prompt, "output_tokens": completion, "total_tokens": prompt + completion}
+
+    def _result(self, messages):
+        message = AIMessage(content=self.response, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunk(self, messages, i, token):
+        # Like OpenAI, usage arrives with the last chunk
+        usage = self._usage(messages) if i == len(self._tokens()) - 1 else None
+        return ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency + self.token_interval * (len(self._tokens()) - 1))
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency + self.token_interval * (len(self._tokens()) - 1))
+        return self._result(messages)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                time.sleep(self.token_interval)
+            yield self._chunk(messages, i, token)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                await asyncio.sleep(self.token_interval)
+            yield self._chunk(messages, i, token)
+
+
+class FakeEmbeddings(HashingEmbeddings):
+    """Hashing embedding with an injectable per-call delay
+
+    Texts sharing words get similar vectors, unlike DeterministicFakeEmbedding,
+    so similarity and diversity behave roughly like a real model. `calls`
+    counts upstream requests (one per embed_documents/embed_query call).
+    """
+
+    def __init__(self, size=256, latency=0.0):
+        super().__init__(size)
+        self.latency = latency
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().embed_query(text)
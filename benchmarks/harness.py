@@ -0,0 +1,148 @@
+"""Shared benchmark setup: offline services, a live HTTP server and JSON results
+
+Everything here runs without network access or an OpenAI key. The fake
+chat model and embeddings are injected through the same seams production
+uses (LLMClientPool's client factory and VectorStoreService's embedding
+function), so the code under test is the real request path.
+"""
+import json
+import os
+import platform
+import socket
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import uvicorn
+from langchain_chroma import Chroma
+
+from api.main import app
+from api.services.container import ServiceContainer
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from utils.data_processor import CocktailDataProcessor
+
+CATALOG_PATH = "data/cocktails.csv"
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def catalog_documents(path=CATALOG_PATH):
+    processor = CocktailDataProcessor()
+    return processor.convert_to_documents(processor.load_cocktails_data(path))
+
+
+def build_store(persist_directory, documents, embeddings):
+    Chroma.from_documents(documents, embeddings, persist_directory=persist_directory,
+                          ids=[doc.id for doc in documents])
+
+
+def fake_container(directory, llm_latency=0.0, tokens_per_second=None, embed_latency=0.0,
+                   documents=None, **options):
+    """A ServiceContainer over the catalog with fake LLM and embeddings, state kept in directory
+
+    `llm_latency` is the time to first token and `tokens_per_second` the
+    streaming rate after it (unlimited when None). Pass
+    `llm_client_factory=None` to use real OpenAI clients instead.
+    """
+    embeddings = FakeEmbeddings()
+    persist_directory = os.path.join(directory, "db")
+    build_store(persist_directory, catalog_documents() if documents is None else documents, embeddings)
+    embeddings.latency = embed_latency
+
+    fake_llm = FakeChatModel(
+        latency=llm_latency,
+        token_interval=1 / tokens_per_second if tokens_per_second else 0.0,
+    )
+    options.setdefault("preference_db_path", os.path.join(directory, "preferences.sqlite"))
+    options.setdefault("session_db_path", os.path.join(directory, "sessions.sqlite"))
+    options.setdefault("llm_client_factory", lambda model_name: fake_llm)
+    return ServiceContainer(
+        persist_directory=persist_directory,
+        embedding_function=embeddings,
+        **options,
+    )
+
+
+@contextmanager
+def running_app(container):
+    """Start the container and serve it from the FastAPI app in this process"""
+    container.startup()
+    app.state.container = container
+    try:
+        yield app
+    finally:
+        app.state.container = None
+        container.shutdown()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def live_server(asgi_app):
+    """Serve an app on a local port from a background thread and yield its base URL
+
+    A real socket is needed where the in-process ASGI transport would
+    buffer whole responses, e.g. for streaming or load tests.
+    """
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(asgi_app, port=port, lifespan="off", log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    """Nearest-rank percentiles of a list of numbers, keyed p50, p95, ..."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {f"p{point}": None for point in points}
+    return {
+        f"p{point}": ordered[min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))]
+        for point in points
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(name, results, directory=None):
+    """Write results to <directory>/<name>-<revision>.json and return the path
+
+    The file records the commit, time and machine so runs can be compared
+    across commits with `python -m benchmarks.compare`.
+    """
+    directory = directory or RESULTS_DIR
+    os.makedirs(directory, exist_ok=True)
+    revision = git_revision()
+    path = os.path.join(directory, f"{name}-{revision}.json")
+    payload = {
+        "benchmark": name,
+        "revision": revision,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    return path
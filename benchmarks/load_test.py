@@ -0,0 +1,142 @@
+"""HTTP load generator: throughput and latency percentiles at increasing concurrency
+
+Each scenario runs closed-loop: N workers send one request after another for
+a fixed duration, so N is the number of requests in flight. Without --url the
+app is served locally over the catalog with the fake LLM and embeddings from
+benchmarks.harness, with LLM latency and token rate set from the options.
+Results are printed and saved as JSON under benchmarks/results/; exits
+non-zero if any request failed with something other than a 429.
+
+Run with: python -m benchmarks.load_test [--concurrency 1,8,32,64] [--duration 5]
+          python -m benchmarks.load_test --url http://localhost:8000   # an already running server
+"""
+import argparse
+import asyncio
+import itertools
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.harness import fake_container, live_server, percentiles, running_app, save_results
+
+QUERIES = [
+    "How do I make a Margarita?",
+    "Suggest something refreshing with gin and lemon juice",
+    "What cocktails use coffee liqueur?",
+    "I like rum. What should I try?",
+]
+
+# (method, path, JSON body) for a query
+SCENARIOS = {
+    "chat": lambda query: ("POST", "/api/chat", {"query": query, "use_cache": False}),
+    "chat-cached": lambda query: ("POST", "/api/chat", {"query": query}),
+    "recommend": lambda query: ("POST", "/api/recommend", {"criteria": query, "count": 5}),
+    "preferences": lambda query: ("GET", "/api/preferences", None),
+}
+
+
+async def worker(client, scenario, worker_id, deadline, latencies, statuses):
+    queries = itertools.cycle(QUERIES[worker_id % len(QUERIES):] + QUERIES[:worker_id % len(QUERIES)])
+    # One user per worker, as separate browser sessions would be
+    headers = {"X-User-Id": f"load-{worker_id}"}
+    while time.perf_counter() < deadline:
+        method, path, body = SCENARIOS[scenario](next(queries))
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, json=body, headers=headers)
+            status = response.status_code
+        except httpx.HTTPError as error:
+            status = type(error).__name__
+        if status == 200:
+            latencies.append((time.perf_counter() - start) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+
+
+async def run_level(base_url, scenario, concurrency, duration):
+    latencies, statuses = [], {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(
+            worker(client, scenario, i, deadline, latencies, statuses) for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    # Percentiles and throughput count successful responses only
+    return {
+        "concurrency": concurrency,
+        "requests": sum(statuses.values()),
+        "rps": len(latencies) / elapsed,
+        **{f"{k}_ms": v for k, v in percentiles(latencies).items()},
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+def failures(result):
+    return sum(count for status, count in result["statuses"].items() if status not in ("200", "429"))
+
+
+async def run(base_url, scenarios, levels, duration):
+    results = {}
+    print(f"{'scenario':12} {'conc':>5} {'requests':>9} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}  statuses")
+    for scenario in scenarios:
+        results[scenario] = []
+        for concurrency in levels:
+            result = await run_level(base_url, scenario, concurrency, duration)
+            results[scenario].append(result)
+            timings = " ".join(f"{result[f'p{p}_ms'] or 0:>7.1f}ms" for p in (50, 95, 99))
+            print(f"{scenario:12} {concurrency:>5} {result['requests']:>9} {result['rps']:>9.1f} {timings}"
+                  f"  {result['statuses']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="load an already running server instead of a local one with fakes")
+    parser.add_argument("--scenarios", default="chat,recommend,preferences",
+                        help=f"comma-separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32,64", help="comma-separated levels")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per level")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake LLM time to first token, seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="fake LLM token rate")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="fake embedding call latency, seconds")
+    parser.add_argument("--name", default="load", help="results file prefix")
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    if args.url:
+        results = asyncio.run(run(args.url, scenarios, levels, args.duration))
+    else:
+        print(f"local server, fake LLM: {args.llm_latency * 1000:.0f}ms to first token at "
+              f"{args.tokens_per_second:.0f} tokens/s, fake embeddings: {args.embed_latency * 1000:.0f}ms\n")
+        with tempfile.TemporaryDirectory() as directory:
+            container = fake_container(directory, llm_latency=args.llm_latency,
+                                       tokens_per_second=args.tokens_per_second,
+                                       embed_latency=args.embed_latency)
+            with running_app(container) as app, live_server(app) as base_url:
+                results = asyncio.run(run(base_url, scenarios, levels, args.duration))
+
+    results["settings"] = {
+        "target": args.url or "local",
+        "duration_s": args.duration,
+        "llm_latency_s": args.llm_latency,
+        "tokens_per_second": args.tokens_per_second,
+        "embed_latency_s": args.embed_latency,
+    }
+    print(f"\nsaved {save_results(args.name, results)}")
+
+    failed = sum(failures(result) for scenario in scenarios for result in results[scenario])
+    if failed:
+        sys.exit(f"{failed} requests failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import json
+import time
+import uuid
+
 import streamlit as st
 import requests
 
@@ -11,6 +15,11 @@ st.set_page_config(
 
 st.header('🍹 Cocktail Advisor Chat')
 
+# Each browser session keeps its own preferences on the API
+if 'user_id' not in st.session_state:
+    st.session_state['user_id'] = str(uuid.uuid4())
+HEADERS = {"X-User-Id": st.session_state['user_id']}
+
 # Sidebar for information
 with st.sidebar:
     st.header('About')
@@ -23,7 +32,7 @@ with st.sidebar:
     # Show preferences button
     if st.sidebar.button("Show My Preferences"):
         try:
-            prefs_response = requests.get(f"{API_URL}/preferences")
+            prefs_response = requests.get(f"{API_URL}/preferences", headers=HEADERS)
             preferences_data = prefs_response.json()
 
             if preferences_data and "preferences" in preferences_data and preferences_data["preferences"]:
@@ -69,9 +78,11 @@ with st.sidebar:
         except Exception as e:
             st.sidebar.error(f"Error fetching preferences: {str(e)}")
 
-# Initialize chat history
+# Initialize chat history (kept here only for display, the API keeps the conversation)
 if 'messages' not in st.session_state:
     st.session_state['messages'] = []
+if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = str(uuid.uuid4())
 
 # Display previous messages
 for message in st.session_state.messages:
@@ -89,27 +100,47 @@ if prompt:
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Prepare request for API
-    chat_history = st.session_state.messages[:-1]  # Exclude current message
-
+    # Prepare request for API; the server keeps the history for this session
     payload = {
         "query": prompt,
-        "chat_history": chat_history,
+        "session_id": st.session_state['session_id'],
         "model": "gpt-3.5-turbo"  # Fixed model
     }
 
-    # Make API request
-    with st.spinner("Thinking..."):
-        try:
-            response = requests.post(f"{API_URL}/chat", json=payload)
+    # Stream the answer from the API as it is generated
+    timings = {}
+
+    def stream_answer():
+        start = time.perf_counter()
+        with requests.post(f"{API_URL}/chat/stream", json=payload, headers=HEADERS, stream=True) as response:
             response.raise_for_status()
-            answer = response.json().get("answer", "Sorry, I couldn't process your request.")
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "context" and event["cocktails"]:
+                    st.caption("Looking at: " + ", ".join(event["cocktails"]))
+                elif event["type"] == "token":
+                    if "ttft_ms" not in timings:
+                        timings["ttft_ms"] = (time.perf_counter() - start) * 1000
+                    yield event["content"]
+                elif event["type"] == "session":
+                    timings["history_tokens"] = event["history_tokens"]
+                    timings["tokens_saved"] = event["tokens_saved"]
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+
+    with st.chat_message("assistant"):
+        try:
+            answer = st.write_stream(stream_answer())
         except Exception as e:
             answer = f"Error communicating with the API: {str(e)}"
+            st.markdown(answer)
 
-    # Display response
-    with st.chat_message("assistant"):
-        st.markdown(answer)
+        if "total_ms" in timings:
+            caption = f"First token in {timings.get('ttft_ms', timings['total_ms']):.0f} ms · total {timings['total_ms']:.0f} ms"
+            if "history_tokens" in timings:
+                caption += f" · history {timings['history_tokens']} tokens ({timings['tokens_saved']} saved)"
+            st.caption(caption)
 
     # Add response to history
-    st.session_state.messages.append({"role": "assistant", "content": answer})
\ No newline at end of file
+    st.session_state.messages.append({"role": "assistant", "content": answer})
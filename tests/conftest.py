@@ -0,0 +1,23 @@
+"""Shared fixtures: offline services built from the benchmark harness and fakes"""
+import tempfile
+from contextlib import contextmanager
+
+import httpx
+import pytest
+
+from benchmarks.harness import fake_container, running_app
+
+
+@pytest.fixture
+def app_client():
+    """Serve a fake container with the given options; yields (container, HTTP client)"""
+    @contextmanager
+    def serve(**options):
+        with tempfile.TemporaryDirectory() as directory:
+            container = fake_container(directory, **options)
+            with running_app(container) as app:
+                transport = httpx.ASGITransport(app=app)
+                yield container, httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30)
+
+    return serve
+
@@ -0,0 +1,85 @@
+import asyncio
+import tempfile
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+from api.services.answer_cache import AnswerCache
+from benchmarks.harness import fake_container, running_app
+
+DOCUMENTS = [
+    Document(page_content="Cocktail: Negroni", id="negroni"),
+    Document(page_content="Cocktail: Mojito", id="mojito"),
+]
+
+
+def key(cache, query="What is a Negroni?", model="gpt-4o-mini", documents=DOCUMENTS):
+    return cache.make_key(query, model, documents)
+
+
+def test_key_ignores_case_punctuation_and_document_order():
+    cache = AnswerCache()
+    assert key(cache) == key(cache, "what is a negroni", documents=DOCUMENTS[::-1])
+    assert key(cache) != key(cache, model="gpt-4o")
+
+
+def test_entries_expire_after_the_ttl():
+    cache = AnswerCache(ttl_seconds=0.05)
+    cache.put(key(cache), "Gin, Campari and vermouth")
+    assert cache.get(key(cache)) == "Gin, Campari and vermouth"
+    time.sleep(0.06)
+    assert cache.get(key(cache)) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted_at_the_byte_limit():
+    probe = AnswerCache()
+    probe.put(key(probe, "question 0"), "x" * 100)
+    cache = AnswerCache(max_bytes=probe.bytes * 2)
+    cache.put(key(cache, "question 0"), "x" * 100)
+    cache.put(key(cache, "question 1"), "x" * 100)
+    cache.get(key(cache, "question 0"))
+    cache.put(key(cache, "question 2"), "x" * 100)
+
+    assert cache.bytes <= cache.max_bytes
+    assert cache.get(key(cache, "question 1")) is None
+    assert cache.get(key(cache, "question 0")) is not None
+    assert cache.get(key(cache, "question 2")) is not None
+
+
+def test_semantic_hits_need_the_threshold_and_the_same_model_and_documents():
+    cache = AnswerCache(semantic_threshold=0.95)
+    cache.put(key(cache, "What is a Negroni?"), "Gin, Campari and vermouth", embedding=[1.0, 0.0])
+
+    assert cache.get(key(cache, "Tell me about the Negroni"), embedding=[0.99, 0.1]) is not None
+    assert cache.get(key(cache, "Something sweet"), embedding=[0.5, 0.5]) is None
+    assert cache.get(key(cache, "Tell me about the Negroni", model="gpt-4o"), embedding=[0.99, 0.1]) is None
+    assert cache.get(key(cache, "Tell me about the Negroni", documents=DOCUMENTS[:1]),
+                     embedding=[0.99, 0.1]) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+@pytest.fixture(scope="module")
+def container():
+    with tempfile.TemporaryDirectory() as directory:
+        container = fake_container(directory, answer_cache=AnswerCache())
+        with running_app(container):
+            yield container
+
+
+def test_turns_with_chat_history_are_never_cached_or_served(container):
+    rag_service = container.create_rag_service()
+    cache = container.answer_cache
+    history = [{"role": "user", "content": "I like gin"}, {"role": "assistant", "content": "Try a Negroni"}]
+
+    rag_service.ask_question("Something similar?", chat_history=history)
+    asyncio.run(rag_service.aask_question("Something similar?", chat_history=history))
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bypassed"] == 2
+
+    rag_service.ask_question("Something similar?")
+    assert cache.stats()["entries"] == 1
+    lookups = cache.stats()["exact_hits"]
+    rag_service.ask_question("Something similar?", chat_history=history)
+    assert cache.stats()["exact_hits"] == lookups
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+LLM_LATENCY = 0.5
+CONCURRENT_CHATS = 10
+
+
+def chat(client, query, **options):
+    return client.post("/api/chat", json={"query": query, "use_cache": False, **options})
+
+
+def test_concurrent_chats_finish_in_about_one_llm_latency(app_client):
+    with app_client(llm_latency=LLM_LATENCY, max_llm_concurrency=CONCURRENT_CHATS) as (_, client):
+        async def burst():
+            async with client:
+                await chat(client, "Warm up the chain and retriever")
+                start = time.perf_counter()
+                responses = await asyncio.gather(*(
+                    chat(client, f"What is in cocktail {i}?") for i in range(CONCURRENT_CHATS)
+                ))
+                return responses, time.perf_counter() - start
+
+        responses, elapsed = asyncio.run(burst())
+    assert [response.status_code for response in responses] == [200] * CONCURRENT_CHATS
+    assert elapsed < 2 * LLM_LATENCY
+
+
+def test_requests_over_the_limit_get_429(app_client):
+    with app_client(llm_latency=0.2, max_llm_concurrency=2, llm_queue_timeout=0) as (_, client):
+        async def burst():
+            async with client:
+                return await asyncio.gather(*(chat(client, f"What is in cocktail {i}?") for i in range(6)))
+
+        statuses = [response.status_code for response in asyncio.run(burst())]
+    assert statuses.count(200) == 2
+    assert statuses.count(429) == 4
+
+
+def test_identical_questions_share_one_answer(app_client):
+    with app_client(llm_latency=0.2) as (container, client):
+        async def burst():
+            async with client:
+                return await asyncio.gather(*(chat(client, "Something with gin and vermouth?") for _ in range(8)))
+
+        responses = asyncio.run(burst())
+        stats = container.single_flight.stats()
+    assert [response.status_code for response in responses] == [200] * 8
+    assert len({response.json()["answer"] for response in responses}) == 1
+    assert stats["calls"] == 1
+    assert stats["shared"] == 7
+
+
+def test_unknown_model_is_rejected(app_client):
+    with app_client() as (_, client):
+        async def request():
+            async with client:
+                return await chat(client, "How do I make a Martini?", model="not-a-model")
+
+        response = asyncio.run(request())
+    assert response.status_code == 422
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import pytest
+
+from api.services.concurrency import CircuitBreaker, ConcurrencyLimiter, ServiceBusyError, SingleFlight
+
+
+def test_limiter_rejects_without_queueing():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrency=2, queue_timeout=0)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        holders = [asyncio.create_task(hold()) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(ServiceBusyError):
+            async with limiter.slot():
+                pass
+        release.set()
+        await asyncio.gather(*holders)
+        async with limiter.slot():
+            pass
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.rejected == 1
+    assert limiter.in_flight == 0
+
+
+def test_limiter_rejects_after_queue_timeout():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrency=1, queue_timeout=0.05)
+        async with limiter.slot():
+            with pytest.raises(ServiceBusyError):
+                async with limiter.slot():
+                    pass
+
+    asyncio.run(scenario())
+
+
+def test_breaker_opens_on_failures_and_closes_after_a_successful_trial():
+    breaker = CircuitBreaker(window=10, min_calls=4, failure_ratio=0.5, reset_timeout=0.05)
+    for success in (True, False, True):
+        breaker.record(success)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one trial call at a time
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_breaker_reopens_when_the_trial_fails():
+    breaker = CircuitBreaker(min_calls=1, reset_timeout=0.05)
+    breaker.record(False)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened == 2
+
+
+def test_single_flight_shares_one_call():
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def scenario():
+        single_flight = SingleFlight()
+        results = await asyncio.gather(*(single_flight.run("key", answer) for _ in range(5)))
+        # Once finished, the next call runs again
+        await single_flight.run("key", answer)
+        return single_flight, results
+
+    single_flight, results = asyncio.run(scenario())
+    assert results == ["answer"] * 5
+    assert len(calls) == 2
+    assert single_flight.stats() == {"calls": 2, "shared": 4, "in_flight": 0}
+
+
+def test_single_flight_raises_to_every_caller_and_survives_a_cancelled_one():
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def scenario():
+        single_flight = SingleFlight()
+        first = asyncio.create_task(single_flight.run("key", failing))
+        await asyncio.sleep(0)
+        others = [asyncio.create_task(single_flight.run("key", failing)) for _ in range(2)]
+        await asyncio.sleep(0)
+        first.cancel()
+        return await asyncio.gather(*others, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,63 @@
+import ast
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from utils.data_processor import LIST_COLUMNS, CocktailDataProcessor, parse_list
+
+CATALOG_PATH = "data/cocktails.csv"
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("['Gin', 'Grand Marnier', 'Lemon Juice']", ["Gin", "Grand Marnier", "Lemon Juice"]),
+    ("['1 3/4 shot ', '1 Shot ', None]", ["1 3/4 shot", "1 Shot", ""]),
+    ("[\"Bailey's irish cream\", 'Ice']", ["Bailey's irish cream", "Ice"]),
+    ("['It\\'s a twist']", ["It's a twist"]),
+    ("[]", []),
+    ("", []),
+    (float("nan"), []),
+])
+def test_parse_list(value, expected):
+    assert parse_list(value) == expected
+
+
+def test_parse_list_matches_the_python_parser_on_the_catalog():
+    df = pd.read_csv(CATALOG_PATH)
+    for column in LIST_COLUMNS:
+        for value in df[column].dropna():
+            expected = ["" if item is None else str(item).strip() for item in ast.literal_eval(value)]
+            assert parse_list(value) == expected
+
+
+def test_parquet_snapshot_round_trips_the_csv(tmp_path):
+    path = str(tmp_path / "cocktails.csv")
+    shutil.copy(CATALOG_PATH, path)
+    processor = CocktailDataProcessor()
+    from_csv = CocktailDataProcessor(use_snapshot=False).load_cocktails_data(path)
+
+    processor.load_cocktails_data(path)
+    assert os.path.exists(processor.snapshot_path(path))
+    from_snapshot = processor._read_snapshot(path)
+    assert from_snapshot is not None
+    pd.testing.assert_frame_equal(from_snapshot, from_csv)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".partial")]
+
+
+def test_snapshot_is_not_written_when_disabled(tmp_path):
+    path = str(tmp_path / "cocktails.csv")
+    shutil.copy(CATALOG_PATH, path)
+    processor = CocktailDataProcessor()
+    processor.load_cocktails_data(path, write_snapshot=False)
+    assert not os.path.exists(processor.snapshot_path(path))
+
+
+def test_a_changed_csv_invalidates_the_snapshot(tmp_path):
+    path = str(tmp_path / "cocktails.csv")
+    shutil.copy(CATALOG_PATH, path)
+    processor = CocktailDataProcessor()
+    processor.load_cocktails_data(path)
+    with open(path, "a") as f:
+        f.write("\n")
+    assert processor._read_snapshot(path) is None
@@ -0,0 +1,92 @@
+from langchain_core.embeddings import Embeddings
+
+from api.services.embedding_cache import CachedEmbeddings, as_float32
+
+
+class CountingEmbeddings(Embeddings):
+    """Vectors derived from the text length, with values float32 cannot hold exactly"""
+
+    def __init__(self, model="counting"):
+        self.model = model
+        self.texts = []
+
+    def _vector(self, text):
+        return [0.1, len(text) / 3]
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.texts.append(text)
+        return self._vector(text)
+
+
+def test_misses_go_to_the_model_once_per_distinct_text():
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings(model)
+    vectors = cache.embed_documents(["gin", "rum", "gin", "  gin "])
+    assert model.texts == ["gin", "rum"]
+    assert vectors[0] == vectors[2] == vectors[3]
+    assert cache.stats()["misses"] == 2
+
+
+def test_memory_hits_are_least_recently_used():
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings(model, memory_size=2)
+    cache.embed_documents(["gin", "rum"])
+    cache.embed_query("gin")
+    cache.embed_query("vodka")  # evicts "rum", the least recently used
+    assert cache.stats()["memory_hits"] == 1
+
+    model.texts.clear()
+    cache.embed_documents(["gin", "vodka", "rum"])
+    assert model.texts == ["rum"]
+
+
+def test_disk_hits_survive_reopening(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = CachedEmbeddings(CountingEmbeddings(), cache_path=path)
+    expected = cache.embed_documents(["gin", "rum"])
+    cache.close()
+
+    model = CountingEmbeddings()
+    reopened = CachedEmbeddings(model, cache_path=path)
+    try:
+        assert reopened.embed_documents(["gin", "rum"]) == expected
+        assert model.texts == []
+        assert reopened.stats()["disk_hits"] == 2
+    finally:
+        reopened.close()
+
+
+def test_vectors_are_float32_rounded_on_hits_and_misses(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = CachedEmbeddings(CountingEmbeddings(), cache_path=path)
+    expected = as_float32([0.1, 1 / 3])
+    assert expected != [0.1, 1 / 3]
+    assert cache.embed_query("a") == expected  # miss
+    assert cache.embed_query("a") == expected  # memory hit
+    cache.close()
+
+    reopened = CachedEmbeddings(CountingEmbeddings(), cache_path=path)
+    try:
+        assert reopened.embed_documents(["a"]) == [expected]  # disk hit
+    finally:
+        reopened.close()
+
+
+def test_the_model_is_part_of_the_key(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    small = CachedEmbeddings(CountingEmbeddings("small"), cache_path=path)
+    small.embed_query("gin")
+    small.close()
+
+    model = CountingEmbeddings("large")
+    large = CachedEmbeddings(model, cache_path=path)
+    try:
+        large.embed_query("gin")
+        assert model.texts == ["gin"]
+        assert large.model_id != small.model_id
+    finally:
+        large.close()
@@ -0,0 +1,48 @@
+import tempfile
+
+import pytest
+
+from api.services.retrieval_config import RetrievalConfig
+from benchmarks.harness import fake_container, running_app
+
+QUERIES = ["something fruity with orange juice", "a refreshing drink with mint and lime"]
+FILTERS = [
+    {"alcoholic": ["Non alcoholic", "Optional alcohol"]},
+    {"glassType": ["Highball glass"]},
+    {"alcoholic": ["Alcoholic"], "category": ["Shot"]},
+]
+
+
+@pytest.fixture(scope="module")
+def container():
+    """A started fake container that may serve vectors from an exported snapshot"""
+    with tempfile.TemporaryDirectory() as directory:
+        container = fake_container(directory, vector_snapshot_max_docs=100_000)
+        with running_app(container):
+            yield container
+
+
+@pytest.mark.parametrize("mode", ["vector", "lexical", "hybrid"])
+@pytest.mark.parametrize("facets", FILTERS)
+def test_filtered_results_match_the_filter(container, mode, facets):
+    rag_service = container.create_rag_service()
+    retrieval = rag_service._filtered("", RetrievalConfig(mode=mode, k=10), facets, facets_from_query=False)
+    retriever = rag_service._build_retriever(retrieval)
+    for query in QUERIES:
+        docs = retriever.invoke(query)
+        assert docs
+        for doc in docs:
+            assert all(doc.metadata.get(facet) in values for facet, values in retrieval.facets)
+
+
+def test_snapshot_results_match_the_filter(container):
+    vector_store_service = container.vector_store_service
+    vector_store_service.export_snapshot()
+    vector_store_service.reload()
+    assert vector_store_service.snapshot is not None
+
+    rag_service = container.create_rag_service()
+    for facets in FILTERS:
+        retrieval = rag_service._filtered("", RetrievalConfig(mode="hybrid", k=10), facets, facets_from_query=False)
+        for doc in rag_service._build_retriever(retrieval).invoke(QUERIES[0]):
+            assert all(doc.metadata.get(facet) in values for facet, values in retrieval.facets)
@@ -0,0 +1,77 @@
+import tempfile
+from typing import List
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from api.services.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+from api.services.lexical_index import BM25Index
+from api.services.retrieval_config import RetrievalConfig
+from benchmarks.harness import fake_container, running_app
+
+
+def doc(name):
+    return Document(page_content=f"Cocktail: {name}", metadata={"name": name}, id=name)
+
+
+class FixedRetriever(BaseRetriever):
+    """Returns the same ranked documents for every query"""
+
+    documents: List[Document]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return self.documents
+
+
+def names(docs):
+    return [d.id for d in docs]
+
+
+def test_rrf_scores_documents_ranked_by_both_lists_highest():
+    vector = [doc("a"), doc("b"), doc("c")]
+    lexical = [doc("b"), doc("d"), doc("c")]
+    assert names(reciprocal_rank_fusion([vector, lexical], [1.0, 1.0], k=4)) == ["b", "c", "a", "d"]
+
+
+def test_rrf_weights_favor_one_side():
+    vector = [doc("a"), doc("b")]
+    lexical = [doc("b"), doc("a")]
+    assert names(reciprocal_rank_fusion([vector, lexical], [2.0, 1.0], k=2)) == ["a", "b"]
+    assert names(reciprocal_rank_fusion([vector, lexical], [1.0, 2.0], k=2)) == ["b", "a"]
+
+
+def test_rrf_keeps_one_copy_of_each_document():
+    fused = reciprocal_rank_fusion([[doc("a"), doc("b")], [doc("a"), doc("b")]], [1.0, 1.0], k=10)
+    assert names(fused) == ["a", "b"]
+
+
+def test_hybrid_retriever_fuses_both_sides():
+    documents = [doc("Negroni"), doc("Mojito"), doc("Margarita")]
+    documents[1].page_content += " with mint and lime"
+    retriever = HybridRetriever(
+        vector_retriever=FixedRetriever(documents=[documents[0], documents[2]]),
+        lexical_index=BM25Index(documents),
+        k=2,
+    )
+    assert names(retriever.invoke("mint")) == ["Negroni", "Mojito"]
+
+
+@pytest.fixture(scope="module")
+def container():
+    with tempfile.TemporaryDirectory() as directory:
+        container = fake_container(directory)
+        with running_app(container):
+            yield container
+
+
+def test_lexical_mode_does_not_embed_the_query(container):
+    rag_service = container.create_rag_service()
+    embeddings = container.embedding_function
+    before = embeddings.stats()
+    docs = rag_service._build_retriever(RetrievalConfig(mode="lexical", k=5)).invoke("fresh mint and lime")
+    after = embeddings.stats()
+    assert docs
+    assert (after["memory_hits"], after["disk_hits"], after["misses"]) == (
+        before["memory_hits"], before["disk_hits"], before["misses"]
+    )
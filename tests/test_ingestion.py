@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from api.services.vector_store_service import VectorStoreService
+from benchmarks.fakes import FakeEmbeddings
+from benchmarks.harness import catalog_documents
+from utils.ingestion import SOURCE, IncrementalIngestor
+
+
+class RecordingEmbeddings(FakeEmbeddings):
+    """Fake embeddings that remember every text sent to embed_documents"""
+
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return VectorStoreService(os.path.join(tmp_path, "db"), embedding_function=RecordingEmbeddings())
+
+
+def rows(count=10):
+    return catalog_documents()[:count]
+
+
+def ingest(store, documents):
+    """Ingest stats and the texts embedded for them"""
+    store.embedding_function.texts.clear()
+    stats = IncrementalIngestor(store, batch_size=4).ingest(documents)
+    return stats, store.embedding_function.texts
+
+
+def test_reingesting_an_unchanged_catalog_embeds_nothing(store):
+    stats, texts = ingest(store, rows())
+    assert stats["upserted"] == 10 and len(texts) == 10
+
+    stats, texts = ingest(store, rows())
+    assert texts == []
+    assert (stats["unchanged"], stats["upserted"], stats["deleted"]) == (10, 0, 0)
+
+
+def test_a_changed_row_is_the_only_one_embedded(store):
+    ingest(store, rows())
+    documents = rows()
+    documents[3].page_content += " Garnish with a lemon twist."
+
+    stats, texts = ingest(store, documents)
+    assert texts == [documents[3].page_content]
+    assert (stats["unchanged"], stats["upserted"]) == (9, 1)
+
+
+def test_a_removed_row_is_deleted(store):
+    ingest(store, rows())
+    documents = rows()
+    removed = documents.pop(5)
+
+    stats, texts = ingest(store, documents)
+    assert texts == []
+    assert stats["deleted"] == 1
+    stored = store.get_content_hashes(SOURCE)
+    assert removed.id not in stored and len(stored) == 9
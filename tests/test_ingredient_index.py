@@ -0,0 +1,40 @@
+import pytest
+
+from api.services.ingredient_index import IngredientIndex
+
+CATALOG = {
+    "Gin Tonic": ["Gin", "Tonic water"],
+    "Moscow Mule": ["Vodka", "Ginger beer", "Lime juice"],
+    "Dark and Stormy": ["Dark rum", "Ginger beer"],
+    "Daiquiri": ["Light rum", "Lime juice", "Sugar syrup"],
+    "Gimlet": ["Gin", "Lime juice"],
+}
+
+
+@pytest.fixture
+def index():
+    return IngredientIndex(list(CATALOG), list(CATALOG.values()))
+
+
+def test_all_of(index):
+    assert index.query(all_of=["gin", "lime juice"]) == ["Gimlet"]
+
+
+def test_any_of_ranks_drinks_matching_more_terms_first(index):
+    assert index.query(any_of=["vodka", "ginger beer"]) == ["Moscow Mule", "Dark and Stormy"]
+
+
+def test_none_of(index):
+    assert set(index.query(all_of=["lime juice"], none_of=["rum"])) == {"Moscow Mule", "Gimlet"}
+
+
+def test_terms_match_whole_words(index):
+    assert set(index.query(all_of=["gin"])) == {"Gin Tonic", "Gimlet"}
+    assert set(index.query(all_of=["rum"])) == {"Dark and Stormy", "Daiquiri"}
+    assert index.query(all_of=["gin beer"]) == []
+
+
+def test_parse_query(index):
+    assert index.parse_query("cocktails with gin and lime juice") == (["gin", "lime juice"], [], [])
+    assert index.parse_query("vodka or dark rum") == ([], ["vodka", "dark rum"], [])
+    assert index.parse_query("ginger beer but no vodka") == (["ginger beer"], [], ["vodka"])
@@ -0,0 +1,95 @@
+import asyncio
+from typing import List
+
+import httpx
+import openai
+import pytest
+
+from api.services import llm_service
+from api.services.concurrency import CircuitBreaker, UpstreamUnavailableError
+from api.services.llm_service import ResilientChatModel
+from benchmarks.fakes import FakeChatModel
+
+
+class FailingChatModel(FakeChatModel):
+    """Fake chat model that raises the queued errors, one per call, before answering"""
+
+    errors: List[Exception] = []
+    calls: int = 0
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        yield from super()._stream(messages, stop, run_manager, **kwargs)
+
+
+def status_error(cls, status):
+    response = httpx.Response(status, request=httpx.Request("POST", "http://upstream/v1/chat/completions"))
+    return cls("injected", response=response, body=None)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_service, "retry_delay", lambda attempt: 0)
+
+
+def test_transient_errors_are_retried():
+    client = FailingChatModel(errors=[status_error(openai.InternalServerError, 500)] * 2)
+    model = ResilientChatModel("primary", client, max_retries=2)
+    assert model.invoke("hi").content == client.response
+    assert client.calls == 3
+    assert model.retries == 2
+    assert model.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_exhausted_retries_raise_upstream_unavailable():
+    client = FailingChatModel(errors=[status_error(openai.InternalServerError, 500)] * 2)
+    model = ResilientChatModel("primary", client, max_retries=1)
+    with pytest.raises(UpstreamUnavailableError):
+        model.invoke("hi")
+
+
+def test_client_errors_are_raised_and_leave_the_breaker_alone():
+    breaker = CircuitBreaker(min_calls=1)
+    client = FailingChatModel(errors=[status_error(openai.BadRequestError, 400)] * 3)
+    fallback = FakeChatModel(response="fallback")
+    model = ResilientChatModel("primary", client, fallback_model="fallback", fallback=fallback, breaker=breaker)
+    for _ in range(3):
+        with pytest.raises(openai.BadRequestError):
+            model.invoke("hi")
+    assert client.calls == 3
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert model.fallbacks == 0
+
+
+def test_upstream_failures_open_the_breaker_and_go_to_the_fallback():
+    breaker = CircuitBreaker(min_calls=2, reset_timeout=60)
+    client = FailingChatModel(errors=[status_error(openai.InternalServerError, 500)] * 10)
+    fallback = FakeChatModel(response="fallback")
+    model = ResilientChatModel("primary", client, fallback_model="fallback", fallback=fallback,
+                               max_retries=0, breaker=breaker)
+    answers = [model.invoke("hi").content for _ in range(4)]
+    assert answers == ["fallback"] * 4
+    assert breaker.state == CircuitBreaker.OPEN
+    # Once open, the primary is not called any more
+    assert client.calls == 2
+    assert model.fallbacks == 4
+
+
+def test_open_breaker_without_fallback_raises_upstream_unavailable():
+    breaker = CircuitBreaker(min_calls=1, reset_timeout=60)
+    breaker.record(False)
+    client = FakeChatModel()
+    model = ResilientChatModel("primary", client, breaker=breaker)
+    with pytest.raises(UpstreamUnavailableError):
+        model.invoke("hi")
+
+
+def test_slow_first_token_goes_to_the_fallback():
+    client = FakeChatModel(latency=1.0)
+    fallback = FakeChatModel(response="fallback")
+    model = ResilientChatModel("primary", client, fallback_model="fallback", fallback=fallback,
+                               latency_budget=0.05)
+    assert asyncio.run(model.ainvoke("hi")).content == "fallback"
+    assert model.fallbacks == 1
@@ -0,0 +1,40 @@
+import pytest
+
+from api.services.preference_extractor import PreferenceExtractor, short_names
+
+VOCABULARY = ["gin", "vodka", "lime", "lime juice", "lemon", "lemon juice", "tonic water", "soda water",
+              "sweet vermouth", "ginger beer", "cranberry juice"]
+
+
+@pytest.fixture
+def extractor():
+    return PreferenceExtractor(VOCABULARY)
+
+
+@pytest.mark.parametrize("text, likes, dislikes", [
+    ("I love gin", ["gin"], []),
+    ("I like cocktails with no vodka", [], ["vodka"]),
+    ("I enjoy gin drinks without lime", ["gin"], ["lime"]),
+    ("I don't like vodka", [], ["vodka"]),
+    ("I love gin but not vodka", ["gin"], ["vodka"]),
+    ("I hate vodka. I love gin", ["gin"], ["vodka"]),
+    ("What can I make with gin?", [], []),
+])
+def test_negated_ingredients_are_dislikes(extractor, text, likes, dislikes):
+    assert extractor.extract(text) == (likes, dislikes)
+
+
+def test_multi_word_ingredients_match_as_one(extractor):
+    assert extractor.extract("I love sweet vermouth and ginger beer") == (["sweet vermouth", "ginger beer"], [])
+    assert extractor.extract("I like fresh lime juice") == (["lime juice"], [])
+
+
+def test_short_names_resolve_to_the_catalog_name(extractor):
+    assert extractor.extract("I love tonic") == (["tonic water"], [])
+    assert extractor.extract("I like cranberry but hate soda") == (["cranberry juice"], ["soda water"])
+    # A short name that is an ingredient itself keeps its own meaning
+    assert extractor.extract("I love lemon") == (["lemon"], [])
+
+
+def test_ambiguous_short_names_are_not_expanded():
+    assert short_names(["grape juice", "grape water", "tonic water"]) == {"tonic": "tonic water"}
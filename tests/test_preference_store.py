@@ -0,0 +1,92 @@
+import os
+import threading
+
+import pytest
+from langchain_core.documents import Document
+
+from api.services.embedding_providers import HashingEmbeddings
+from api.services.preference_store import DEFAULT_USER_ID, PreferenceStore
+from api.services.vector_store_service import VectorStoreService
+from benchmarks.harness import build_store
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "preferences.sqlite")
+
+
+def test_concurrent_adds_from_several_stores_keep_every_item(path):
+    # One store per thread stands in for one per worker process
+    stores = [PreferenceStore(path) for _ in range(4)]
+    threads = [
+        threading.Thread(target=lambda store=store, n=n: [
+            store.add("user", "ingredients", [f"ingredient {n}-{i}"]) for i in range(25)
+        ])
+        for n, store in enumerate(stores)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for store in stores:
+        assert len(store.get("user", "ingredients")) == 100
+        store.close()
+
+
+def test_merges_skip_case_insensitive_duplicates_and_users_stay_apart(path):
+    store = PreferenceStore(path)
+    try:
+        store.add("alice", "ingredients", ["Gin", "Lime"])
+        assert store.add("alice", "ingredients", ["gin", "Mint"]) == ["Gin", "Lime", "Mint"]
+        assert store.get("bob", "ingredients") == []
+    finally:
+        store.close()
+
+
+def test_writes_from_another_process_are_not_served_stale(path):
+    reader, writer = PreferenceStore(path), PreferenceStore(path)
+    try:
+        assert reader.get("user", "cocktails") == []
+        writer.add("user", "cocktails", ["Negroni"])
+        assert reader.get("user", "cocktails") == ["Negroni"]
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_migration_from_the_vector_store_is_idempotent(tmp_path, path, monkeypatch):
+    from utils import migrate_preferences
+
+    persist_directory = str(tmp_path / "db")
+    build_store(persist_directory, [
+        Document(page_content="Cocktail: Negroni", metadata={"name": "Negroni"}, id="0"),
+        Document(page_content="ingredients: Gin, Lime", id="pref-ingredients", metadata={
+            "source": migrate_preferences.PREFERENCE_SOURCE, "preference_type": "ingredients",
+            "content_str": "Gin, Lime",
+        }),
+    ], HashingEmbeddings())
+    monkeypatch.setenv("VECTOR_DB_DIR", persist_directory)
+    monkeypatch.setenv("PREFERENCE_DB_PATH", path)
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "hashing")
+
+    # A run interrupted after saving the preferences but before deleting the documents
+    def interrupted(self, ids):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patched:
+        patched.setattr(VectorStoreService, "delete_documents", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            migrate_preferences.migrate_preferences()
+    migrate_preferences.migrate_preferences()
+    migrate_preferences.migrate_preferences()
+
+    store = PreferenceStore(path)
+    try:
+        assert store.get(DEFAULT_USER_ID, "ingredients") == ["Gin", "Lime"]
+    finally:
+        store.close()
+    remaining = VectorStoreService(persist_directory, embedding_function=HashingEmbeddings()).vector_store.get(
+        where={"source": migrate_preferences.PREFERENCE_SOURCE}
+    )
+    assert remaining["ids"] == []
@@ -0,0 +1,59 @@
+import asyncio
+import tempfile
+
+import numpy as np
+import pytest
+
+from api.services import rag_service as rag_module
+from api.services.diversity import mmr_select
+from benchmarks.harness import fake_container, running_app
+
+
+@pytest.fixture(scope="module")
+def container():
+    with tempfile.TemporaryDirectory() as directory:
+        container = fake_container(directory)
+        with running_app(container):
+            yield container
+
+
+def names(result):
+    return [recommendation["name"] for recommendation in result["recommendations"]]
+
+
+def test_mmr_without_diversity_keeps_the_ranking():
+    similarity = np.ones((4, 4))
+    assert mmr_select([1.0, 0.9, 0.8, 0.7], similarity, 3, lambda_mult=1.0) == [0, 1, 2]
+
+
+def test_mmr_skips_near_duplicates():
+    similarity = np.eye(3)
+    similarity[0, 1] = similarity[1, 0] = 0.99
+    assert mmr_select([1.0, 0.9, 0.8], similarity, 2, lambda_mult=0.5) == [0, 2]
+
+
+def test_results_are_distinct_cocktails(container):
+    result = container.create_rag_service().recommend_cocktails("something fruity", count=8)
+    assert len(names(result)) == len(set(names(result))) == 8
+
+
+def test_diversity_reorders_exact_ingredient_matches(container):
+    rag_service = container.create_rag_service()
+    ranked = rag_service.recommend_cocktails("cocktails with vodka", count=5, diversity=0.0)
+    diverse = rag_service.recommend_cocktails("cocktails with vodka", count=5, diversity=1.0)
+    assert names(ranked) != names(diverse)
+    # Still only exact matches
+    for result in (ranked, diverse):
+        assert all("vodka" in r["ingredients"].casefold() for r in result["recommendations"])
+
+    diverse_async = asyncio.run(rag_service.arecommend_cocktails("cocktails with vodka", count=5, diversity=1.0))
+    assert names(diverse_async) == names(diverse)
+
+
+def test_seen_cocktails_keep_a_recent_window(container, monkeypatch):
+    monkeypatch.setattr(rag_module, "SEEN_COCKTAILS_WINDOW", 3)
+    rag_service = container.create_rag_service()
+    rag_service.user_id = "window-test"
+    rag_service.record_seen(["Negroni", "Mojito"])
+    rag_service.record_seen(["Margarita", "Daiquiri"])
+    assert rag_service.record_seen(["Mojito"]) == ["Margarita", "Daiquiri", "Mojito"]
@@ -0,0 +1,61 @@
+import asyncio
+
+from api.services.preference_store import DEFAULT_USER_ID
+from api.services.session_store import SessionStore
+
+BUDGET = 300
+ANSWER = (
+    "A Negroni is a good fit: equal parts gin, Campari and sweet vermouth, stirred over ice "
+    "and garnished with an orange peel."
+)
+
+
+def test_history_stays_within_the_token_budget(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.sqlite"), max_history_tokens=BUDGET, max_summary_words=30)
+    try:
+        for turn in range(30):
+            history = store.history("user", "session")
+            assert history.prompt_tokens <= BUDGET
+            store.append_turn("user", "session", f"Turn {turn}: something with more citrus?", ANSWER)
+
+        summary, pending = store.pending_summary("user", "session")
+        assert not summary and pending
+        store.fold_summary("user", "session", "The user likes Negronis and wants more citrus.", len(pending))
+
+        summary, pending = store.pending_summary("user", "session")
+        history = store.history("user", "session")
+        assert summary and not pending
+        assert history.messages[0]["role"] == "system"
+        assert history.prompt_tokens <= BUDGET < history.full_tokens
+    finally:
+        store.close()
+
+
+def test_sessions_are_scoped_to_their_user(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.sqlite"))
+    try:
+        store.append_turn("alice", "session", "Hi", "Hello")
+        assert store.history("bob", "session").messages == []
+        assert len(store.history("alice", "session").messages) == 2
+    finally:
+        store.close()
+
+
+def test_session_chats_stay_within_budget_and_fold_overflow_into_the_summary(app_client):
+    with app_client(max_history_tokens=BUDGET) as (container, client):
+        async def converse():
+            async with client:
+                return [
+                    (await client.post("/api/chat", json={
+                        "query": f"Turn {turn}: what else would you suggest with more citrus?",
+                        "session_id": "citrus",
+                        "use_cache": False,
+                    })).json()
+                    for turn in range(15)
+                ]
+
+        responses = asyncio.run(converse())
+        summary, pending = container.session_store.pending_summary(DEFAULT_USER_ID, "citrus")
+    assert all(response["history_tokens"] <= BUDGET for response in responses)
+    assert responses[-1]["tokens_saved"] > 0
+    assert summary and not pending
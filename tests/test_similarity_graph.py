@@ -0,0 +1,58 @@
+import numpy as np
+
+from api.services.similarity_graph import SimilarityGraph, build_graph, update_graph
+from api.services.vector_snapshot import normalize_rows
+from benchmarks.harness import fake_container, running_app
+
+SIZE = 2000
+DIMENSION = 32
+
+
+def random_rows(rng, count):
+    vectors = normalize_rows(rng.standard_normal((count, DIMENSION))).astype(np.float32)
+    sets = [frozenset(rng.choice(100, rng.integers(2, 7), replace=False).tolist()) for _ in range(count)]
+    return vectors, sets
+
+
+def test_incremental_update_matches_a_rebuild():
+    rng = np.random.default_rng(0)
+    vectors, sets = random_rows(rng, SIZE)
+    neighbors, scores = build_graph(vectors, sets)
+    previous = SimilarityGraph(neighbors, scores, documents=[None] * SIZE)
+
+    # Change 10 rows and delete 10 others
+    changed = rng.choice(SIZE, 10, replace=False)
+    deleted = rng.choice(np.setdiff1d(np.arange(SIZE), changed), 10, replace=False)
+    new_vectors, new_sets = random_rows(rng, len(changed))
+    vectors, sets, previous_rows = vectors.copy(), list(sets), np.arange(SIZE)
+    vectors[changed] = new_vectors
+    for row, ingredients in zip(changed, new_sets):
+        sets[row] = ingredients
+    previous_rows[changed] = -1
+    keep = np.ones(SIZE, dtype=bool)
+    keep[deleted] = False
+    vectors, previous_rows = vectors[keep], previous_rows[keep]
+    sets = [ingredients for row, ingredients in enumerate(sets) if keep[row]]
+
+    _, updated_scores, recomputed = update_graph(previous, previous_rows, vectors, sets)
+    _, rebuilt_scores = build_graph(vectors, sets)
+
+    assert recomputed < len(sets)
+    np.testing.assert_allclose(updated_scores, rebuilt_scores, atol=1e-5)
+
+
+def test_drinks_like_a_cocktail_are_answered_from_the_graph(tmp_path):
+    container = fake_container(str(tmp_path), vector_snapshot_max_docs=100_000)
+    with running_app(container):
+        vector_store_service = container.vector_store_service
+        vector_store_service.export_snapshot()
+        vector_store_service.reload()
+        graph = vector_store_service.similarity_graph
+        neighbors = [graph.document(row).metadata["name"] for row, _ in graph.similar(graph.row_of("Negroni"), 5)]
+
+        embeddings = container.embedding_function.stats()
+        result = container.create_rag_service().recommend_cocktails("something like a Negroni", count=5)
+        assert [r["name"] for r in result["recommendations"]] == neighbors
+        assert "Negroni" not in neighbors
+        # Nothing was embedded or looked up
+        assert container.embedding_function.stats() == embeddings
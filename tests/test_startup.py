@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api import main
+from benchmarks.harness import fake_container
+
+
+@pytest.fixture
+def create_container(tmp_path, monkeypatch):
+    """Make the lifespan build a fake container after `delay` seconds; `built` lists the containers"""
+    built = []
+
+    def create(tracer, executor=None):
+        time.sleep(create.delay)
+        container = fake_container(str(tmp_path), executor=executor)
+        container.startup_thread = threading.current_thread().name
+        built.append(container)
+        container.startup()
+        return container
+
+    create.delay = 0.0
+    create.built = built
+    monkeypatch.setattr(main, "create_container", create)
+    return create
+
+
+async def wait_until(condition, timeout=30):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_the_bounded_executor_is_the_only_default_executor(create_container):
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        async with main.lifespan(main.app):
+            await wait_until(lambda: main.app.state.container is not None and main.app.state.container.warm)
+            container = main.app.state.container
+            await asyncio.to_thread(lambda: None)
+            assert loop._default_executor is container.executor
+            # Startup itself already ran on the bounded pool
+            assert container.startup_thread.startswith("blocking-io")
+        return container
+
+    container = asyncio.run(scenario())
+    assert container.executor._shutdown
+
+
+def test_shutdown_during_startup_releases_the_services(create_container, monkeypatch):
+    monkeypatch.setattr(main, "SNAPSHOT_POLL_INTERVAL", 0.05)
+    create_container.delay = 0.5
+
+    async def scenario():
+        async with main.lifespan(main.app):
+            await asyncio.sleep(0.05)
+        return main.app.state.container
+
+    start = time.perf_counter()
+    assert asyncio.run(asyncio.wait_for(scenario(), timeout=10)) is None
+    assert time.perf_counter() - start < 5
+    container, = create_container.built
+    assert not container.ready
+    assert container.executor._shutdown
+
+
+def test_shutdown_stops_the_snapshot_watcher(create_container, monkeypatch):
+    monkeypatch.setattr(main, "SNAPSHOT_POLL_INTERVAL", 0.05)
+
+    async def scenario():
+        async with main.lifespan(main.app):
+            await wait_until(lambda: main.app.state.container is not None and main.app.state.container.warm)
+            watcher = main.app.state.snapshot_watcher
+            assert not watcher.done()
+        return watcher
+
+    watcher = asyncio.run(asyncio.wait_for(scenario(), timeout=10))
+    assert watcher.cancelled()
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+from chromadb.api.models.Collection import Collection
+from langchain_core.documents import Document
+
+from api.services.embedding_cache import embedding_model_id
+from api.services.embedding_providers import HashingEmbeddings
+from api.services.vector_snapshot import activate_version, current_version
+from api.services.vector_store_service import (
+    EMBEDDING_MODEL_KEY, EmbeddingModelMismatchError, VectorStoreService, writer_lock,
+)
+from benchmarks.harness import build_store
+
+DOCUMENTS = [
+    Document(page_content=f"Cocktail: Test {i}", metadata={"name": f"Test {i}"}, id=str(i)) for i in range(5)
+]
+
+
+@pytest.fixture
+def legacy_store(tmp_path):
+    """A collection built before the embedding model was recorded"""
+    persist_directory = os.path.join(tmp_path, "db")
+    build_store(persist_directory, DOCUMENTS, HashingEmbeddings(64))
+    return persist_directory
+
+
+def test_a_legacy_store_adopts_the_model_under_the_writer_lock(legacy_store, monkeypatch):
+    locked = []
+    modify = Collection.modify
+
+    def recording_modify(collection, *args, **kwargs):
+        locked.append(writer_lock(legacy_store).is_locked)
+        return modify(collection, *args, **kwargs)
+
+    monkeypatch.setattr(Collection, "modify", recording_modify)
+    service = VectorStoreService(legacy_store, embedding_function=HashingEmbeddings(64))
+    assert locked == [True]
+    assert service.vector_store._collection.metadata[EMBEDDING_MODEL_KEY] == embedding_model_id(HashingEmbeddings(64))
+
+    # Once recorded, opening the store writes nothing
+    VectorStoreService(legacy_store, embedding_function=HashingEmbeddings(64))
+    assert locked == [True]
+
+
+def test_a_store_built_with_another_model_is_refused(legacy_store):
+    VectorStoreService(legacy_store, embedding_function=HashingEmbeddings(64))
+    with pytest.raises(EmbeddingModelMismatchError):
+        VectorStoreService(legacy_store, embedding_function=HashingEmbeddings(128))
+
+
+@pytest.mark.parametrize("snapshot_max_docs", [0, 2])
+def test_an_unserved_snapshot_is_not_reloaded_on_every_poll(legacy_store, snapshot_max_docs):
+    """Snapshots disabled (0), or the corpus over the limit (5 docs > 2): nothing is served"""
+    service = VectorStoreService(legacy_store, embedding_function=HashingEmbeddings(64),
+                                 snapshot_max_docs=snapshot_max_docs)
+    first = service.export_snapshot()
+    reloads = []
+    service.on_reload(lambda: reloads.append(current_version(service.snapshot_directory)))
+
+    assert service.refresh_snapshot()
+    assert service.snapshot is None
+    for _ in range(3):
+        assert not service.refresh_snapshot()
+    assert reloads == [first]
+
+    # A new version, or a rollback to an old one, is picked up once
+    service.upsert_embedded(["9"], ["Cocktail: Test 9"], [{"name": "Test 9"}],
+                            HashingEmbeddings(64).embed_documents(["Cocktail: Test 9"]))
+    second = service.export_snapshot()
+    assert service.refresh_snapshot() and not service.refresh_snapshot()
+    activate_version(service.snapshot_directory, first)
+    assert service.refresh_snapshot() and not service.refresh_snapshot()
+    assert reloads[-2:] == [second, first]
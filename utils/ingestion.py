@@ -0,0 +1,105 @@
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SOURCE = 'cocktails_dataset'
+
+
+def content_hash(document):
+    """Hash of everything that ends up in the store for a document"""
+    metadata = {key: value for key, value in document.metadata.items() if key != 'content_hash'}
+    payload = json.dumps(
+        {"content": document.page_content, "metadata": metadata},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IncrementalIngestor:
+    """Syncs the cocktail collection with a set of documents, touching only what changed
+
+    Every document carries a stable ID (from the dataset `id` column) and its
+    content hash in metadata. A run compares those against the collection,
+    embeds new or changed rows in fixed-size batches on a small thread pool,
+    upserts them batch by batch and finally deletes rows that disappeared.
+    Each upserted batch is its own checkpoint: an interrupted run simply picks
+    up the rows whose stored hash is still missing or stale.
+    """
+
+    def __init__(self, vector_store_service, batch_size=100, max_workers=4):
+        self.vector_store_service = vector_store_service
+        self.embeddings = vector_store_service.embedding_function
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+
+    def _changed(self, documents, stored, wanted):
+        """Stamp content hashes and return the documents that need an upsert"""
+        to_upsert = []
+        for doc in documents:
+            doc.metadata['content_hash'] = content_hash(doc)
+            wanted.add(doc.id)
+            if stored.get(doc.id) != doc.metadata['content_hash']:
+                to_upsert.append(doc)
+        return to_upsert
+
+    def plan(self, documents):
+        """Return (documents to upsert, IDs to delete) for the given catalog"""
+        stored = self.vector_store_service.get_content_hashes(SOURCE)
+        wanted = set()
+        to_upsert = self._changed(documents, stored, wanted)
+        to_delete = [doc_id for doc_id in stored if doc_id not in wanted]
+        return to_upsert, to_delete
+
+    def _embed_batch(self, batch):
+        return batch, self.embeddings.embed_documents([doc.page_content for doc in batch])
+
+    def ingest(self, documents):
+        return self.ingest_chunks([documents])
+
+    def ingest_chunks(self, chunks):
+        """Sync the collection from an iterable of document lists
+
+        Only the stored IDs and hashes are held for the whole run, so the
+        catalog can be streamed chunk by chunk from the data processor.
+        """
+        start = time.perf_counter()
+        stored = self.vector_store_service.get_content_hashes(SOURCE)
+        wanted = set()
+        total = 0
+        upserted = 0
+
+        # Embedding is network-bound and runs concurrently; writes stay on this thread
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for documents in chunks:
+                total += len(documents)
+                to_upsert = self._changed(documents, stored, wanted)
+                batches = [to_upsert[i:i + self.batch_size] for i in range(0, len(to_upsert), self.batch_size)]
+                for batch, vectors in executor.map(self._embed_batch, batches):
+                    self.vector_store_service.upsert_embedded(
+                        ids=[doc.id for doc in batch],
+                        texts=[doc.page_content for doc in batch],
+                        metadatas=[doc.metadata for doc in batch],
+                        embeddings=vectors,
+                    )
+                    upserted += len(batch)
+                    print(f"Upserted {upserted} documents ({total} read)")
+
+        to_delete = [doc_id for doc_id in stored if doc_id not in wanted]
+        self.vector_store_service.delete_documents(to_delete)
+
+        elapsed = time.perf_counter() - start
+        rate = upserted / elapsed if elapsed > 0 else 0.0
+        print(f"{total - upserted} unchanged, {upserted} upserted, {len(to_delete)} deleted")
+        print(f"Ingested {upserted} documents in {elapsed:.2f}s ({rate:.1f} docs/sec)")
+
+        if upserted or to_delete:
+            self.vector_store_service.reload()
+
+        return {
+            "unchanged": total - upserted,
+            "upserted": upserted,
+            "deleted": len(to_delete),
+            "seconds": elapsed,
+            "docs_per_second": rate,
+        }
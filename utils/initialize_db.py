@@ -1,24 +1,58 @@
 import os
 from decouple import config
 from utils.data_processor import CocktailDataProcessor
-from api.services.vector_store_service import VectorStoreService
 
-# Configure environment variables
-os.environ['OPENAI_API_KEY'] = config('OPENAI_API_KEY')
+from api.services.embedding_cache import CachedEmbeddings
+from api.services.embedding_providers import create_embeddings_from_config
+from api.services.vector_snapshot import VectorSnapshot, current_version
+from api.services.vector_store_service import VectorStoreService, writer_lock
+from utils.ingestion import IncrementalIngestor
+
+# Configure environment variables (local embedding providers need no key)
+if config('EMBEDDING_PROVIDER', default='openai') == 'openai':
+    os.environ['OPENAI_API_KEY'] = config('OPENAI_API_KEY')
 
 def initialize_database():
     """Initialize the vector database with cocktail data"""
     print("Initializing cocktail database...")
 
-    # Process dataset
     data_processor = CocktailDataProcessor()
-    documents = data_processor.process_dataset("data/cocktails.csv")
 
-    print(f"Processed {len(documents)} cocktail documents")
+    # Unchanged rows are served from the embedding cache instead of the API
+    embeddings = CachedEmbeddings(
+        create_embeddings_from_config(),
+        cache_path=config('EMBEDDING_CACHE_PATH', default='.cache/embeddings.sqlite'),
+    )
+
+    # One writer at a time: a concurrent run waits here, before it opens the
+    # store, instead of writing from a stale view of it
+    persist_directory = config('VECTOR_DB_DIR', default='db')
+    with writer_lock(persist_directory):
+        # Sync the vector database: only new or changed rows are embedded and written
+        vector_store = VectorStoreService(persist_directory=persist_directory, embedding_function=embeddings)
+        IncrementalIngestor(
+            vector_store,
+            batch_size=config('INGEST_BATCH_SIZE', default=100, cast=int),
+            max_workers=config('INGEST_MAX_WORKERS', default=4, cast=int),
+        ).ingest_chunks(data_processor.iter_documents(
+            "data/cocktails.csv",
+            chunk_size=config('INGEST_CHUNK_SIZE', default=10000, cast=int),
+        ))
+
+        # API workers memory-map the new version and swap to it on their next poll.
+        # The export also updates the cocktail similarity graph for changed rows.
+        previous = current_version(vector_store.snapshot_directory)
+        version = vector_store.export_snapshot()
+        if version == previous:
+            print(f"Vector snapshot {version} is unchanged")
+        else:
+            graph = VectorSnapshot.load(vector_store.snapshot_directory, version).graph_info
+            print(f"Serving vector snapshot {version}; similarity graph: {graph['neighbors']} neighbors "
+                  f"per cocktail, {graph['recomputed']} rows recomputed")
 
-    # Add to vector database
-    vector_store = VectorStoreService()
-    vector_store.add_documents(documents)
+    stats = embeddings.stats()
+    print(f"Embedding cache: {stats['memory_hits'] + stats['disk_hits']} hits, {stats['misses']} misses")
+    embeddings.close()
 
     print("Database initialization complete!")
 
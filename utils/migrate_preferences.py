@@ -0,0 +1,49 @@
+import os
+from decouple import config
+
+from api.services.embedding_providers import create_embeddings_from_config
+from api.services.preference_store import DEFAULT_USER_ID, PreferenceStore
+from api.services.vector_store_service import VectorStoreService, writer_lock
+
+PREFERENCE_SOURCE = "user_preference"
+
+# Configure environment variables (local embedding providers need no key)
+if config('EMBEDDING_PROVIDER', default='openai') == 'openai':
+    os.environ['OPENAI_API_KEY'] = config('OPENAI_API_KEY')
+
+
+def migrate_preferences():
+    """Move preferences stored as Chroma documents into the preference store"""
+    persist_directory = config('VECTOR_DB_DIR', default='db')
+    # The migration writes the collection; wait for a running ingest to finish first
+    with writer_lock(persist_directory):
+        vector_store = VectorStoreService(
+            persist_directory=persist_directory,
+            embedding_function=create_embeddings_from_config(),
+        )
+        if vector_store.vector_store is None:
+            print("No vector store found, nothing to migrate")
+            return
+
+        results = vector_store.vector_store.get(where={"source": PREFERENCE_SOURCE})
+        if not results['ids']:
+            print("No preference documents found, nothing to migrate")
+            return
+
+        # The old store was global, so everything lands on the default user
+        store = PreferenceStore(config('PREFERENCE_DB_PATH', default='state/preferences.sqlite'))
+        for metadata in results['metadatas']:
+            content_str = metadata.get('content_str', "")
+            items = content_str.split(", ") if content_str else []
+            merged = store.add(DEFAULT_USER_ID, metadata['preference_type'], items)
+            print(f"{metadata['preference_type']}: {len(merged)} items")
+        store.close()
+
+        # Preference documents no longer belong in the cocktail collection
+        vector_store.delete_documents(results['ids'])
+        version = vector_store.export_snapshot()
+        print(f"Migrated {len(results['ids'])} preference documents, serving snapshot {version}")
+
+
+if __name__ == "__main__":
+    migrate_preferences()
@@ -0,0 +1,52 @@
+import argparse
+import os
+
+from decouple import config
+
+from api.services.vector_snapshot import (
+    SNAPSHOT_DIRNAME, VectorSnapshot, activate_version, current_version, list_versions,
+)
+from api.services.vector_store_service import writer_lock
+
+
+def show_versions(directory):
+    current = current_version(directory)
+    for version in list_versions(directory):
+        snapshot = VectorSnapshot.load(directory, version)
+        count = len(snapshot) if snapshot is not None else "invalid"
+        print(f"{'*' if version == current else ' '} {version}  {count} documents")
+
+
+def rollback(directory, persist_directory, version=None):
+    """Make an older snapshot version current; the one before the current by default"""
+    # Taken so a rollback never interleaves with an ingest exporting a new version
+    with writer_lock(persist_directory):
+        versions = list_versions(directory)
+        if version is None:
+            current = current_version(directory)
+            older = versions[:versions.index(current)] if current in versions else []
+            if not older:
+                print("No older snapshot version to roll back to")
+                return
+            version = older[-1]
+        activate_version(directory, version)
+    print(f"Serving snapshot {version}; workers swap to it on their next poll")
+
+
+def main():
+    """List the exported vector snapshot versions, or switch the one workers serve"""
+    persist_directory = config('VECTOR_DB_DIR', default='db')
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("command", choices=["list", "rollback"])
+    parser.add_argument("--to", metavar="VERSION", help="version to roll back (or forward) to")
+    args = parser.parse_args()
+
+    directory = os.path.join(persist_directory, SNAPSHOT_DIRNAME)
+    if args.command == "list":
+        show_versions(directory)
+    else:
+        rollback(directory, persist_directory, args.to)
+
+
+if __name__ == "__main__":
+    main()